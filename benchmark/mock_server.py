@@ -0,0 +1,353 @@
+"""
+本地模拟论坛（Discuz + k_misign签到插件），用于性能测试，不访问真实网站
+
+模拟尚香书苑.py用到的所有接口:
+    /                                   发布页（列出镜像），带fromuid时为推广页
+    member.php?mod=logging&action=login 登录表单 / 提交登录
+    misc.php?mod=seccode                验证码图片 / 检查验证码
+    plugin.php?id=k_misign:sign         签到页 / 签到
+    home.php?mod=spacecp&ac=credit      积分页
+    home.php?mod=space                  个人空间（检查登录状态）
+    /ocr, /ocr0, /ocr1...               dddd_ocr识别接口，多个路径模拟多个OCR服务
+    /__stats                            请求统计（读取后清零）
+
+与真实站点一致，验证码保存在cookie中，登录成功后下发auth cookie；
+可配置响应延迟、5xx错误率和验证码识别错误率，页面可以像真实站点一样gzip压缩并分块传输（不带Content-Length）
+
+单独运行: python benchmark/mock_server.py --port 8443 --cert cert.pem --key key.pem
+"""
+
+import argparse
+import base64
+import gzip
+import json
+import random
+import ssl
+import string
+import threading
+import time
+import urllib.parse
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PAGE_PADDING = 20000 # 页面中token前后填充的字节数，接近真实页面大小
+CAPTCHA_CHARS = "abcdefghjkmnpqrstuvwxyz23456789"
+FORMHASH = "abcd1234"
+SECCODEHASH = "cSAbDg"
+LOGINHASH = "LCpo4"
+
+
+class MockConfig:
+    """
+    模拟服务器配置
+    """
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, captcha_fail_rate=0.0, ocr_latency=0.0, dead_mirrors=0, ocr_candidates=False,
+                 ocr_tail_rate=0.0, ocr_tail_latency=0.0, chunked=False):
+        """
+        :param latency: 论坛页面响应延迟（秒）
+        :param jitter: 延迟随机波动（秒），实际延迟在latency±jitter之间
+        :param error_rate: 论坛页面返回500的概率
+        :param captcha_fail_rate: OCR返回错误结果的概率
+        :param ocr_latency: OCR接口响应延迟（秒）
+        :param dead_mirrors: 发布页中额外列出的不可用镜像数
+        :param ocr_candidates: OCR返回多个读法，识别错误时正确结果排在第二位
+        :param ocr_tail_rate: OCR请求落入长尾的概率
+        :param ocr_tail_latency: 长尾请求的额外延迟（秒）
+        :param chunked: 页面分块传输，客户端支持时gzip压缩
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.captcha_fail_rate = captcha_fail_rate
+        self.ocr_latency = ocr_latency
+        self.dead_mirrors = dead_mirrors
+        self.ocr_candidates = ocr_candidates
+        self.ocr_tail_rate = ocr_tail_rate
+        self.ocr_tail_latency = ocr_tail_latency
+        self.chunked = chunked
+
+
+class MockStats:
+    """
+    请求统计，按接口计数
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = Counter()
+
+    def add(self, key):
+        with self.lock:
+            self.counts[key] += 1
+
+    def snapshot(self, reset=False):
+        """
+        :param reset: 读取后是否清零
+        :return: {接口: 次数}
+        """
+        with self.lock:
+            counts = dict(self.counts)
+            if reset:
+                self.counts.clear()
+        return counts
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # 支持长连接，与真实站点一致
+    padding = "<div>" + "x" * PAGE_PADDING + "</div>"
+
+    def log_message(self, format, *args):
+        pass
+
+    def setup(self):
+        """
+        每个TCP连接调用一次，TLS握手放在处理线程中进行
+        """
+        self.server.stats.add("__connections")
+        if isinstance(self.request, ssl.SSLSocket):
+            self.request.do_handshake()
+        super().setup()
+
+    @property
+    def config(self):
+        return self.server.config
+
+    def read_cookies(self):
+        cookies = {}
+        for item in (self.headers.get("Cookie") or "").split(";"):
+            if "=" in item:
+                key, value = item.strip().split("=", 1)
+                cookies[key] = value
+        return cookies
+
+    def send(self, body, status=200, content_type="text/html; charset=utf-8", cookies=()):
+        """
+        发送响应
+        :param body: 响应内容
+        :param status: 状态码
+        :param content_type: Content-Type
+        :param cookies: Set-Cookie列表
+        """
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        chunked = self.config.chunked and content_type.startswith("text/html")
+        if chunked and "gzip" in (self.headers.get("Accept-Encoding") or ""):
+            body = gzip.compress(body, compresslevel=1)
+            compressed = True
+        else:
+            compressed = False
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        if chunked:
+            self.send_header("Transfer-Encoding", "chunked")
+            if compressed:
+                self.send_header("Content-Encoding", "gzip")
+        else:
+            self.send_header("Content-Length", str(len(body)))
+        for cookie in cookies:
+            self.send_header("Set-Cookie", f"{cookie}; path=/")
+        self.end_headers()
+        if self.command == "HEAD":
+            return
+        if not chunked:
+            self.wfile.write(body)
+            return
+        for start in range(0, len(body), 4096):
+            part = body[start:start + 4096]
+            self.wfile.write(f"{len(part):x}\r\n".encode() + part + b"\r\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def send_page(self, content, cookies=()):
+        self.send(self.padding + content + self.padding, cookies=cookies)
+
+    def send_cdata(self, text, cookies=()):
+        self.send(f'<?xml version="1.0" encoding="utf-8"?><root><![CDATA[{text}]]></root>',
+                  content_type="text/xml; charset=utf-8", cookies=cookies)
+
+    def do_GET(self):
+        self.dispatch()
+
+    def do_HEAD(self):
+        self.dispatch()
+
+    def do_POST(self):
+        self.dispatch()
+
+    def wait(self, latency):
+        if latency > 0 or self.config.jitter > 0:
+            time.sleep(max(0.0, latency + random.uniform(-self.config.jitter, self.config.jitter)))
+
+    def dispatch(self):
+        url = urllib.parse.urlsplit(self.path)
+        query = urllib.parse.parse_qs(url.query, keep_blank_values=True)
+        form = {}
+        if self.command == "POST":
+            body = self.rfile.read(int(self.headers.get("Content-Length") or 0)).decode("utf-8")
+            form = urllib.parse.parse_qs(body, keep_blank_values=True)
+        key = url.path + "?" + "&".join(name for name in ("mod", "action", "id", "operation", "ac", "loginsubmit") if name in query)
+        self.server.stats.add(key)
+
+        if url.path == "/__stats":
+            return self.send(json.dumps(self.server.stats.snapshot(reset=True)), content_type="application/json")
+        if url.path.startswith("/ocr"):
+            tail = self.config.ocr_tail_latency if random.random() < self.config.ocr_tail_rate else 0.0
+            self.wait(self.config.ocr_latency + tail)
+            return self.ocr(form)
+
+        self.wait(self.config.latency)
+        if url.path != "/" and random.random() < self.config.error_rate:
+            return self.send("Internal Server Error", status=500)
+        cookies = self.read_cookies()
+        if url.path == "/":
+            return self.home(query)
+        if url.path == "/member.php":
+            return self.login(query, form, cookies)
+        if url.path == "/misc.php":
+            return self.seccode(query, cookies)
+        if url.path == "/plugin.php":
+            return self.sign(query, cookies)
+        if url.path == "/home.php":
+            return self.space(query, cookies)
+        self.send("Not Found", status=404)
+
+    def home(self, query):
+        if "fromuid" in query:
+            return self.send_page("推广访问")
+        # 发布页可能通过localhost访问，镜像地址始终是127.0.0.1，与发布页使用不同的连接池
+        host = self.server.address
+        links = [f'<a href="https://127.0.0.1:{1 + i}/">备用镜像{i + 1}</a>' for i in range(self.config.dead_mirrors)]
+        links.append(f'<a href="https://{host}/">最新地址</a>')
+        self.send("".join(links))
+
+    def login(self, query, form, cookies):
+        if "loginsubmit" in query:
+            hash_ = form.get("seccodehash", [""])[0]
+            if not form.get("seccodeverify", [""])[0] or form["seccodeverify"][0] != cookies.get(f"seccode{hash_}"):
+                return self.send_cdata("抱歉，验证码填写错误")
+            user = form.get("username", [""])[0]
+            return self.send_cdata(f"欢迎您回来，{user}，现在将转入登录前页面", cookies=[f"auth={urllib.parse.quote(user)}"])
+        sid = cookies.get("sid") or "".join(random.choices(string.ascii_letters, k=8))
+        self.send_page(f'<input type="hidden" name="formhash" value="{FORMHASH}" /><span id="seccode_{SECCODEHASH}"></span>'
+                       f'<div id="main_messaqge_{LOGINHASH}"></div>', cookies=[f"sid={sid}"])
+
+    def seccode(self, query, cookies):
+        hash_ = query.get("idhash", [""])[0]
+        if query.get("action") == ["check"]:
+            ok = query.get("secverify", [""])[0] == cookies.get(f"seccode{hash_}")
+            return self.send_cdata("succeed" if ok else "invalid")
+        code = "".join(random.choices(CAPTCHA_CHARS, k=4))
+        # 图片内容直接写入验证码文字，模拟OCR接口从中读出
+        self.send(f"CAPTCHA:{code}".encode("utf-8"), content_type="image/png", cookies=[f"seccode{hash_}={code}"])
+
+    def sign(self, query, cookies):
+        user = cookies.get("auth")
+        if query.get("operation") == ["qiandao"]:
+            if not user:
+                return self.send_cdata("请先登录后才能继续浏览")
+            if query.get("formhash") != [self.server.formhash]:
+                return self.send_cdata("抱歉，您的请求来路不正确或表单验证串不符，无法提交")
+            with self.server.lock:
+                signed = user in self.server.signed
+                self.server.signed.add(user)
+            return self.send_cdata("今日已签" if signed else "签到成功 获得随机奖励 金钱 3")
+        if not user:
+            return self.send_page("请先登录后才能继续浏览")
+        formhash = self.server.formhash
+        self.send_page(f'<a href="plugin.php?id=k_misign:sign&operation=qiandao&formhash={formhash}">签到</a>'
+                       f'<a href="home.php?mod=space&uid={self.uid(user)}">我的空间</a>'
+                       f'<em>金钱: </em>120 <a href="member.php?mod=logging&action=logout&formhash={formhash}">退出</a>')
+
+    def space(self, query, cookies):
+        user = cookies.get("auth")
+        if not user:
+            return self.send_page("请先登录后才能继续浏览")
+        if query.get("ac") == ["credit"]:
+            return self.send_page(f'<a href="home.php?mod=space&uid={self.uid(user)}">我的空间</a><em>金钱: </em>123 ')
+        self.send_page(f'<a href="member.php?mod=logging&action=logout&formhash={self.server.formhash}">退出</a>')
+
+    def ocr(self, form):
+        try:
+            image = base64.b64decode(form["image"][0]).decode("utf-8")
+            text = image.split(":", 1)[1]
+        except Exception:
+            return self.send(json.dumps({"code": 500, "message": "图片格式错误"}), content_type="application/json")
+        data = text
+        if random.random() < self.config.captcha_fail_rate:
+            data = text[::-1] + "x"
+        if self.config.ocr_candidates:
+            data = [data, text] if data != text else [text]
+        self.send(json.dumps({"code": 200, "data": data}), content_type="application/json")
+
+    @staticmethod
+    def uid(user):
+        return sum(user.encode("utf-8")) % 90000 + 10000
+
+
+class MockServer(ThreadingHTTPServer):
+    """
+    模拟服务器，每个连接一个线程
+    """
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, port=0, config=None, cert=None, key=None):
+        """
+        :param port: 端口，0为随机
+        :param config: MockConfig
+        :param cert: TLS证书文件，为空时使用http
+        :param key: TLS私钥文件
+        """
+        super().__init__(("127.0.0.1", port), MockHandler)
+        self.config = config or MockConfig()
+        self.stats = MockStats()
+        self.lock = threading.Lock()
+        self.signed = set()
+        self.formhash = FORMHASH # 登录后页面中的formhash，签到时校验，修改后旧的formhash失效
+        if cert:
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(cert, key)
+            self.socket = context.wrap_socket(self.socket, server_side=True, do_handshake_on_connect=False)
+
+    @property
+    def address(self):
+        return f"127.0.0.1:{self.server_port}"
+
+    def start(self):
+        """
+        在后台线程中运行
+        """
+        threading.Thread(target=self.serve_forever, name="mock-server", daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模拟论坛")
+    parser.add_argument("--port", type=int, default=8443)
+    parser.add_argument("--cert", required=True, help="TLS证书文件")
+    parser.add_argument("--key", required=True, help="TLS私钥文件")
+    parser.add_argument("--latency", type=float, default=0.0, help="页面响应延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.0, help="延迟随机波动（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="页面返回500的概率")
+    parser.add_argument("--captcha-fail-rate", type=float, default=0.0, help="OCR识别错误的概率")
+    parser.add_argument("--ocr-latency", type=float, default=0.0, help="OCR响应延迟（秒）")
+    parser.add_argument("--dead-mirrors", type=int, default=0, help="发布页中不可用镜像数")
+    parser.add_argument("--ocr-candidates", action="store_true", help="OCR返回多个读法")
+    parser.add_argument("--ocr-tail-rate", type=float, default=0.0, help="OCR请求落入长尾的概率")
+    parser.add_argument("--ocr-tail-latency", type=float, default=0.0, help="长尾OCR请求的额外延迟（秒）")
+    parser.add_argument("--chunked", action="store_true", help="页面gzip压缩并分块传输")
+    args = parser.parse_args()
+    config = MockConfig(args.latency, args.jitter, args.error_rate, args.captcha_fail_rate, args.ocr_latency, args.dead_mirrors,
+                        args.ocr_candidates, args.ocr_tail_rate, args.ocr_tail_latency, args.chunked)
+    server = MockServer(args.port, config, args.cert, args.key)
+    print(f"模拟论坛已启动: https://{server.address}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+"""
+端到端性能测试
+启动本地模拟论坛，用尚香书苑.py完整执行签到流程，统计吞吐量、单账号耗时和请求数
+
+用法:
+    python benchmark/run_benchmark.py                                  # 10/100/1000个账号，同步模式
+    python benchmark/run_benchmark.py --accounts 10,100,1000,10000 --workers 32 --async
+    python benchmark/run_benchmark.py --latency 0.05 --error-rate 0.01 --captcha-fail-rate 0.3
+    python benchmark/run_benchmark.py --captcha-fail-rate 0.5 --ocr-candidates  # 同一张验证码检查多个读法
+    python benchmark/run_benchmark.py --ocr-endpoints 3 --ocr-latency 0.05 --ocr-tail-rate 0.1 --ocr-tail-latency 1  # 多个OCR地址和对冲请求
+    python benchmark/run_benchmark.py --chunked                        # 页面gzip压缩并分块传输，与真实站点一致
+    python benchmark/run_benchmark.py --runs 2 --json result.json      # 第二次运行使用已保存的cookie
+    python benchmark/run_benchmark.py --accounts 50000 --accounts-file  # 从账号文件流式读取
+    python benchmark/run_benchmark.py --accounts 200 --profile profile  # 采样调用栈和内存分配，结果写入profile目录
+
+需要openssl命令生成临时的自签名证书
+"""
+
+import argparse
+import importlib
+import json
+import logging
+import math
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from mock_server import MockConfig, MockServer
+
+
+def make_cert(directory):
+    """
+    生成127.0.0.1和localhost的自签名证书
+    :param directory: 输出目录
+    :return: 证书文件, 私钥文件
+    """
+    cert = os.path.join(directory, "cert.pem")
+    key = os.path.join(directory, "key.pem")
+    subprocess.run([
+        "openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+        "-keyout", key, "-out", cert, "-subj", "/CN=127.0.0.1", "-addext", "subjectAltName=IP:127.0.0.1,DNS:localhost"
+    ], check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return cert, key
+
+
+def percentile(values, percent):
+    """
+    最近秩百分位数
+    :param values: 数值列表
+    :param percent: 百分位（0-100）
+    :return: 百分位数，空列表返回0
+    """
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = max(0, min(len(values) - 1, math.ceil(percent / 100 * len(values)) - 1))
+    return values[index]
+
+
+def build_accounts(count, cookie_ratio):
+    """
+    生成环境变量sxsy的账号列表，部分账号直接使用cookie
+    :param count: 账号数
+    :param cookie_ratio: cookie账号比例
+    :return: 换行分隔的账号字符串
+    """
+    cookie_count = int(count * cookie_ratio)
+    lines = []
+    for i in range(count):
+        if i < cookie_count:
+            lines.append(f"auth=cookie{i}")
+        else:
+            lines.append(f"user{i}@bench.local&password{i}")
+    return "\n".join(lines)
+
+
+def write_accounts_file(path, count, cookie_ratio):
+    """
+    把账号逐行写入jsonl文件，用于测试流式读取
+    :param path: 文件路径
+    :param count: 账号数
+    :param cookie_ratio: cookie账号比例
+    """
+    cookie_count = int(count * cookie_ratio)
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(count):
+            if i < cookie_count:
+                f.write(json.dumps({"cookie": f"auth=cookie{i}"}) + "\n")
+            else:
+                f.write(json.dumps({"email": f"user{i}@bench.local", "password": f"password{i}"}) + "\n")
+
+
+def run_once(module, args, server, count, run_index):
+    """
+    执行一次签到任务并统计
+    :return: 统计结果字典
+    """
+    if args.accounts_file:
+        os.environ.pop("sxsy", None)
+        module.ACCOUNTS_FILE = os.path.abspath("accounts.jsonl")
+        write_accounts_file(module.ACCOUNTS_FILE, count, args.cookie_ratio)
+    else:
+        os.environ["sxsy"] = build_accounts(count, args.cookie_ratio)
+    cls = module.AsyncAutoTask if args.use_async else module.AutoTask
+    task = cls("bench", max_workers=args.workers)
+    server.stats.snapshot(reset=True)
+    start = time.monotonic()
+    results = task.run()
+    wall = time.monotonic() - start
+    task.store.close()
+    server_counts = server.stats.snapshot(reset=True)
+
+    elapsed = [result.elapsed for result in results]
+    statuses = {}
+    for result in results:
+        statuses[result.status] = statuses.get(result.status, 0) + 1
+    server_requests = sum(value for key, value in server_counts.items() if not key.startswith("__"))
+    return {
+        'accounts': count,
+        'run': run_index,
+        'mode': "async" if args.use_async else "sync",
+        'workers': args.workers,
+        'wall': round(wall, 3),
+        'accounts_per_second': round(len(results) / wall, 2) if wall else 0.0,
+        'p50': round(percentile(elapsed, 50), 3),
+        'p99': round(percentile(elapsed, 99), 3),
+        'requests_per_account': round(sum(result.requests for result in results) / max(len(results), 1), 2),
+        'server_requests_per_account': round(server_requests / max(len(results), 1), 2),
+        'connections': server_counts.get("__connections", 0),
+        'statuses': statuses,
+        'endpoints': server_counts,
+    }
+
+
+def print_header():
+    # 表头使用ASCII，中文字符宽度会打乱对齐
+    print(f"{'accounts':>8} {'run':>3} {'wall_s':>8} {'acct/s':>8} {'p50_s':>7} {'p99_s':>7} {'req/acct':>8} {'conns':>6}  status")
+
+
+def print_row(row):
+    statuses = ", ".join(f"{key}: {value}" for key, value in sorted(row['statuses'].items()))
+    print(f"{row['accounts']:>8} {row['run']:>3} {row['wall']:>8.2f} {row['accounts_per_second']:>8.1f} "
+          f"{row['p50']:>7.3f} {row['p99']:>7.3f} {row['requests_per_account']:>8.2f} {row['connections']:>6}  {statuses}", flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="尚香书苑签到脚本性能测试")
+    parser.add_argument("--accounts", default="10,100,1000", help="账号数，逗号分隔")
+    parser.add_argument("--workers", type=int, default=8, help="并发账号数（SXSY_WORKERS）")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="使用异步模式")
+    parser.add_argument("--runs", type=int, default=1, help="每组账号连续运行次数，第二次起使用已保存的cookie")
+    parser.add_argument("--cookie-ratio", type=float, default=0.0, help="直接使用cookie的账号比例")
+    parser.add_argument("--latency", type=float, default=0.0, help="页面响应延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.0, help="延迟随机波动（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="页面返回500的概率")
+    parser.add_argument("--captcha-fail-rate", type=float, default=0.0, help="OCR识别错误的概率")
+    parser.add_argument("--ocr-latency", type=float, default=0.0, help="OCR响应延迟（秒）")
+    parser.add_argument("--dead-mirrors", type=int, default=0, help="发布页中不可用镜像数")
+    parser.add_argument("--ocr-candidates", action="store_true", help="OCR返回多个读法，识别错误时正确结果排在第二位")
+    parser.add_argument("--ocr-tail-rate", type=float, default=0.0, help="OCR请求落入长尾的概率")
+    parser.add_argument("--ocr-tail-latency", type=float, default=0.0, help="长尾OCR请求的额外延迟（秒）")
+    parser.add_argument("--chunked", action="store_true", help="页面gzip压缩并分块传输（不带Content-Length），与真实站点一致")
+    parser.add_argument("--ocr-endpoints", type=int, default=1, help="OCR地址数（DDDD_OCR_URL中逗号分隔的地址）")
+    parser.add_argument("--accounts-file", action="store_true", help="账号写入jsonl文件（SXSY_ACCOUNTS_FILE），不使用环境变量")
+    parser.add_argument("--profile", help="性能分析输出目录（SXSY_PROFILE）")
+    parser.add_argument("--json", help="结果输出到json文件")
+    parser.add_argument("--verbose", action="store_true", help="输出脚本日志")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="sxsy_bench_")
+    cwd = os.getcwd()
+    cert, key = make_cert(work_dir)
+    # 证书需要在导入requests/aiohttp之前配置
+    os.environ["REQUESTS_CA_BUNDLE"] = cert
+    os.environ["SSL_CERT_FILE"] = cert
+    config = MockConfig(args.latency, args.jitter, args.error_rate, args.captcha_fail_rate, args.ocr_latency, args.dead_mirrors,
+                        args.ocr_candidates, args.ocr_tail_rate, args.ocr_tail_latency, args.chunked)
+    server = MockServer(0, config, cert, key).start()
+
+    sys.path.insert(0, ROOT_DIR)
+    module = importlib.import_module("尚香书苑")
+    # 所有地址指向模拟论坛
+    module.DEFAULT_HOST = server.address
+    # 发布页使用localhost，与论坛（127.0.0.1）不是同一个地址前缀，各自使用自己的连接池，与真实站点一致
+    module.PUBLISH_URL = f"https://localhost:{server.server_port}/"
+    if args.ocr_endpoints > 1:
+        module.DDDD_OCR_URL = ",".join(f"https://{server.address}/ocr{i}" for i in range(args.ocr_endpoints))
+    else:
+        module.DDDD_OCR_URL = f"https://{server.address}/ocr"
+    module.OCR_BACKEND = "http"
+    if args.profile:
+        module.PROFILE_DIR = os.path.abspath(args.profile)
+    if args.use_async and module.aiohttp is None:
+        parser.error("异步模式需要安装aiohttp")
+
+    if not args.verbose:
+        logging.disable(logging.WARNING)
+    rows = []
+    print_header()
+    try:
+        for count in [int(value) for value in args.accounts.split(",") if value.strip()]:
+            # 每组账号使用独立目录，cookie和host缓存互不影响
+            count_dir = os.path.join(work_dir, str(count))
+            os.makedirs(count_dir)
+            os.chdir(count_dir)
+            for run_index in range(1, args.runs + 1):
+                row = run_once(module, args, server, count, run_index)
+                rows.append(row)
+                print_row(row)
+    finally:
+        os.chdir(cwd)
+        server.stop()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(rows, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,13 @@
+import importlib
+import os
+import sys
+
+import pytest
+
+# 脚本文件名是中文，不能直接import，把仓库根目录加入搜索路径后按名称导入
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="session")
+def sxsy():
+    return importlib.import_module("尚香书苑")
@@ -0,0 +1,80 @@
+import re
+import urllib.parse
+
+import pytest
+
+TEXT = "\n".join([
+    "# 注释",
+    "",
+    "a@example.com&p&ss=1",
+    "auth=abc; saltkey=def",
+    '{"email": "b@example.com", "password": "pw", "host": "sxsy21.com", "proxy": "http://127.0.0.1:8080"}',
+    "c@example.com&",
+    "no-equals-cookie",
+    '{"email": "d@example.com", "password": "pw", "color": "red"}',
+    '{"cookie": "auth=1", "host": "https://sxsy21.com"}',
+    '{"cookie": "auth=1", "proxy": "127.0.0.1:8080"}',
+    "[1, 2]",
+    "  e@example.com&pw  ",
+])
+
+
+def test_parse(sxsy):
+    source = sxsy.AccountSource("test", text=TEXT)
+    accounts = list(source)
+    assert [(account.line, account.email, account.password, account.cookie) for account in accounts] == [
+        (3, "a@example.com", "p&ss=1", None),
+        (4, None, None, "auth=abc; saltkey=def"),
+        (5, "b@example.com", "pw", None),
+        (12, "e@example.com", "pw", None),
+    ]
+    assert (accounts[2].host, accounts[2].proxy) == ("sxsy21.com", "http://127.0.0.1:8080")
+    assert accounts[1].key == sxsy.account_key(cookie="auth=abc; saltkey=def")
+    assert [number for number, _ in source.skipped] == [6, 7, 8, 9, 10, 11]
+
+
+def test_skipped_lines_do_not_log_content(sxsy, caplog):
+    list(sxsy.AccountSource("test", text="secret-password-line"))
+    assert "secret-password-line" not in caplog.text
+
+
+def test_file(sxsy, tmp_path):
+    path = tmp_path / "accounts.txt"
+    path.write_text("\ufeffa@example.com&pw\n\n#b@example.com&pw\nauth=1\n", encoding="utf-8")
+    source = sxsy.AccountSource("file", path=str(path))
+    assert [(account.line, account.key) for account in source] == [(1, "a@example.com"), (4, sxsy.account_key(cookie="auth=1"))]
+    # 账号文件不为预估账号数再读一遍
+    assert source.count() is None
+
+
+def test_count_text(sxsy):
+    assert sxsy.AccountSource("test", text=TEXT).count() == 10
+
+
+def test_login_form_fields_encoded_individually(sxsy):
+    profile = sxsy.SiteProfile("尚香书苑")
+    password = "p&ss=1+ %#中文"
+    form = profile.login_form("a+b@example.com", password, "ab12CD34", "x7Kq", "cSAbc", "https://sxsy21.com/./")
+    fields = urllib.parse.parse_qs(form, keep_blank_values=True)
+    assert fields['password'] == [password]
+    assert fields['username'] == ["a+b@example.com"]
+    assert fields['seccodeverify'] == ["x7Kq"]
+    assert fields['loginfield'] == ["email"]
+    assert fields['answer'] == [""]
+    assert fields['cookietime'] == [str(sxsy.COOKIE_TIME)]
+    assert not re.search(r"[^A-Za-z0-9%._\-+=&*]", form)
+
+
+def test_login_form_login_field(sxsy):
+    profile = sxsy.SiteProfile("其他论坛", default_host="example.com", login_field="username")
+    form = profile.login_form("name", "pw", "ab12CD34", "x7Kq", "cSAbc", "/")
+    assert urllib.parse.parse_qs(form)['loginfield'] == ["username"]
+
+
+def test_failed_job_result_uses_account_key(sxsy):
+    # 环境变量账号任务的第一个参数是序号，出错时的结果使用账号标识，签到记录和分片合并才能对应到账号
+    account = next(iter(sxsy.AccountSource("test", text="a@example.com&pw")))
+    result = sxsy.AutoTask.job_result((1, "sxsy21.com", account), "env")
+    assert (result.account, result.source) == ("a@example.com", "env")
+    result = sxsy.AutoTask.job_result(("b@example.com", {'cookies': "auth=1"}, "sxsy21.com"), "cookie_store")
+    assert (result.account, result.source) == ("b@example.com", "cookie_store")
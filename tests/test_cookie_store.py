@@ -0,0 +1,259 @@
+import json
+import sqlite3
+import time
+
+import pytest
+
+SITE = "尚香书苑"
+
+
+@pytest.fixture
+def open_store(sxsy, tmp_path):
+    stores = []
+
+    def open_store(name="cookie.db", site=SITE):
+        store = sxsy.CookieStore(str(tmp_path / name), site)
+        stores.append(store)
+        return store
+
+    yield open_store
+    for store in stores:
+        store.close()
+
+
+def create_old_database(path):
+    # V1.9的表结构：没有proxy、issued_at、formhash、uid、money、money_at列，也没有签到记录表
+    conn = sqlite3.connect(path)
+    conn.execute("""
+        CREATE TABLE sessions (
+            site TEXT NOT NULL,
+            account TEXT NOT NULL,
+            cookies TEXT NOT NULL,
+            host TEXT,
+            valid INTEGER NOT NULL DEFAULT 1,
+            expires_at REAL,
+            updated_at REAL NOT NULL,
+            update_time TEXT,
+            PRIMARY KEY (site, account)
+        )
+    """)
+    conn.execute("INSERT INTO sessions (site, account, cookies, host, updated_at) VALUES (?, 'old@example.com', 'auth=old', 'sxsy21.com', ?)",
+                 (SITE, time.time() - 3600))
+    conn.commit()
+    conn.close()
+
+
+class TestSessions:
+    def test_upsert_and_get(self, open_store):
+        store = open_store()
+        store.upsert("a@example.com", "auth=1", "sxsy21.com")
+        data = store.get("a@example.com")
+        assert (data['cookies'], data['host'], data['valid']) == ("auth=1", "sxsy21.com", 1)
+        store.upsert("a@example.com", "auth=2")
+        assert store.get("a@example.com")['cookies'] == "auth=2"
+        assert store.count() == 1
+
+    def test_invalid_and_expired_are_skipped(self, open_store):
+        store = open_store()
+        store.upsert("a@example.com", "auth=1")
+        store.upsert("b@example.com", "auth=2", expires_at=time.time() - 1)
+        store.upsert("c@example.com", "auth=3", expires_at=time.time() + 3600)
+        store.invalidate("a@example.com")
+        assert store.get("a@example.com") is None
+        assert store.get("b@example.com") is None
+        assert [account for account, _ in store.accounts()] == ["c@example.com"]
+        assert store.count() == 1
+        # 重新登录后恢复有效，顺序不变
+        store.upsert("a@example.com", "auth=4")
+        assert [account for account, _ in store.accounts()] == ["a@example.com", "c@example.com"]
+
+    def test_sites_are_separate(self, open_store):
+        open_store().upsert("a@example.com", "auth=1")
+        assert open_store(site="其他论坛").get("a@example.com") is None
+
+    def test_for_site(self, open_store):
+        store = open_store()
+        store.for_site("其他论坛").upsert("a@example.com", "auth=other")
+        assert store.get("a@example.com") is None
+        assert store.for_site("其他论坛").get("a@example.com")['cookies'] == "auth=other"
+        assert store.site_name == SITE
+
+    def test_proxy(self, open_store):
+        store = open_store()
+        store.upsert("a@example.com", "auth=1", proxy="http://127.0.0.1:8080")
+        assert store.get("a@example.com")['proxy'] == "http://127.0.0.1:8080"
+        store.upsert("a@example.com", "auth=1")
+        assert store.get("a@example.com")['proxy'] is None
+
+    def test_issued_at_kept_for_same_cookie(self, open_store):
+        store = open_store()
+        store.upsert("a@example.com", "auth=1")
+        store.conn.execute("UPDATE sessions SET issued_at = 1")
+        store.upsert("a@example.com", "auth=1")
+        assert store.get("a@example.com")['issued_at'] == 1
+        store.upsert("a@example.com", "auth=2")
+        assert store.get("a@example.com")['issued_at'] > 1
+
+    def test_due_for_refresh(self, open_store):
+        store = open_store()
+        now = time.time()
+        store.upsert("a@example.com", "auth=1", expires_at=now + 3600)
+        store.upsert("b@example.com", "auth=2", expires_at=now + 10 * 86400)
+        # 直接使用的cookie有效期未知，不提前登录
+        store.upsert("c@example.com", "auth=3")
+        store.upsert("d@example.com", "auth=4", expires_at=now + 10 * 86400)
+        store.invalidate("d@example.com")
+        assert set(store.due_for_refresh(86400)) == {"a@example.com", "d@example.com"}
+
+
+class TestMigration:
+    def test_old_schema_gets_new_columns(self, tmp_path, open_store):
+        create_old_database(str(tmp_path / "cookie.db"))
+        store = open_store()
+        columns = {row[1] for row in store.conn.execute("PRAGMA table_info(sessions)")}
+        assert {'proxy', 'issued_at', 'formhash', 'uid', 'money', 'money_at'} <= columns
+        tables = {row[0] for row in store.conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        assert {'sign_ledger', 'ocr_cache'} <= tables
+
+        data = store.get("old@example.com")
+        # 旧版保存的host是自动获取的镜像，不沿用
+        assert (data['cookies'], data['host'], data['proxy']) == ("auth=old", None, None)
+        store.save_sign_state("old@example.com", "ab12CD34", "42", "100")
+        data = store.get("old@example.com")
+        assert (data['formhash'], data['uid'], data['money']) == ("ab12CD34", "42", "100")
+        assert data['money_at'] is not None
+
+    def test_reopen_is_idempotent(self, open_store):
+        open_store().upsert("a@example.com", "auth=1", "sxsy21.com")
+        data = open_store().get("a@example.com")
+        assert (data['cookies'], data['host']) == ("auth=1", "sxsy21.com")
+
+    def test_migrate_json(self, tmp_path, open_store):
+        store = open_store()
+        store.upsert("a@example.com", "auth=new")
+        json_file = tmp_path / "cookie.json"
+        json_file.write_text(json.dumps({'host': "sxsy21.com", 'accounts': {
+            "a@example.com": {'cookies': "auth=old", 'update_time': "2025-08-27 09:10:00"},
+            "b@example.com": {'cookies': "auth=b", 'update_time': "2025-08-27 09:10:00"},
+        }}), encoding="utf-8")
+        store.migrate_json(str(json_file))
+        # 已存在的账号不被覆盖
+        assert store.get("a@example.com")['cookies'] == "auth=new"
+        assert (store.get("b@example.com")['cookies'], store.get("b@example.com")['host']) == ("auth=b", None)
+        assert not json_file.exists()
+        assert (tmp_path / "cookie.json.migrated").exists()
+        # 文件已迁移，再次调用不做任何事
+        store.migrate_json(str(json_file))
+        assert store.count() == 2
+
+
+class TestSignLedger:
+    def test_signed_on(self, open_store):
+        store = open_store()
+        store.record_sign("a@example.com", "2026-10-17", "signed", "获得金钱 5", "105")
+        store.record_sign("b@example.com", "2026-10-17", "failed")
+        store.record_sign("c@example.com", "2026-10-16", "already_signed")
+        assert store.signed_on("2026-10-17") == {"a@example.com": {'status': "signed", 'reward': "获得金钱 5", 'money': "105"}}
+
+    def test_latest_result_kept(self, open_store):
+        store = open_store()
+        store.record_sign("a@example.com", "2026-10-16", "signed", None, "100")
+        store.record_sign("a@example.com", "2026-10-17", "failed")
+        assert store.signed_on("2026-10-17") == {}
+        store.record_sign("a@example.com", "2026-10-17", "already_signed")
+        # 没有读到金钱时保留上次的
+        assert store.signed_on("2026-10-17")["a@example.com"]['money'] == "100"
+
+
+class TestSignState:
+    def test_money_kept_when_not_read(self, open_store):
+        store = open_store()
+        store.upsert("a@example.com", "auth=1")
+        store.save_sign_state("a@example.com", "ab12CD34", "42", "100")
+        money_at = store.get("a@example.com")['money_at']
+        store.save_sign_state("a@example.com", "ef56GH78")
+        data = store.get("a@example.com")
+        assert (data['formhash'], data['uid'], data['money'], data['money_at']) == ("ef56GH78", "42", "100", money_at)
+
+    def test_new_cookie_clears_formhash(self, open_store):
+        store = open_store()
+        store.upsert("a@example.com", "auth=1")
+        store.save_sign_state("a@example.com", "ab12CD34")
+        store.upsert("a@example.com", "auth=1")
+        assert store.get("a@example.com")['formhash'] == "ab12CD34"
+        store.upsert("a@example.com", "auth=2")
+        assert store.get("a@example.com")['formhash'] is None
+
+
+class TestMerge:
+    def test_newer_record_wins(self, open_store):
+        main = open_store("main.db")
+        shard = open_store("shard.db")
+        main.upsert("a@example.com", "auth=main")
+        main.upsert("c@example.com", "auth=main")
+        shard.upsert("a@example.com", "auth=shard")
+        shard.save_sign_state("a@example.com", "ab12CD34", "42", "100")
+        shard.upsert("b@example.com", "auth=shard")
+        shard.record_sign("b@example.com", "2026-10-17", "signed", "5", "105")
+        shard.upsert("c@example.com", "auth=shard")
+        # a在分片中更新较晚，c在主数据库中更新较晚
+        shard.conn.execute("UPDATE sessions SET updated_at = updated_at + 60 WHERE account = 'a@example.com'")
+        shard.conn.execute("UPDATE sessions SET updated_at = 0 WHERE account = 'c@example.com'")
+
+        assert main.merge_from(shard.path) == 2
+        data = main.get("a@example.com")
+        assert (data['cookies'], data['formhash'], data['uid'], data['money']) == ("auth=shard", "ab12CD34", "42", "100")
+        assert data['money_at'] is not None
+        assert main.get("b@example.com")['cookies'] == "auth=shard"
+        assert main.get("c@example.com")['cookies'] == "auth=main"
+        assert main.signed_on("2026-10-17") == {"b@example.com": {'status': "signed", 'reward': "5", 'money': "105"}}
+
+    def test_all_sites_merged(self, open_store):
+        main = open_store("main.db")
+        shard = open_store("shard.db")
+        shard.for_site("其他论坛").upsert("a@example.com", "auth=other")
+        main.merge_from(shard.path)
+        assert main.get("a@example.com") is None
+        assert main.for_site("其他论坛").get("a@example.com")['cookies'] == "auth=other"
+
+    def test_shard_without_ledger(self, open_store):
+        main = open_store("main.db")
+        shard = open_store("shard.db")
+        shard.upsert("a@example.com", "auth=shard")
+        # 增加签到记录之前的版本产生的分片数据库
+        shard.conn.execute("DROP TABLE sign_ledger")
+        assert main.merge_from(shard.path) == 1
+        assert main.get("a@example.com")['cookies'] == "auth=shard"
+
+    def test_old_shard_host_dropped(self, tmp_path, open_store):
+        create_old_database(str(tmp_path / "shard.db"))
+        # 旧版分片数据库补齐列但保留旧的user_version，host仍是自动获取的镜像
+        columns = ("proxy TEXT", "issued_at REAL", "formhash TEXT", "uid TEXT", "money TEXT", "money_at REAL")
+        conn = sqlite3.connect(str(tmp_path / "shard.db"))
+        for column in columns:
+            conn.execute(f"ALTER TABLE sessions ADD COLUMN {column}")
+        conn.commit()
+        conn.close()
+        main = open_store("main.db")
+        assert main.merge_from(str(tmp_path / "shard.db")) == 1
+        data = main.get("old@example.com")
+        assert (data['cookies'], data['host']) == ("auth=old", None)
+
+    def test_shard_without_money_at(self, tmp_path, open_store):
+        # 增加money_at列之前的版本产生的分片数据库
+        conn = sqlite3.connect(str(tmp_path / "shard.db"))
+        conn.execute("""
+            CREATE TABLE sessions (
+                site TEXT NOT NULL, account TEXT NOT NULL, cookies TEXT NOT NULL, host TEXT, valid INTEGER NOT NULL DEFAULT 1,
+                expires_at REAL, updated_at REAL NOT NULL, update_time TEXT, proxy TEXT, issued_at REAL,
+                formhash TEXT, uid TEXT, money TEXT, PRIMARY KEY (site, account)
+            )
+        """)
+        conn.execute("INSERT INTO sessions (site, account, cookies, updated_at, formhash, money) VALUES (?, 'a@example.com', 'auth=1', ?, 'ab12CD34', '100')",
+                     (SITE, time.time()))
+        conn.commit()
+        conn.close()
+        main = open_store("main.db")
+        assert main.merge_from(str(tmp_path / "shard.db")) == 1
+        data = main.get("a@example.com")
+        assert (data['cookies'], data['formhash'], data['money'], data['money_at']) == ("auth=1", "ab12CD34", "100", None)
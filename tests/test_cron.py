@@ -0,0 +1,45 @@
+from datetime import datetime
+
+import pytest
+
+
+def test_next_after(sxsy):
+    cron = sxsy.CronSchedule("10 9,10 * * *")
+    assert cron.next_after(datetime(2026, 10, 17, 8, 0)) == datetime(2026, 10, 17, 9, 10)
+    assert cron.next_after(datetime(2026, 10, 17, 9, 10, 30)) == datetime(2026, 10, 17, 10, 10)
+    assert cron.next_after(datetime(2026, 10, 17, 10, 10)) == datetime(2026, 10, 18, 9, 10)
+
+
+def test_steps_and_ranges(sxsy):
+    assert sxsy.CronSchedule.parse_field("*/15", 0, 59) == {0, 15, 30, 45}
+    assert sxsy.CronSchedule.parse_field("5/20", 0, 59) == {5, 25, 45}
+    assert sxsy.CronSchedule.parse_field("1-5,9", 0, 23) == {1, 2, 3, 4, 5, 9}
+
+
+def test_month_rollover(sxsy):
+    cron = sxsy.CronSchedule("0 0 1 * *")
+    assert cron.next_after(datetime(2026, 12, 31, 23, 59)) == datetime(2027, 1, 1, 0, 0)
+
+
+@pytest.mark.parametrize("expression", ["0 8 * * 0", "0 8 * * 7"])
+def test_sunday_is_0_or_7(sxsy, expression):
+    # 2026-10-18 是周日
+    assert sxsy.CronSchedule(expression).next_after(datetime(2026, 10, 17, 12, 0)) == datetime(2026, 10, 18, 8, 0)
+
+
+def test_day_or_weekday(sxsy):
+    # 日和周都有限制时满足其一即可：13号或周五
+    cron = sxsy.CronSchedule("0 0 13 * 5")
+    assert cron.next_after(datetime(2026, 10, 17, 0, 0)) == datetime(2026, 10, 23, 0, 0)
+    assert cron.next_after(datetime(2026, 11, 12, 0, 0)) == datetime(2026, 11, 13, 0, 0)
+
+
+@pytest.mark.parametrize("expression", ["* * * *", "60 * * * *", "* 24 * * *", "5-1 * * * *", "*/0 * * * *", "a * * * *"])
+def test_invalid(sxsy, expression):
+    with pytest.raises(ValueError):
+        sxsy.CronSchedule(expression)
+
+
+def test_never(sxsy):
+    with pytest.raises(ValueError):
+        sxsy.CronSchedule("0 0 31 2 *").next_after(datetime(2026, 10, 17))
@@ -0,0 +1,34 @@
+from types import SimpleNamespace
+
+import pytest
+import requests
+
+
+class FakeSession:
+    def __init__(self, status=200, error=None):
+        self.status = status
+        self.error = error
+        self.calls = []
+
+    def get(self, url, **kwargs):
+        self.calls.append((url, kwargs))
+        if self.error is not None:
+            raise self.error
+        return SimpleNamespace(status_code=self.status, close=lambda: None)
+
+
+def test_probe_requests_the_host_itself(sxsy):
+    session = FakeSession()
+    # 任务上没有request、breaker等属性，探测经过故障转移或熔断时会出错
+    task = SimpleNamespace(anon_session=session)
+    assert sxsy.AutoTask.probe_host(task, "dead.example") is not None
+    [(url, kwargs)] = session.calls
+    assert url == "https://dead.example/"
+    assert kwargs['timeout'] == sxsy.HOST_PROBE_TIMEOUT
+    assert kwargs['headers']['Host'] == "dead.example"
+
+
+@pytest.mark.parametrize("session", [FakeSession(status=503), FakeSession(error=requests.ConnectionError("refused")),
+                                     FakeSession(error=requests.Timeout("timed out"))])
+def test_probe_unavailable(sxsy, session):
+    assert sxsy.AutoTask.probe_host(SimpleNamespace(anon_session=session), "dead.example") is None
@@ -0,0 +1,27 @@
+import hashlib
+
+import pytest
+
+
+def test_stable(sxsy):
+    # 不同进程和机器上结果必须一致，不能依赖hash()
+    expected = int(hashlib.sha1(b"a@example.com").hexdigest()[:8], 16) % 4
+    assert sxsy.shard_of("a@example.com", 4) == expected == 1
+
+
+def test_spread(sxsy):
+    shards = [sxsy.shard_of(f"user{i}@example.com", 4) for i in range(1000)]
+    # 哈希分配大致均匀
+    assert all(150 < shards.count(index) < 350 for index in range(4))
+
+
+def test_parse_shard(sxsy):
+    assert sxsy.parse_shard("") == (0, 1)
+    assert sxsy.parse_shard("2/4") == (2, 4)
+    assert sxsy.parse_shard(" 0 / 1 ") == (0, 1)
+
+
+@pytest.mark.parametrize("value", ["4/4", "-1/4", "1", "a/b", "0/0"])
+def test_parse_shard_invalid(sxsy, value):
+    with pytest.raises(ValueError):
+        sxsy.parse_shard(value)
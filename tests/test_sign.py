@@ -0,0 +1,52 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+
+@pytest.fixture
+def task(sxsy):
+    return SimpleNamespace(profile=sxsy.SiteProfile("尚香书苑"))
+
+
+def test_money_after_reward(sxsy, task):
+    assert sxsy.AutoTask.money_after_sign(task, "100", "签到成功，获得随机奖励 金钱 5") == "105"
+
+
+def test_money_after_already_signed(sxsy, task):
+    assert sxsy.AutoTask.money_after_sign(task, "100", "今日已签到") == "100"
+
+
+@pytest.mark.parametrize("money, text", [(None, "获得金钱 5"), ("100", None), ("100", "签到失败")])
+def test_money_unknown(sxsy, task, money, text):
+    assert sxsy.AutoTask.money_after_sign(task, money, text) is None
+
+
+def test_site_patterns(sxsy):
+    task = SimpleNamespace(profile=sxsy.SiteProfile("其他论坛", default_host="example.com",
+                                                    patterns={'sign_reward': r"积分\+(\d+)", 'already_signed': r"明天再来"}))
+    assert sxsy.AutoTask.money_after_sign(task, "100", "签到成功 积分+3") == "103"
+    assert sxsy.AutoTask.money_after_sign(task, "100", "明天再来") == "100"
+    assert sxsy.AutoTask.money_after_sign(task, "100", "今日已签到") is None
+
+
+@pytest.mark.parametrize("text, state", [("签到成功，获得随机奖励 金钱 5", None), ("今日已签到", None),
+                                         ("请先登录后才能继续浏览", "cookie_expired"), ("表单验证串不符，请返回", "stale"), (None, "stale")])
+def test_check_cached_sign(sxsy, task, text, state):
+    assert sxsy.AutoTask.check_cached_sign(task, text) == state
+
+
+def test_cached_sign_state(sxsy, task, monkeypatch):
+    cached = {'formhash': "ab12CD34", 'uid': "42", 'money': "100", 'money_at': time.time()}
+    page = sxsy.AutoTask.cached_sign_state(task, cached)
+    # 直接签到时不用保存的金钱推算
+    assert page == {'formhash': "ab12CD34", 'uid': "42", 'money': None, 'money_due': False}
+    monkeypatch.setattr(sxsy, "MONEY_REFRESH_DAYS", 7)
+    cached['money_at'] = time.time() - 8 * 86400
+    assert sxsy.AutoTask.cached_sign_state(task, cached)['money_due']
+    cached['money_at'] = None
+    assert sxsy.AutoTask.cached_sign_state(task, cached)['money_due']
+    assert sxsy.AutoTask.cached_sign_state(task, None) is None
+    assert sxsy.AutoTask.cached_sign_state(task, dict(cached, formhash=None)) is None
+    monkeypatch.setattr(sxsy, "FORMHASH_CACHE", False)
+    assert sxsy.AutoTask.cached_sign_state(task, cached) is None
@@ -0,0 +1,53 @@
+import pytest
+
+
+def feed_chunks(scanner, text, size):
+    for start in range(0, len(text), size):
+        if scanner.feed(text[start:start + size]):
+            return True
+    return scanner.feed("", final=True)
+
+
+PAGE = ('<html>' + 'x' * 1000 + '<input type="hidden" name="formhash" value="ab12CD34" />'
+        + 'y' * 700 + '<a href="home.php?mod=space&uid=123456">空间</a>' + 'z' * 300 + '</html>')
+
+
+@pytest.mark.parametrize("size", [1, 7, 64, 65, 100, 512, 4096])
+def test_tokens_split_across_chunks(sxsy, size):
+    scanner = sxsy.TokenScanner({'formhash': sxsy.FORMHASH_PATTERN, 'uid': sxsy.UID_PATTERN})
+    assert feed_chunks(scanner, PAGE, size)
+    assert scanner.found == {'formhash': "ab12CD34", 'uid': "123456"}
+
+
+def test_truncated_match_waits_for_next_chunk(sxsy):
+    scanner = sxsy.TokenScanner({'uid': sxsy.UID_PATTERN})
+    # uid=12 位于块末尾，可能还没读完，不能当作结果
+    assert not scanner.feed("a" * 200 + "uid=12")
+    assert scanner.feed("3456&b", final=True)
+    assert scanner.found == {'uid': "123456"}
+
+
+def test_match_at_end_of_last_chunk(sxsy):
+    scanner = sxsy.TokenScanner({'uid': sxsy.UID_PATTERN})
+    assert not scanner.feed("uid=42")
+    assert scanner.feed("", final=True)
+    assert scanner.found == {'uid': "42"}
+
+
+def test_stop_any(sxsy):
+    scanner = sxsy.TokenScanner({'formhash': sxsy.FORMHASH_PATTERN, 'uid': sxsy.UID_PATTERN}, stop_any=True)
+    assert scanner.feed("uid=42" + " " * sxsy.STREAM_GUARD)
+    assert scanner.found == {'uid': "42"}
+
+
+def test_stop_on(sxsy):
+    patterns = {'formhash': sxsy.FORMHASH_PATTERN, 'login_required': sxsy.LOGIN_REQUIRED_PATTERN}
+    scanner = sxsy.TokenScanner(patterns, stop_on=('login_required',))
+    assert not scanner.feed('name="formhash" value="ab12CD34"' + " " * sxsy.STREAM_GUARD)
+    assert scanner.feed("请先登录后才能继续浏览" + " " * sxsy.STREAM_GUARD)
+
+
+def test_not_found(sxsy):
+    scanner = sxsy.TokenScanner({'uid': sxsy.UID_PATTERN})
+    assert not feed_chunks(scanner, "nothing here" * 100, 50)
+    assert scanner.found == {}
@@ -16,199 +16,4631 @@ cron: 10 9,10 * * *
 2025/6/17   V1.2    增加cookie存储功能
 2025/7/28   V1.3    修改头部注释，以便拉库
 2025/8/27   V1.4    修改默认域名
+2026/10/17  V1.5    多账号并发执行，按账号汇总结果
+2026/10/17  V1.6    增加异步模式（aiohttp），单进程单事件循环执行大量账号
+2026/10/17  V1.7    所有请求共用连接池，复用TCP/TLS连接
+2026/10/17  V1.8    host缓存，并发探测镜像按延迟排序，连接失败自动切换镜像
+2026/10/17  V1.9    cookie改为SQLite存储，按账号原子更新、记录过期时间，自动迁移旧json文件
+2026/10/17  V2.0    验证码流水线：检查时预取下一张，可并发竞速多张，重试间隔自适应
+2026/10/17  V2.1    验证码识别后端可选：远程dddd_ocr服务或进程内ddddocr，支持批量识别
+2026/10/17  V2.2    页面token流式提取，一次扫描取出所有token后提前结束读取
+2026/10/17  V2.3    签到流程按页面内容规划请求，签到页同时用于检查登录状态，统计每个账号的请求次数
+2026/10/17  V2.4    所有请求设置连接/读取超时，账号和整次运行有截止时间，按主机熔断，服务不可用时剩余账号快速失败
+2026/10/17  V2.5    增加本地模拟论坛和端到端性能测试（benchmark目录）；修复验证码图片请求失败时仍送去识别、异步预取取消时候选会话未关闭
+2026/10/17  V2.6    统计各阶段耗时、请求数、重试数和响应字节数，运行结束后输出json或Prometheus文本格式的指标
+2026/10/17  V2.7    支持按账号哈希分片运行（进程或Actions矩阵作业），merge命令合并各分片的cookie和指标
+2026/10/17  V2.8    按目标（论坛、发布页、OCR服务）限制每秒请求数和同时请求数（令牌桶），账号开始时间可分散到时间窗口内
+2026/10/17  V2.9    账号支持从文件读取（每行一个账号，可用json指定单个账号的域名和代理），逐行校验、跳过格式错误的行，边读边执行；修复密码包含&时解析失败
+2026/10/17  V3.0    签到记录：记录每个账号的签到日期、结果和金钱，当天再次运行时跳过已签到的账号，不发送任何请求；环境变量中上次失败的账号每次运行都会重试
+2026/10/17  V3.1    记录会话签发和过期时间（按auth cookie的实际有效期），增加refresh模式提前重新登录即将过期的账号
+2026/10/17  V3.2    增加常驻模式（daemon），按cron表达式定时签到和刷新，运行之间保留连接池、Cookie存储和OCR后端，提供本机状态接口
+2026/10/17  V3.3    验证码识别结果按图片内容缓存，每张验证码依次检查多个候选读法（OCR服务返回的列表、本地模型的次优字符、易混淆字符），减少重新获取验证码
+2026/10/17  V3.4    站点配置（发布页、接口路径、提取正则、成功标志），SXSY_SITES_FILE中的Discuz站点与尚香书苑在一次运行中同时签到，共用连接池、OCR、限速和Cookie存储
+2026/10/17  V3.5    验证码识别前可选预处理（numpy二值化、去干扰线和噪点、裁剪），多个账号的图片在进程池中一起处理
+2026/10/17  V3.6    日志改为队列输出，格式化和写入在后台线程进行；并发执行时每个账号的日志整块输出；可选json lines日志（账号、阶段、耗时）
+2026/10/17  V3.7    签到formhash、uid和金钱随会话保存，已保存Cookie的账号直接签到，不再获取签到页，formhash失效时才重新获取
+2026/10/17  V3.8    DDDD_OCR_URL支持多个地址，按延迟和进行中的请求数分配，慢于p90的识别请求对冲到另一个地址，先返回的结果胜出
+2026/10/17  V3.9    可选性能分析（SXSY_PROFILE），按账号和阶段采样调用栈、跟踪内存分配，输出折叠栈、内存快照和汇总
 """
 
 DEFAULT_HOST = "sxsy21.com" # 默认域名
 
 import requests
 import os
+import sys
+import argparse
 import re
 import urllib.parse
 import logging
-import traceback
+import logging.handlers
+import atexit
 import base64
 import random
 import time
 import json
-from datetime import datetime
+import codecs
+import itertools
+import sqlite3
+import hashlib
+import io
+import math
+import multiprocessing
+import threading
+import asyncio
+import queue
+import weakref
+import contextvars
+import contextlib
+import copy
+import dis
+import inspect
+import http.cookiejar
+import signal
+import tracemalloc
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from requests.adapters import HTTPAdapter
+
+try:
+    import aiohttp # 异步模式依赖，可选
+except ImportError:
+    aiohttp = None
+
+try:
+    import ddddocr # 本地验证码识别，可选
+except ImportError:
+    ddddocr = None
+
+try:
+    import numpy # 验证码预处理依赖，可选
+    from PIL import Image
+except ImportError:
+    numpy = None
+    Image = None
+
+DDDD_OCR_URL = os.getenv("DDDD_OCR_URL") or "" # dddd_ocr地址，多个用逗号或换行分隔
+OCR_BACKEND = os.getenv("SXSY_OCR_BACKEND") or "" # 验证码识别后端 http/local，默认有DDDD_OCR_URL时用http
+OCR_BATCH_SIZE = int(os.getenv("SXSY_OCR_BATCH") or 0) # 大于1时合并多个账号的识别请求批量识别
+OCR_BATCH_WAIT = 0.02 # 凑批最长等待时间（秒）
+OCR_CACHE_SIZE = int(os.getenv("SXSY_OCR_CACHE") or 1000) # 按图片哈希缓存的识别结果数，0为不缓存
+OCR_TOP_K = max(1, int(os.getenv("SXSY_OCR_TOPK") or 3)) # 每张验证码最多检查的候选读法数
+OCR_HEDGE = os.getenv("SXSY_OCR_HEDGE") != "0" # 有多个OCR地址时，慢于该地址p90延迟的请求再发给另一个地址，先返回的胜出
+OCR_HEDGE_DELAY = 1.0 # 地址的延迟样本不足时，等待多久后发出对冲请求（秒）
+OCR_HEDGE_SAMPLES = 10 # 按p90决定对冲时间至少需要的延迟样本数
+OCR_LATENCY_WINDOW = 200 # 每个OCR地址保留的最近延迟样本数
+# OCR容易混淆的字符，识别结果只有一个时按此生成备选读法
+OCR_CONFUSIONS = {'0': 'o', 'o': '0', '1': 'l', 'l': '1', 'i': 'l', '5': 's', 's': '5', '2': 'z', 'z': '2',
+                  '8': 'b', 'b': '8', '9': 'g', 'g': '9', '6': 'b', 'q': 'g', 'u': 'v', 'v': 'u'}
+CAPTCHA_PREPROCESS = os.getenv("SXSY_PREPROCESS") == "1" # 识别前对验证码二值化、去干扰线、裁剪（需要安装numpy和Pillow）
+PREPROCESS_WORKERS = int(os.getenv("SXSY_PREPROCESS_WORKERS") or 2) # 预处理进程数，0为在当前进程处理
+PREPROCESS_MARGIN = 2 # 裁剪时字符区域四周保留的像素
+MAX_WORKERS = int(os.getenv("SXSY_WORKERS") or 1) # 并发账号数，默认逐个执行
+ASYNC_MODE = os.getenv("SXSY_ASYNC") == "1" # 是否使用异步模式（需要安装aiohttp）
+HOST_CACHE_TTL = int(os.getenv("SXSY_HOST_TTL") or 21600) # host缓存有效期（秒）
+HOST_PROBE_TIMEOUT = 5 # 镜像探测超时（秒）
+COOKIE_TIME = 2592000 # 登录时请求的cookie有效期（秒）
+CAPTCHA_RACE = max(1, int(os.getenv("SXSY_CAPTCHA_RACE") or 1)) # 每轮同时尝试的验证码数
+CAPTCHA_MAX_ROUNDS = 3 # 验证码最多尝试轮数
+CAPTCHA_RETRY_DELAY = 1 # 验证码重试初始间隔（秒）
+CAPTCHA_RETRY_DELAY_MAX = 5 # 验证码重试最大间隔（秒）
+CONNECT_TIMEOUT = float(os.getenv("SXSY_CONNECT_TIMEOUT") or 5) # 建立连接超时（秒）
+READ_TIMEOUT = float(os.getenv("SXSY_READ_TIMEOUT") or 20) # 论坛和发布页读取超时（秒）
+OCR_TIMEOUT = float(os.getenv("SXSY_OCR_TIMEOUT") or 10) # OCR服务读取超时（秒）
+ACCOUNT_TIMEOUT = float(os.getenv("SXSY_ACCOUNT_TIMEOUT") or 120) # 单个账号的时限（秒），0为不限
+RUN_TIMEOUT = float(os.getenv("SXSY_RUN_TIMEOUT") or 0) # 整次运行的时限（秒），0为不限
+BREAKER_THRESHOLD = int(os.getenv("SXSY_BREAKER_THRESHOLD") or 5) # 同一主机连续失败多少次后熔断
+BREAKER_COOLDOWN = float(os.getenv("SXSY_BREAKER_COOLDOWN") or 60) # 熔断持续时间（秒），之后放行一个试探请求
+METRICS_FILE = os.getenv("SXSY_METRICS_FILE") or "" # 运行指标输出文件，.prom为Prometheus文本格式，其余为json
+METRICS_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60) # 阶段耗时直方图的桶（秒）
+SHARD = os.getenv("SXSY_SHARD") or "" # 分片"序号/总数"（序号从0开始），如0/4，只处理分配到该分片的账号
+RATE_LIMIT = os.getenv("SXSY_RATE_LIMIT") or "" # 每秒请求数，按目标设置，如 forum=5,ocr=10,publish=1
+INFLIGHT_LIMIT = os.getenv("SXSY_INFLIGHT_LIMIT") or "" # 同时进行的请求数，按目标设置，如 forum=8,ocr=4
+START_WINDOW = float(os.getenv("SXSY_START_WINDOW") or 0) # 账号开始时间分散到该时间窗口内（秒），0为不分散
+ACCOUNTS_FILE = os.getenv("SXSY_ACCOUNTS_FILE") or "" # 账号文件，每行一个账号，格式同环境变量sxsy或json对象
+FORMHASH_CACHE = os.getenv("SXSY_FORMHASH_CACHE") != "0" # 使用上次保存的formhash直接签到，不获取签到页，设为0时每次获取
+MONEY_REFRESH_DAYS = float(os.getenv("SXSY_MONEY_REFRESH_DAYS") or 7) # 直接签到时金钱超过该天数未读取则请求积分页，0为每次读取
+SKIP_SIGNED = os.getenv("SXSY_SKIP_SIGNED") != "0" # 跳过签到记录中今日已签到的账号，设为0时全部重新执行
+REFRESH_BEFORE = float(os.getenv("SXSY_REFRESH_BEFORE") or 259200) # refresh模式重新登录剩余有效期少于该时间（秒）的账号
+REFRESH_WORKERS = int(os.getenv("SXSY_REFRESH_WORKERS") or 1) # refresh模式并发账号数，默认逐个执行
+SCHEDULE = os.getenv("SXSY_SCHEDULE") or "10 9,10 * * *" # 常驻模式执行签到的cron表达式（本机时间），多个用;分隔
+REFRESH_SCHEDULE = os.getenv("SXSY_REFRESH_SCHEDULE") or "" # 常驻模式执行刷新的cron表达式，为空时不刷新
+STATUS_PORT = int(os.getenv("SXSY_STATUS_PORT") or 0) # 常驻模式状态接口端口（只监听127.0.0.1），0为不开启
+SITES_FILE = os.getenv("SXSY_SITES_FILE") or "" # 站点配置文件（json），与尚香书苑一起运行其中的Discuz站点
+LOG_BUFFER = os.getenv("SXSY_LOG_BUFFER") != "0" # 并发执行时每个账号的日志缓存到账号结束后整块输出，设为0时立即输出
+LOG_JSON = os.getenv("SXSY_LOG_JSON") or "" # json lines日志文件，每行包含账号、阶段和耗时，设为-时控制台输出json lines
+PROFILE_DIR = os.getenv("SXSY_PROFILE") or "" # 性能分析输出目录，设置后签到期间采样调用栈，按账号和阶段汇总
+PROFILE_INTERVAL = float(os.getenv("SXSY_PROFILE_INTERVAL") or 0.005) # 调用栈采样间隔（秒）
+PROFILE_MEMORY = os.getenv("SXSY_PROFILE_MEMORY") != "0" # 性能分析时用tracemalloc跟踪内存分配（明显变慢），设为0时只采样调用栈
+PROFILE_TOP = 20 # 性能分析汇总中列出的函数、账号和分配位置数
+SIGN_TZ = timezone(timedelta(hours=float(os.getenv("SXSY_UTC_OFFSET") or 8))) # 论坛按该时区（默认北京时间）划分签到日期
+
+PUBLISH_URL = "https://sxsy.org/" # 发布页地址
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/137.0.0.0 Safari/537.36 Edg/137.0.0.0'
+
+# 页面提取正则，作为站点配置的默认值，同步与异步流程共用
+HOST_PATTERN = re.compile(r'href="https://([^/"]+)')
+# formhash 格式: name="formhash" value="5448b1bc"
+FORMHASH_PATTERN = re.compile(r'name="formhash" value="([a-zA-Z0-9]{8})"')
+# seccodehash 格式: seccode_cSAbDg cSAbDg
+SECCODEHASH_PATTERN = re.compile(r'seccode_([a-zA-Z0-9]{6})')
+# loginhash 格式: main_messaqge_LCpo4 LCpo4
+LOGINHASH_PATTERN = re.compile(r'main_messaqge_([a-zA-Z0-9]{5})')
+CDATA_PATTERN = re.compile(r'<!\[CDATA\[(.*?)\]\]>')
+USERNAME_PATTERN = re.compile(r'欢迎您回来，(.*?)，现在将转入登录前页面')
+SIGN_HASH_PATTERN = re.compile(r'formhash=([a-zA-Z0-9]{8})')
+MONEY_PATTERN = re.compile(r'金钱: </em>(\d+)')
+UID_PATTERN = re.compile(r'uid=(\d+)')
+LOGIN_REQUIRED_PATTERN = re.compile(r'请先登录')
+LOGOUT_PATTERN = re.compile(r'action=logout')
+SIGN_REWARD_PATTERN = re.compile(r'金钱\D{0,10}?(\d+)')
+ALREADY_SIGNED_PATTERN = re.compile(r'已签|已经签到')
+# Discuz表单验证失败（submit_invalid），formhash已失效
+FORMHASH_INVALID_PATTERN = re.compile(r'表单验证串不符|请求来路不正确')
+
+# 各类请求的(连接, 读取)超时，与连接池一一对应
+TIMEOUTS = {
+    'forum': (CONNECT_TIMEOUT, READ_TIMEOUT),
+    'publish': (CONNECT_TIMEOUT, READ_TIMEOUT),
+    'ocr': (CONNECT_TIMEOUT, OCR_TIMEOUT),
+}
+
+STREAM_CHUNK_SIZE = 8192 # 流式读取块大小（字节）
+STREAM_OVERLAP = 512 # 相邻块之间保留的字符数，需大于最长token
+STREAM_GUARD = 64 # 块末尾的匹配可能被截断（如uid=12|34），需等下一块确认
+STREAM_DRAIN_LIMIT = 16384 # 提前结束时剩余内容不超过该字节数则读完，以保留长连接
+STREAM_DRAIN_DECODED_LIMIT = 131072 # 压缩传输时按解压后的字节数计算的读完上限，网页压缩后通常只有几分之一
+
+def backoff_delay(attempt, base, cap):
+    """
+    指数退避等待时间（全随机抖动）
+    :param attempt: 第几次重试，从1开始
+    :param base: 初始等待时间（秒）
+    :param cap: 最大等待时间（秒）
+    :return: 等待时间（秒）
+    """
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+def parse_shard(value):
+    """
+    解析分片设置
+    :param value: "序号/总数"，为空表示不分片
+    :return: (序号, 总数)
+    """
+    if not value:
+        return 0, 1
+    match = re.fullmatch(r'\s*(\d+)\s*/\s*(\d+)\s*', value)
+    if not match or int(match.group(2)) < 1 or int(match.group(1)) >= int(match.group(2)):
+        raise ValueError(f"分片设置格式错误: {value}，应为 序号/总数，如 0/4")
+    return int(match.group(1)), int(match.group(2))
+
+
+def parse_limits(value):
+    """
+    解析按目标设置的限制
+    :param value: 如 "forum=5,ocr=10"，目标为forum/publish/ocr
+    :return: {目标: 数值}
+    """
+    limits = {}
+    for item in value.split(','):
+        if not item.strip():
+            continue
+        target, _, number = item.partition('=')
+        target = target.strip()
+        if target not in TIMEOUTS or not number.strip():
+            raise ValueError(f"限制设置格式错误: {item}，应为 目标=数值，目标为 {'/'.join(TIMEOUTS)}")
+        limits[target] = float(number)
+    return limits
+
+
+def spread_offsets(count, window):
+    """
+    把账号开始时间均匀分散到时间窗口内，每个间隔内随机抖动
+    :param count: 账号数，账号流式读取时为预估值，超出的账号排在窗口末尾
+    :param window: 时间窗口（秒）
+    :return: 生成器，每个账号相对开始时间的偏移（秒）
+    """
+    if window <= 0 or not count:
+        return itertools.repeat(0.0)
+    step = window / count
+    return ((min(index, count - 1) + random.random()) * step for index in itertools.count())
+
+
+def sign_date():
+    """
+    :return: 论坛时区的当前日期，如 2026-10-17
+    """
+    return datetime.now(SIGN_TZ).strftime('%Y-%m-%d')
+
+
+def shard_of(key, count):
+    """
+    按账号标识分配分片，使用稳定哈希，不同进程和机器上结果一致
+    :param key: 账号标识
+    :param count: 分片总数
+    :return: 分片序号
+    """
+    return int(hashlib.sha1(key.encode('utf-8')).hexdigest()[:8], 16) % count
+
+
+def account_key(email=None, cookie=None):
+    """
+    生成账号标识
+    :param email: 邮箱
+    :param cookie: cookie字符串
+    :return: 邮箱，cookie账号使用cookie摘要
+    """
+    if email:
+        return email
+    if cookie:
+        return f"cookie_{hashlib.sha1(cookie.strip().encode('utf-8')).hexdigest()[:8]}"
+    return "default"
+
+
+class SiteProfile:
+    """
+    站点配置：各个Discuz论坛之间不同的部分，包括获取镜像的发布页、接口路径、页面提取正则和结果判断文字
+    默认值为尚香书苑（Discuz + k_misign签到插件），其他站点在站点文件中只需写出不同的部分
+    """
+    # 接口路径，相对于 https://{host}/，花括号中为请求时填入的参数
+    PATHS = {
+        'login_form': "member.php?mod=logging&action=login&infloat=yes&frommessage&inajax=1&ajaxtarget=messagelogin",
+        'login_page': "member.php?mod=logging&action=login",
+        'login_submit': "member.php?mod=logging&action=login&loginsubmit=yes&loginhash={loginhash}&inajax=1",
+        'seccode': "misc.php?mod=seccode&update={update}&idhash={seccodehash}",
+        'seccode_check': "misc.php?mod=seccode&action=check&inajax=1&modid=member::logging&idhash={seccodehash}&secverify={captcha}",
+        'sign_page': "plugin.php?id=k_misign:sign",
+        'sign': "plugin.php?id=k_misign:sign&operation=qiandao&format=global_usernav_extra&formhash={formhash}&inajax=1&ajaxtarget=k_misign_topb",
+        'credit': "home.php?mod=spacecp&ac=credit&showcredit=1",
+        'space': "home.php?mod=space",
+        'promotion': "?fromuid={uid}", # 为空时不访问推广链接
+    }
+    PATTERNS = {
+        'host': HOST_PATTERN,
+        'formhash': FORMHASH_PATTERN,
+        'seccodehash': SECCODEHASH_PATTERN,
+        'loginhash': LOGINHASH_PATTERN,
+        'username': USERNAME_PATTERN,
+        'sign_hash': SIGN_HASH_PATTERN,
+        'money': MONEY_PATTERN,
+        'uid': UID_PATTERN,
+        'login_required': LOGIN_REQUIRED_PATTERN,
+        'logout': LOGOUT_PATTERN,
+        'sign_reward': SIGN_REWARD_PATTERN,
+        'already_signed': ALREADY_SIGNED_PATTERN,
+        'formhash_invalid': FORMHASH_INVALID_PATTERN,
+    }
+    # 响应中出现即表示成功的文字
+    MARKERS = {
+        'captcha_ok': "succeed",
+        'login_ok': "欢迎您回来",
+    }
+
+    def __init__(self, name, default_host=None, publish_url=None, accounts_env=None, accounts_file=None,
+                 login_field="email", paths=None, patterns=None, markers=None):
+        """
+        :param name: 站点名称，同时用于Cookie存储、签到记录和host缓存
+        :param default_host: 默认域名，发布页不可用时使用，默认为DEFAULT_HOST
+        :param publish_url: 列出最新镜像的发布页，为空时只使用默认域名；默认为PUBLISH_URL
+        :param accounts_env: 账号环境变量名，默认为sxsy
+        :param accounts_file: 账号文件，默认为SXSY_ACCOUNTS_FILE
+        :param login_field: 登录方式 email/username
+        :param paths: 覆盖的接口路径 {名称: 路径}
+        :param patterns: 覆盖的提取正则 {名称: 正则字符串}
+        :param markers: 覆盖的结果判断文字 {名称: 文字}
+        """
+        for option, defaults, values in (("paths", self.PATHS, paths), ("patterns", self.PATTERNS, patterns), ("markers", self.MARKERS, markers)):
+            unknown = set(values or ()) - set(defaults)
+            if unknown:
+                raise ValueError(f"站点{name}的{option}中有未知的项: {'、'.join(sorted(unknown))}")
+        self.name = name
+        self.default_host = default_host or DEFAULT_HOST
+        self.publish_url = PUBLISH_URL if publish_url is None else publish_url
+        self.accounts_env = accounts_env or "sxsy"
+        self.accounts_file = ACCOUNTS_FILE if accounts_file is None else accounts_file
+        self.login_field = login_field
+        self.paths = dict(self.PATHS, **(paths or {}))
+        self.patterns = dict(self.PATTERNS, **{key: re.compile(value) for key, value in (patterns or {}).items()})
+        self.markers = dict(self.MARKERS, **(markers or {}))
+        # 流式提取时每个页面需要的token
+        self.param_patterns = {name: self.patterns[name] for name in ('formhash', 'seccodehash', 'loginhash')}
+        # 签到页同时提供登录状态、签到formhash、uid和页头积分菜单中的金钱
+        self.sign_page_patterns = {'formhash': self.patterns['sign_hash'], 'uid': self.patterns['uid'],
+                                   'money': self.patterns['money'], 'login_required': self.patterns['login_required']}
+        self.user_info_patterns = {name: self.patterns[name] for name in ('money', 'uid')}
+
+    @classmethod
+    def from_dict(cls, data, builtin=False):
+        """
+        :param data: 站点文件中的一项
+        :param builtin: 是否为覆盖内置站点（尚香书苑）的配置，未写出的部分使用内置值
+        :return: SiteProfile
+        """
+        if not isinstance(data, dict) or not data.get('name'):
+            raise ValueError(f"站点配置缺少name: {data}")
+        options = {key: data[key] for key in ('default_host', 'publish_url', 'accounts_env', 'accounts_file',
+                                              'login_field', 'paths', 'patterns', 'markers') if key in data}
+        unknown = set(data) - set(options) - {'name'}
+        if unknown:
+            raise ValueError(f"站点{data['name']}中有未知的配置: {'、'.join(sorted(unknown))}")
+        if not builtin:
+            if 'default_host' not in options and not options.get('publish_url'):
+                raise ValueError(f"站点{data['name']}需要配置default_host或publish_url")
+            # 其他站点不继承尚香书苑的发布页和账号，账号默认读取与站点同名的环境变量
+            options.setdefault('publish_url', "")
+            options.setdefault('accounts_file', "")
+            options.setdefault('accounts_env', data['name'])
+        return cls(data['name'], **options)
+
+    def url(self, host, name, **params):
+        """
+        :param host: 域名
+        :param name: 接口名称
+        :param params: 路径中的参数
+        :return: 完整地址，接口路径为空时返回None
+        """
+        path = self.paths[name]
+        if not path:
+            return None
+        return f"https://{host}/{path.format(**params)}"
+
+    def login_form(self, username, password, formhash, captcha, seccodehash, referer):
+        """
+        登录表单，各字段分别url编码，密码中的&、=、+等字符不会破坏表单
+        :param username: 邮箱或用户名
+        :param password: 密码
+        :param formhash: formhash
+        :param captcha: 验证码文字
+        :param seccodehash: seccodehash
+        :param referer: 登录后跳转地址
+        :return: application/x-www-form-urlencoded字符串
+        """
+        return urllib.parse.urlencode({
+            'formhash': formhash,
+            'referer': referer,
+            'loginfield': self.login_field,
+            'username': username,
+            'password': password,
+            'questionid': 0,
+            'answer': "",
+            'seccodehash': seccodehash,
+            'seccodemodid': "member::logging",
+            'seccodeverify': captcha,
+            'cookietime': COOKIE_TIME,
+        })
+
+
+def load_site_profiles(path, site_name):
+    """
+    读取站点文件，格式为站点配置的json列表
+    内置站点总是排在第一个，文件中与内置站点同名的一项只覆盖写出的部分
+    :param path: 文件路径
+    :param site_name: 内置站点名称
+    :return: SiteProfile列表
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    if not isinstance(data, list):
+        raise ValueError("站点文件应为json列表")
+    builtin = SiteProfile(site_name)
+    profiles = []
+    names = set()
+    for item in data:
+        profile = SiteProfile.from_dict(item, builtin=isinstance(item, dict) and item.get('name') == site_name)
+        if profile.name in names:
+            raise ValueError(f"站点文件中的站点重复: {profile.name}")
+        names.add(profile.name)
+        if profile.name == site_name:
+            builtin = profile
+        else:
+            profiles.append(profile)
+    return [builtin] + profiles
+
+
+class Account:
+    """
+    账号来源中的一个账号
+    """
+    def __init__(self, email=None, password=None, cookie=None, host=None, proxy=None, line=0):
+        """
+        :param email: 邮箱，与密码一起使用
+        :param password: 密码
+        :param cookie: cookie字符串，与邮箱密码二选一
+        :param host: 该账号使用的域名，为空时使用自动获取的镜像
+        :param proxy: 该账号使用的代理，如 http://127.0.0.1:8080
+        :param line: 所在行号
+        """
+        self.email = email
+        self.password = password
+        self.cookie = cookie
+        self.host = host
+        self.proxy = proxy
+        self.line = line
+
+    @property
+    def key(self):
+        return account_key(self.email, self.cookie)
+
+
+class AccountSource:
+    """
+    流式读取账号，逐行解析和校验，不一次性读入所有账号
+    每行一个账号: 邮箱&密码、cookie字符串，或json对象（可以指定host和proxy）
+    空行和#开头的行忽略，格式错误的行跳过并记录
+    """
+    FIELDS = ('email', 'password', 'cookie', 'host', 'proxy')
+
+    def __init__(self, name, text=None, path=None):
+        """
+        :param name: 来源名称，用于日志显示
+        :param text: 换行分隔的账号文本（环境变量）
+        :param path: 账号文件，与text二选一
+        """
+        self.name = name
+        self.text = text
+        self.path = path
+        self.skipped = []
+
+    def lines(self):
+        """
+        :return: 生成器，(行号, 内容)
+        """
+        if self.path:
+            with open(self.path, 'r', encoding='utf-8-sig') as f:
+                yield from enumerate(f, 1)
+        else:
+            yield from enumerate(self.text.splitlines(), 1)
+
+    def parse(self, line, number):
+        """
+        解析一行
+        :param line: 去掉首尾空白的一行
+        :param number: 行号
+        :return: Account，格式错误时抛出ValueError
+        """
+        if line.startswith('{'):
+            try:
+                data = json.loads(line)
+            except ValueError:
+                raise ValueError("不是有效的json")
+            if not isinstance(data, dict):
+                raise ValueError("不是json对象")
+            unknown = set(data) - set(self.FIELDS)
+            if unknown:
+                raise ValueError(f"包含未知字段{sorted(unknown)}")
+            if any(data.get(name) is not None and not isinstance(data[name], str) for name in self.FIELDS):
+                raise ValueError("字段值必须是字符串")
+            account = Account(*(data.get(name) or None for name in self.FIELDS), line=number)
+        elif '&' in line:
+            # 邮箱不含&，只按第一个&分割，密码中可以有&
+            email, password = line.split('&', 1)
+            account = Account(email.strip(), password, line=number)
+        else:
+            account = Account(cookie=line, line=number)
+
+        if account.cookie:
+            if '=' not in account.cookie:
+                raise ValueError("cookie格式错误，应为 name=value; ...")
+        elif not account.email or not account.password:
+            raise ValueError("缺少邮箱或密码")
+        if account.host and ('/' in account.host or ' ' in account.host):
+            raise ValueError("host应为域名，如 sxsy21.com")
+        if account.proxy and '://' not in account.proxy:
+            raise ValueError("proxy应为 协议://地址:端口")
+        return account
+
+    def __iter__(self):
+        """
+        :return: 生成器，逐个返回格式正确的Account
+        """
+        for number, line in self.lines():
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            try:
+                yield self.parse(line, number)
+            except ValueError as e:
+                # 不输出行内容，避免密码或cookie出现在日志中
+                self.skipped.append((number, str(e)))
+                logging.warning(f"[账号来源]{self.name}第{number}行{str(e)}，已跳过")
+
+    def count(self):
+        """
+        统计账号行数，只用于预估，不校验格式
+        账号文件流式读取，不为统计再读一遍，返回None
+        :return: 非空且不是注释的行数，账号文件返回None
+        """
+        if self.path:
+            return None
+        return sum(1 for line in self.text.splitlines() if line.strip() and not line.lstrip().startswith('#'))
+
+
+class AccountResult:
+    """
+    单个账号的执行结果
+    """
+    def __init__(self, account, source):
+        """
+        :param account: 账号标识
+        :param source: 账号来源，cookie_store、env、ledger（签到记录中今日已签到，未执行）或 refresh（提前重新登录）
+        """
+        self.account = account
+        self.source = source
+        self.status = "pending" # pending/success/cookie_expired/param_failed/captcha_failed/login_failed/timeout/error
+        self.message = ""
+        self.money = None
+        self.already_signed = False
+        self.elapsed = 0.0
+        self.requests = 0
+        self.bytes = 0
+        self.retries = {} # 重试类型 -> 次数，failover/captcha
+        self.phases = {} # 阶段 -> 累计耗时（秒）
+        self.started = time.monotonic()
+        self.lock = threading.Lock() # 验证码候选在多个线程中发请求
+
+    @property
+    def outcome(self):
+        """
+        :return: 执行结果分类，成功时区分本次签到和今日已签，按签到记录跳过的为skipped
+        """
+        if self.source == "ledger":
+            return "skipped"
+        if self.status == "success":
+            return "already_signed" if self.already_signed else "signed"
+        return self.status
+
+    def count_request(self):
+        with self.lock:
+            self.requests += 1
+
+    def add_bytes(self, count):
+        with self.lock:
+            self.bytes += count
+
+    def count_retry(self, kind):
+        with self.lock:
+            self.retries[kind] = self.retries.get(kind, 0) + 1
+
+    def add_phase(self, phase, seconds):
+        with self.lock:
+            self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    def to_dict(self):
+        return {
+            'account': self.account,
+            'source': self.source,
+            'status': self.status,
+            'outcome': self.outcome,
+            'message': self.message,
+            'money': self.money,
+            'elapsed': round(self.elapsed, 3),
+            'requests': self.requests,
+            'bytes': self.bytes,
+            'retries': dict(self.retries),
+            'phases': {phase: round(seconds, 3) for phase, seconds in self.phases.items()}
+        }
+
+
+# 当前线程/协程正在执行的账号，用于按账号统计请求
+current_account = contextvars.ContextVar("current_account", default=None)
+
+
+def record_transfer(count):
+    """
+    记录当前账号的响应字节数
+    :param count: 字节数
+    """
+    account = current_account.get()
+    if account is not None:
+        account.add_bytes(count)
+
+
+def submit_in_context(executor, fn, *args):
+    """
+    在线程池中执行函数并沿用当前上下文（当前账号）
+    :param executor: 线程池
+    :param fn: 函数
+    :return: Future
+    """
+    return executor.submit(contextvars.copy_context().run, fn, *args)
+
+# 当前账号的截止时间（time.monotonic()），请求超时和重试等待都不超过剩余时间
+current_deadline = contextvars.ContextVar("current_deadline", default=None)
+
+# 当前阶段（名称, 开始时间），写入日志记录
+current_phase = contextvars.ContextVar("current_phase", default=None)
+
+# 当前账号的日志缓存，不为None时日志先缓存，账号结束后整块输出
+current_log_buffer = contextvars.ContextVar("current_log_buffer", default=None)
+
+
+class AccountLogHandler(logging.handlers.QueueHandler):
+    """
+    日志只放入队列，格式化（包括异常堆栈）和输出都在后台线程进行，不阻塞账号线程
+    每条记录附带当前账号、阶段和账号开始后的耗时；当前上下文有日志缓存时先缓存，账号结束后整块放入队列
+    """
+    def prepare(self, record):
+        # 同一进程内的队列不需要序列化，原样交给后台线程格式化
+        return record
+
+    def emit(self, record):
+        try:
+            account = current_account.get()
+            phase = current_phase.get()
+            record.account = account.account if account is not None else None
+            record.phase = phase[0] if phase is not None else None
+            record.latency = round(time.monotonic() - account.started, 3) if account is not None else None
+            buffer = current_log_buffer.get()
+            if buffer is not None:
+                buffer.append(record)
+            else:
+                self.enqueue(record)
+        except Exception:
+            self.handleError(record)
+
+    def flush_block(self, buffer):
+        """
+        把一个账号缓存的日志作为一项放入队列，后台线程连续输出，不与其他账号交错
+        :param buffer: 日志记录列表
+        """
+        if buffer:
+            self.enqueue(list(buffer))
+            buffer.clear()
+
+
+class LogListener(logging.handlers.QueueListener):
+    """
+    后台输出线程，队列中的一项可以是一条记录或一个账号的整块记录
+    """
+    def handle(self, record):
+        if isinstance(record, list):
+            for item in record:
+                super().handle(item)
+        else:
+            super().handle(record)
+
+
+class JsonLogFormatter(logging.Formatter):
+    """
+    json lines格式：时间、级别、账号、阶段、账号开始后的耗时（秒）和消息，有异常时附带堆栈
+    """
+    def format(self, record):
+        data = {
+            'time': datetime.fromtimestamp(record.created).astimezone().isoformat(timespec="milliseconds"),
+            'level': record.levelname,
+            'account': getattr(record, 'account', None),
+            'phase': getattr(record, 'phase', None),
+            'latency': getattr(record, 'latency', None),
+            'message': record.getMessage(),
+        }
+        if record.exc_info:
+            data['exception'] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False)
+
+
+def configure_logging():
+    """
+    配置日志系统，整个进程只配置一次；调用方已经配置了日志时不修改
+    :return: AccountLogHandler，未配置时返回None
+    """
+    root = logging.getLogger()
+    for handler in root.handlers:
+        if isinstance(handler, AccountLogHandler):
+            return handler
+    if root.handlers:
+        return None
+    handlers = []
+    if LOG_JSON != "-":
+        console = logging.StreamHandler()
+        console.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s\t- %(message)s', datefmt='%Y-%m-%d %H:%M:%S'))
+        handlers.append(console)
+    # handlers.append(logging.FileHandler(f'尚香书苑_{datetime.now().strftime("%Y%m%d")}.log', encoding='utf-8')) # 保存日志
+    if LOG_JSON:
+        output = logging.StreamHandler(sys.stdout) if LOG_JSON == "-" else logging.FileHandler(LOG_JSON, encoding="utf-8")
+        output.setFormatter(JsonLogFormatter())
+        handlers.append(output)
+    handler = AccountLogHandler(queue.Queue())
+    listener = LogListener(handler.queue, *handlers)
+    root.setLevel(logging.INFO)
+    root.addHandler(handler)
+    listener.start()
+    # 退出前输出队列中剩余的日志
+    atexit.register(listener.stop)
+    return handler
+
+
+class DeadlineExceeded(requests.Timeout, asyncio.TimeoutError):
+    """
+    账号或整次运行已超过时限，不再发出新的请求
+    同时继承两种超时异常，同步和异步流程原有的网络错误处理都能捕获
+    """
+
+
+class CircuitOpenError(requests.ConnectionError):
+    """
+    目标主机熔断中，请求未发送直接失败
+    """
+
+
+def deadline_remaining():
+    """
+    :return: 当前截止时间的剩余秒数，没有截止时间返回None
+    """
+    deadline = current_deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def deadline_exceeded():
+    """
+    :return: 是否已超过当前截止时间
+    """
+    remaining = deadline_remaining()
+    return remaining is not None and remaining <= 0
+
+
+def clamp_timeout(timeout):
+    """
+    按当前截止时间缩短超时或等待时间
+    :param timeout: 秒数或(连接, 读取)元组
+    :return: 不超过剩余时间的超时
+    """
+    remaining = deadline_remaining()
+    if remaining is None or timeout is None:
+        return timeout
+    remaining = max(remaining, 0.001)
+    if isinstance(timeout, tuple):
+        return tuple(min(value, remaining) for value in timeout)
+    return min(timeout, remaining)
+
+
+class CircuitBreaker:
+    """
+    按主机熔断
+    同一主机连续失败达到阈值后，冷却时间内的请求直接失败，剩余账号不必各自等待超时；
+    冷却结束后放行一个试探请求，成功则恢复，失败则重新冷却
+    """
+    def __init__(self, threshold, cooldown):
+        """
+        :param threshold: 连续失败次数阈值
+        :param cooldown: 熔断持续时间（秒）
+        """
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = {}
+        self.opened = {} # 主机 -> 熔断开始时间
+        self.lock = threading.Lock()
+
+    def allow(self, host):
+        """
+        :param host: 主机
+        :return: 是否允许发送请求
+        """
+        with self.lock:
+            opened = self.opened.get(host)
+            if opened is None:
+                return True
+            if time.monotonic() - opened < self.cooldown:
+                return False
+            # 只放行一个试探请求，其余请求继续等待冷却
+            self.opened[host] = time.monotonic()
+            return True
+
+    def is_open(self, host):
+        """
+        :param host: 主机
+        :return: 是否处于熔断冷却中
+        """
+        with self.lock:
+            opened = self.opened.get(host)
+            return opened is not None and time.monotonic() - opened < self.cooldown
+
+    def record(self, host, ok):
+        """
+        记录一次请求结果
+        :param host: 主机
+        :param ok: 是否成功（连接失败、超时、5xx为失败）
+        """
+        with self.lock:
+            if ok:
+                self.failures.pop(host, None)
+                if self.opened.pop(host, None) is not None:
+                    logging.info(f"[熔断]{host} 已恢复")
+                return
+            count = self.failures.get(host, 0) + 1
+            self.failures[host] = count
+            if count >= self.threshold:
+                if host not in self.opened:
+                    logging.warning(f"[熔断]{host} 连续失败{count}次，{self.cooldown:g}秒内的请求直接失败")
+                self.opened[host] = time.monotonic()
+
+class TokenBucket:
+    """
+    令牌桶，按固定速率补充令牌，允许不超过容量的突发
+    """
+    def __init__(self, rate, burst):
+        """
+        :param rate: 每秒补充的令牌数
+        :param burst: 桶容量
+        """
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        """
+        预订一个令牌，令牌不足时允许透支，按透支量排队
+        :return: 需要等待的时间（秒），同步与异步流程各自等待
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+class RequestScheduler:
+    """
+    按目标（论坛、发布页、OCR服务）限制请求速率和同时进行的请求数，所有账号共用
+    多个站点同时运行时论坛和发布页按站点分别限制，OCR服务所有站点共用一个限制
+    等待时间不超过当前账号的截止时间
+    """
+    SHARED_TARGETS = ('ocr',)
+
+    def __init__(self, rates, inflight, asynchronous=False):
+        """
+        :param rates: {目标: 每秒请求数}
+        :param inflight: {目标: 同时进行的请求数}
+        :param asynchronous: 是否在事件循环中使用
+        """
+        self.rates = {target: rate for target, rate in rates.items() if rate > 0}
+        self.inflight = {target: int(limit) for target, limit in inflight.items() if limit >= 1}
+        self.semaphore_type = asyncio.Semaphore if asynchronous else threading.BoundedSemaphore
+        self.buckets = {} # (目标, 站点) -> TokenBucket
+        self.semaphores = {} # (目标, 站点) -> 信号量
+        self.lock = threading.Lock()
+
+    def limits(self, target, site=None):
+        """
+        获取目标的令牌桶和信号量，第一次使用时创建
+        :param target: 目标
+        :param site: 站点名称
+        :return: (TokenBucket, 信号量)，没有限制的为None
+        """
+        key = (target, None if target in self.SHARED_TARGETS else site)
+        with self.lock:
+            if key not in self.buckets:
+                rate = self.rates.get(target)
+                limit = self.inflight.get(target)
+                self.buckets[key] = TokenBucket(rate, max(1.0, rate)) if rate else None
+                self.semaphores[key] = self.semaphore_type(limit) if limit else None
+            return self.buckets[key], self.semaphores[key]
+
+    def delay(self, bucket, target):
+        """
+        :param bucket: 目标的TokenBucket
+        :param target: 目标
+        :return: 速率限制需要等待的时间（秒）
+        """
+        if bucket is None:
+            return 0.0
+        delay = bucket.reserve()
+        remaining = deadline_remaining()
+        if remaining is not None and delay > remaining:
+            raise DeadlineExceeded(f"等待{target}请求配额超过时限")
+        return delay
+
+    @contextlib.contextmanager
+    def slot(self, target, site=None):
+        """
+        同步流程：等待速率配额和并发名额
+        :param target: 目标
+        :param site: 站点名称
+        """
+        bucket, semaphore = self.limits(target, site)
+        delay = self.delay(bucket, target)
+        if delay > 0:
+            time.sleep(delay)
+        if semaphore is None:
+            yield
+            return
+        remaining = deadline_remaining()
+        if not semaphore.acquire(timeout=None if remaining is None else max(remaining, 0)):
+            raise DeadlineExceeded(f"等待{target}并发名额超过时限")
+        try:
+            yield
+        finally:
+            semaphore.release()
+
+    @contextlib.asynccontextmanager
+    async def async_slot(self, target, site=None):
+        """
+        异步流程：等待速率配额和并发名额
+        :param target: 目标
+        :param site: 站点名称
+        """
+        bucket, semaphore = self.limits(target, site)
+        delay = self.delay(bucket, target)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if semaphore is None:
+            yield
+            return
+        remaining = deadline_remaining()
+        try:
+            await asyncio.wait_for(semaphore.acquire(), None if remaining is None else max(remaining, 0))
+        except asyncio.TimeoutError:
+            raise DeadlineExceeded(f"等待{target}并发名额超过时限")
+        try:
+            yield
+        finally:
+            semaphore.release()
+
+class CronSchedule:
+    """
+    cron表达式：分 时 日 月 周，支持 * , - /，周日为0或7
+    日和周都有限制时满足其一即可，与cron一致
+    """
+    RANGES = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+    def __init__(self, expression):
+        """
+        :param expression: cron表达式，如 10 9,10 * * *
+        """
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"cron表达式应为5个字段（分 时 日 月 周）: {expression}")
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, weekdays = (
+            self.parse_field(field, low, high) for field, (low, high) in zip(fields, self.RANGES))
+        self.weekdays = {day % 7 for day in weekdays}
+        self.any_day = fields[2] == '*'
+        self.any_weekday = fields[4] == '*'
+
+    @staticmethod
+    def parse_field(field, low, high):
+        """
+        :param field: 单个字段，如 */15、1-5、9,10
+        :param low: 最小值
+        :param high: 最大值
+        :return: 取值集合
+        """
+        values = set()
+        for part in field.split(','):
+            value, _, step = part.partition('/')
+            try:
+                if value == '*':
+                    start, end = low, high
+                elif '-' in value:
+                    start, end = (int(number) for number in value.split('-', 1))
+                else:
+                    # 5/15 表示从5开始每15
+                    start = int(value)
+                    end = high if step else start
+                step = int(step) if step else 1
+            except ValueError:
+                raise ValueError(f"cron字段格式错误: {field}")
+            if start < low or end > high or start > end or step < 1:
+                raise ValueError(f"cron字段超出范围{low}-{high}: {field}")
+            values.update(range(start, end + 1, step))
+        return values
+
+    def day_matches(self, moment):
+        """
+        :param moment: datetime
+        :return: 日期是否满足日、周字段
+        """
+        day = moment.day in self.days
+        weekday = moment.isoweekday() % 7 in self.weekdays
+        if self.any_day or self.any_weekday:
+            return day and weekday
+        return day or weekday
+
+    def next_after(self, moment):
+        """
+        :param moment: datetime
+        :return: moment之后第一个满足表达式的时间（整分钟）
+        """
+        moment = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        # 如 0 0 31 2 * 永远不会执行
+        limit = moment + timedelta(days=366 * 4)
+        while moment < limit:
+            if moment.month not in self.months:
+                moment = (moment.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self.day_matches(moment):
+                moment = moment.replace(hour=0, minute=0) + timedelta(days=1)
+            elif moment.hour not in self.hours:
+                moment = moment.replace(minute=0) + timedelta(hours=1)
+            elif moment.minute not in self.minutes:
+                moment += timedelta(minutes=1)
+            else:
+                return moment
+        raise ValueError(f"cron表达式没有可执行的时间: {self.expression}")
+
+class TokenScanner:
+    """
+    增量扫描页面中的token，同步与异步流程共用
+    每次喂入一段新解码的文本，与上一段末尾拼接后匹配，跨块的token也能找到
+    """
+    def __init__(self, patterns, stop_any=False, stop_on=()):
+        """
+        :param patterns: {名称: 编译后的正则}，有分组时取第一个分组
+        :param stop_any: True时找到任意一个即结束，否则全部找到才结束
+        :param stop_on: 找到其中任意一个名称即结束
+        """
+        self.patterns = patterns
+        self.stop_on = set(patterns) if stop_any else set(stop_on)
+        self.found = {}
+        self.tail = ""
+
+    @property
+    def done(self):
+        return len(self.found) == len(self.patterns) or not self.stop_on.isdisjoint(self.found)
+
+    def feed(self, text, final=False):
+        """
+        :param text: 新解码的文本
+        :param final: 是否为最后一段
+        :return: 是否已找到所需token
+        """
+        window = self.tail + text
+        # 非最后一段时，靠近末尾的匹配可能不完整，留到下一段确认
+        limit = len(window) if final else len(window) - STREAM_GUARD
+        for name, pattern in self.patterns.items():
+            if name in self.found:
+                continue
+            match = pattern.search(window)
+            if match and match.end() <= limit:
+                self.found[name] = match.group(1) if pattern.groups else match.group(0)
+        self.tail = window[-STREAM_OVERLAP:]
+        return self.done
+
+
+def response_encoding(content_type, encoding=None):
+    """
+    获取响应编码，未声明charset时按utf-8处理
+    :param content_type: Content-Type头
+    :param encoding: 已解析的编码
+    :return: 编码
+    """
+    if encoding and 'charset' in (content_type or '').lower():
+        return encoding
+    return 'utf-8'
+
+
+def drain_limit(headers):
+    """
+    :param headers: 响应头
+    :return: 提前结束读取时最多再读的字节数，压缩传输时为解压后的字节数
+    """
+    return STREAM_DRAIN_DECODED_LIMIT if headers.get('Content-Encoding') else STREAM_DRAIN_LIMIT
+
+
+def release_response(response, chunks):
+    """
+    提前结束读取时，剩余内容不超过STREAM_DRAIN_LIMIT则读完并归还连接，否则关闭连接
+    没有Content-Length（分块传输）时最多再读drain_limit()字节，读到结尾才归还
+    :param response: stream=True的requests响应
+    :param chunks: 读取到一半的iter_content迭代器，分块传输的解析状态在其中，不能换用新的读取方式
+    """
+    length = response.headers.get('Content-Length')
+    if length and length.isdigit() and int(length) - response.raw.tell() > STREAM_DRAIN_LIMIT:
+        response.close()
+        return
+    limit = drain_limit(response.headers)
+    drained = 0
+    try:
+        for chunk in chunks:
+            drained += len(chunk)
+            if drained > limit:
+                break
+        else:
+            response.raw.release_conn()
+            return
+    except Exception:
+        pass
+    response.close()
+
+
+def extract_tokens(response, patterns, stop_any=False, stop_on=()):
+    """
+    流式读取响应并提取token，全部找到后停止读取
+    剩余内容较少时读完以保留长连接，否则直接关闭连接
+    :param response: stream=True的requests响应
+    :param patterns: {名称: 编译后的正则}
+    :param stop_any: 找到任意一个即结束
+    :param stop_on: 找到其中任意一个名称即结束
+    :return: {名称: 匹配内容}，未找到的名称不在结果中
+    """
+    scanner = TokenScanner(patterns, stop_any, stop_on)
+    decoder = codecs.getincrementaldecoder(response_encoding(response.headers.get('Content-Type'), response.encoding))(errors='replace')
+    finished = False
+    # 保留迭代器的引用：提前跳出循环时迭代器被回收会关闭分块传输的响应，剩余内容就无法读完
+    chunks = response.iter_content(STREAM_CHUNK_SIZE)
+    try:
+        for chunk in chunks:
+            if scanner.feed(decoder.decode(chunk)):
+                finished = True
+                break
+        else:
+            scanner.feed(decoder.decode(b'', final=True), final=True)
+    finally:
+        if finished:
+            release_response(response, chunks)
+        record_transfer(response.raw.tell())
+    return scanner.found
+
+
+class RunMetrics:
+    """
+    一次运行的指标：各阶段耗时直方图，运行结束时与账号结果一起导出
+    """
+    def __init__(self, buckets=METRICS_BUCKETS):
+        """
+        :param buckets: 直方图桶上限（秒），升序
+        """
+        self.buckets = buckets
+        self.started = time.time()
+        self.start = time.monotonic()
+        self.phases = {} # 阶段 -> [各桶计数..., 总耗时, 次数]
+        self.lock = threading.Lock()
+
+    def observe(self, phase, seconds):
+        """
+        记录一次阶段耗时
+        :param phase: 阶段名称
+        :param seconds: 耗时（秒）
+        """
+        with self.lock:
+            data = self.phases.setdefault(phase, [0] * len(self.buckets) + [0.0, 0])
+            for index, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    data[index] += 1
+            data[-2] += seconds
+            data[-1] += 1
+
+    def summary(self, site_name, results):
+        """
+        汇总指标
+        :param site_name: 站点名称
+        :param results: AccountResult列表
+        :return: 可json序列化的字典
+        """
+        outcomes = {}
+        retries = {}
+        for result in results:
+            outcomes[result.outcome] = outcomes.get(result.outcome, 0) + 1
+            for kind, count in result.retries.items():
+                retries[kind] = retries.get(kind, 0) + count
+        with self.lock:
+            phases = {
+                phase: {
+                    'count': data[-1],
+                    'sum': round(data[-2], 3),
+                    'buckets': dict([(f"{bound:g}", data[index]) for index, bound in enumerate(self.buckets)] + [("+Inf", data[-1])])
+                }
+                for phase, data in sorted(self.phases.items())
+            }
+        return {
+            'site': site_name,
+            'timestamp': round(self.started, 3),
+            'time': datetime.fromtimestamp(self.started).strftime('%Y-%m-%d %H:%M:%S'),
+            'duration': round(time.monotonic() - self.start, 3),
+            'accounts': len(results),
+            'outcomes': outcomes,
+            'requests': sum(result.requests for result in results),
+            'bytes': sum(result.bytes for result in results),
+            'retries': retries,
+            'phases': phases,
+            'results': [result.to_dict() for result in results]
+        }
+
+    @staticmethod
+    def merge(summaries):
+        """
+        合并多个分片的指标汇总
+        :param summaries: summary()返回值的列表
+        :return: 合并后的汇总，格式与summary()一致
+        """
+        merged = {
+            'site': summaries[0]['site'],
+            'timestamp': min(summary['timestamp'] for summary in summaries),
+            'time': min(summary['time'] for summary in summaries),
+            # 分片并行运行，总耗时取最慢的分片
+            'duration': max(summary['duration'] for summary in summaries),
+            'shards': len(summaries),
+            'accounts': 0,
+            'outcomes': {},
+            'requests': 0,
+            'bytes': 0,
+            'retries': {},
+            'phases': {},
+            'results': []
+        }
+        for summary in summaries:
+            for key in ('accounts', 'requests', 'bytes'):
+                merged[key] += summary[key]
+            for key in ('outcomes', 'retries'):
+                for name, count in summary[key].items():
+                    merged[key][name] = merged[key].get(name, 0) + count
+            for phase, data in summary['phases'].items():
+                target = merged['phases'].setdefault(phase, {'count': 0, 'sum': 0.0, 'buckets': {}})
+                target['count'] += data['count']
+                target['sum'] = round(target['sum'] + data['sum'], 3)
+                for bound, count in data['buckets'].items():
+                    target['buckets'][bound] = target['buckets'].get(bound, 0) + count
+            merged['results'].extend(summary['results'])
+        merged['phases'] = dict(sorted(merged['phases'].items()))
+        return merged
+
+    @staticmethod
+    def to_prometheus(summary):
+        """
+        转换为Prometheus文本格式（node_exporter textfile）
+        :param summary: summary()的返回值
+        :return: 文本
+        """
+        site = summary['site'].replace('\\', '\\\\').replace('"', '\\"')
+        lines = [
+            "# HELP sxsy_run_timestamp_seconds 本次运行开始时间",
+            "# TYPE sxsy_run_timestamp_seconds gauge",
+            f'sxsy_run_timestamp_seconds{{site="{site}"}} {summary["timestamp"]}',
+            "# HELP sxsy_run_duration_seconds 本次运行耗时",
+            "# TYPE sxsy_run_duration_seconds gauge",
+            f'sxsy_run_duration_seconds{{site="{site}"}} {summary["duration"]}',
+            "# HELP sxsy_accounts 各执行结果的账号数",
+            "# TYPE sxsy_accounts gauge",
+        ]
+        for outcome, count in sorted(summary['outcomes'].items()):
+            lines.append(f'sxsy_accounts{{site="{site}",outcome="{outcome}"}} {count}')
+        lines += [
+            "# HELP sxsy_http_requests 账号发出的HTTP请求数",
+            "# TYPE sxsy_http_requests gauge",
+            f'sxsy_http_requests{{site="{site}"}} {summary["requests"]}',
+            "# HELP sxsy_http_response_bytes 账号请求的响应字节数",
+            "# TYPE sxsy_http_response_bytes gauge",
+            f'sxsy_http_response_bytes{{site="{site}"}} {summary["bytes"]}',
+            "# HELP sxsy_retries 重试次数",
+            "# TYPE sxsy_retries gauge",
+        ]
+        for kind, count in sorted(summary['retries'].items()):
+            lines.append(f'sxsy_retries{{site="{site}",kind="{kind}"}} {count}')
+        lines += [
+            "# HELP sxsy_phase_seconds 各阶段耗时",
+            "# TYPE sxsy_phase_seconds histogram",
+        ]
+        for phase, data in summary['phases'].items():
+            for bound, count in data['buckets'].items():
+                lines.append(f'sxsy_phase_seconds_bucket{{site="{site}",phase="{phase}",le="{bound}"}} {count}')
+            lines.append(f'sxsy_phase_seconds_sum{{site="{site}",phase="{phase}"}} {data["sum"]}')
+            lines.append(f'sxsy_phase_seconds_count{{site="{site}",phase="{phase}"}} {data["count"]}')
+        return "\n".join(lines) + "\n"
+
+
+def write_metrics(path, summary):
+    """
+    写入指标文件，先写临时文件再替换，避免采集到写了一半的文件
+    :param path: 文件路径，.prom为Prometheus文本格式，其余为json
+    :param summary: RunMetrics.summary()的返回值
+    """
+    if path.endswith(".prom"):
+        text = RunMetrics.to_prometheus(summary)
+    else:
+        text = json.dumps(summary, ensure_ascii=False, indent=2)
+    temp_file = f"{path}.{os.getpid()}.tmp"
+    with open(temp_file, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(temp_file, path)
+    logging.info(f"[指标]已写入{path}")
+
+
+class Profiler:
+    """
+    性能分析：运行期间后台线程定时采样各线程的调用栈，按账号和阶段归类，采样的是墙钟时间，等待网络的时间也计入；
+    可选用tracemalloc跟踪内存分配，统计各阶段和账号的内存增量，并在内存创新高时保存快照；
+    tracemalloc只有进程总量，多个账号或站点同时执行时增量无法归属，此时不输出各阶段和账号的内存增量
+    阶段由AutoTask.timed()登记，同步流程按线程区分，异步流程按当前任务区分；
+    多个站点共用一个实例，第一个站点开始时启动，最后一个站点结束时写出结果
+    """
+    def __init__(self, directory, interval, memory):
+        """
+        :param directory: 输出目录
+        :param interval: 采样间隔（秒）
+        :param memory: 是否跟踪内存分配
+        """
+        self.directory = directory
+        self.interval = interval
+        self.memory = memory
+        self.lock = threading.Lock()
+        self.users = 0
+        self.name = None
+        self.thread = None
+        self.stopped = threading.Event()
+        self.tracing = False # 是否由本实例开启了tracemalloc
+        self.scopes = {} # 线程id或异步任务 -> [(账号, 阶段)]，嵌套的阶段依次入栈
+        self.loops = {} # 线程id -> 该线程运行的事件循环
+        self.root_threads = Counter() # 执行run的线程，不在阶段中的采样也计入
+        self.code_labels = {}
+        self.reset()
+
+    def reset(self):
+        self.started = time.monotonic()
+        self.samples = Counter() # (账号, 阶段, 调用栈) -> 采样数
+        self.allocations = Counter() # (账号, 阶段) -> 内存增量（字节）
+        self.overlapped = False # 是否有多个账号同时处于阶段中
+        self.peak = 0
+        self.peak_snapshot = None
+
+    def start(self, name):
+        """
+        :param name: 站点名称，用于输出文件名
+        """
+        with self.lock:
+            self.users += 1
+            self.root_threads[threading.get_ident()] += 1
+            if self.users > 1:
+                return
+            self.name = name
+            self.reset()
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.tracing = True
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.sample_loop, name="profiler", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """
+        最后一个使用者结束时停止采样并写出结果
+        """
+        with self.lock:
+            self.users -= 1
+            ident = threading.get_ident()
+            self.root_threads[ident] -= 1
+            if not self.root_threads[ident]:
+                del self.root_threads[ident]
+            if self.users > 0:
+                return
+        self.stopped.set()
+        self.thread.join()
+        try:
+            self.write()
+        finally:
+            self.loops.clear()
+            if self.tracing:
+                tracemalloc.stop()
+                self.tracing = False
+
+    @staticmethod
+    def owner():
+        """
+        :return: 当前执行流程的标识，事件循环中为当前任务，否则为线程id
+        """
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+        return threading.get_ident() if task is None else task
+
+    @contextlib.contextmanager
+    def scope(self, account, phase):
+        """
+        登记当前执行流程所在的账号和阶段，退出时累计该阶段的内存增量
+        :param account: 账号
+        :param phase: 阶段名称
+        """
+        if not self.users:
+            yield
+            return
+        owner = self.owner()
+        if not isinstance(owner, int):
+            self.loops[threading.get_ident()] = asyncio.get_running_loop()
+        memory = tracemalloc.get_traced_memory()[0] if self.tracing else 0
+        with self.lock:
+            self.scopes.setdefault(owner, []).append((account, phase))
+            # 同一账号在线程池中并行的阶段（如验证码识别）嵌套在该账号的阶段内，不算同时执行
+            if len(self.scopes) > 1 and len({stack[0][0] for stack in self.scopes.values()}) > 1:
+                self.overlapped = True
+        try:
+            yield
+        finally:
+            with self.lock:
+                stack = self.scopes[owner]
+                stack.pop()
+                if not stack:
+                    del self.scopes[owner]
+                if self.tracing:
+                    self.allocations[(account, phase)] += tracemalloc.get_traced_memory()[0] - memory
+
+    def scope_of(self, ident):
+        """
+        :param ident: 线程id
+        :return: 该线程当前的(账号, 阶段)，不在阶段中时返回None
+        """
+        loop = self.loops.get(ident)
+        if loop is not None:
+            task = asyncio.current_task(loop)
+            stack = self.scopes.get(task) if task is not None else None
+        else:
+            stack = self.scopes.get(ident)
+        return stack[-1] if stack else None
+
+    def label_of(self, code):
+        label = self.code_labels.get(code)
+        if label is None:
+            # 折叠栈格式用分号分隔各层，名称中不能有分号
+            label = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(";", ":")
+            self.code_labels[code] = label
+        return label
+
+    def sample_loop(self):
+        me = threading.get_ident()
+        while not self.stopped.wait(self.interval):
+            frames = sys._current_frames()
+            with self.lock:
+                for ident, frame in frames.items():
+                    if ident == me:
+                        continue
+                    scope = self.scope_of(ident)
+                    if scope is None:
+                        # 空闲的线程池线程不计入，执行run的线程在阶段之外的时间计入“其他”
+                        if ident not in self.root_threads:
+                            continue
+                        scope = ("-", "(其他)")
+                    stack = []
+                    while frame is not None:
+                        stack.append(self.label_of(frame.f_code))
+                        frame = frame.f_back
+                    self.samples[scope + (tuple(reversed(stack)),)] += 1
+            del frames
+            if self.tracing:
+                current = tracemalloc.get_traced_memory()[0]
+                # 内存比上次快照时增长10%以上才重新拍快照，快照代价与存活的分配数成正比
+                if current > self.peak * 1.1:
+                    self.peak = current
+                    self.peak_snapshot = tracemalloc.take_snapshot().filter_traces(self.own_filters())
+
+    @staticmethod
+    def own_filters():
+        """
+        :return: 排除性能分析本身（采样数据、上一个快照）占用的内存的tracemalloc过滤器
+        """
+        filters = [tracemalloc.Filter(False, tracemalloc.__file__)]
+        for method in (Profiler.sample_loop, Profiler.scope, Profiler.label_of):
+            code = inspect.unwrap(method).__code__
+            filters.extend(tracemalloc.Filter(False, code.co_filename, line) for _, line in dis.findlinestarts(code) if line)
+        return filters
+
+    def write(self):
+        """
+        写出折叠栈（可直接交给flamegraph.pl或speedscope）、内存峰值快照和文字汇总
+        :return: 汇总文件路径
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        base = os.path.join(self.directory, f"{self.name}_{datetime.now().strftime('%Y%m%d-%H%M%S')}")
+        # 常驻模式一秒内结束多次运行时不覆盖
+        suffix = itertools.count(2)
+        while os.path.exists(f"{base}.txt"):
+            base = f"{base.rsplit('~', 1)[0]}~{next(suffix)}"
+        by_phase = Counter()
+        with open(f"{base}_accounts.collapsed", 'w', encoding='utf-8') as f:
+            for (account, phase, stack), count in self.samples.items():
+                by_phase[(phase, stack)] += count
+                f.write(f"{str(account).replace(';', ':')};{phase};{';'.join(stack)} {count}\n")
+        with open(f"{base}_phases.collapsed", 'w', encoding='utf-8') as f:
+            for (phase, stack), count in by_phase.items():
+                f.write(f"{phase};{';'.join(stack)} {count}\n")
+        if self.peak_snapshot is not None:
+            # 可用tracemalloc.Snapshot.load()读取，按traceback/filename等方式进一步分析
+            self.peak_snapshot.dump(f"{base}.tracemalloc")
+        path = f"{base}.txt"
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(self.report())
+        logging.info(f"[性能分析]已写入{path}")
+        return path
+
+    def report(self):
+        """
+        :return: 文字汇总：各阶段采样数、最耗时的函数、最耗时的账号、内存增量和峰值时的最大分配位置
+        """
+        total = sum(self.samples.values())
+        lines = [f"性能分析 {self.name}：运行{time.monotonic() - self.started:.1f}秒，每{self.interval * 1000:g}毫秒采样一次，"
+                 f"共{total}个线程采样（墙钟时间，等待网络的时间也计入）", ""]
+
+        def table(title, counter, size=False):
+            lines.append(f"== {title} ==")
+            for key, value in counter.most_common(PROFILE_TOP):
+                if size:
+                    lines.append(f"{value / 1024:>10.1f} KiB  {key}")
+                else:
+                    lines.append(f"{value:>8} {value / max(total, 1):>7.1%}  {key}")
+            lines.append("")
+
+        phases, accounts, own, inclusive = Counter(), Counter(), Counter(), Counter()
+        phase_own = {}
+        for (account, phase, stack), count in self.samples.items():
+            phases[phase] += count
+            if account != "-":
+                accounts[account] += count
+            if stack:
+                own[stack[-1]] += count
+                phase_own.setdefault(phase, Counter())[stack[-1]] += count
+            for label in set(stack):
+                inclusive[label] += count
+        table("各阶段", phases)
+        table("最耗时的函数（自身）", own)
+        table("最耗时的函数（含调用的函数）", inclusive)
+        for phase, _ in phases.most_common():
+            lines.append(f"-- 阶段 {phase} --")
+            for label, count in phase_own[phase].most_common(5):
+                lines.append(f"{count:>8} {count / max(phases[phase], 1):>7.1%}  {label}")
+            lines.append("")
+        table("采样最多的账号", accounts)
+
+        if self.allocations:
+            peak = tracemalloc.get_traced_memory()[1] if tracemalloc.is_tracing() else self.peak
+            lines.append(f"内存峰值 {peak / 1024 / 1024:.1f} MiB")
+            if self.overlapped:
+                lines.append("多个账号或站点同时执行，tracemalloc只能统计整个进程的内存，增量无法归属到账号和阶段，不输出各阶段和账号的内存增量；"
+                             "需要时设置SXSY_WORKERS=1并只运行一个站点")
+                lines.append("")
+            else:
+                lines.append("各阶段和账号的增量为阶段结束时减开始时的进程内存，包含同一时间其他线程（如验证码识别）的分配和释放，"
+                             "不是该阶段自身的分配，数值不可靠，只用于比较")
+                lines.append("")
+                table("各阶段内存增量", self.group_allocations(1), True)
+                accounts = self.group_allocations(0)
+                accounts.pop("-", None)
+                table("内存增量最多的账号", accounts, True)
+        if self.peak_snapshot is not None:
+            lines.append("== 内存峰值时的最大分配位置 ==")
+            for stat in self.peak_snapshot.statistics("lineno")[:PROFILE_TOP]:
+                frame = stat.traceback[0]
+                lines.append(f"{stat.size / 1024:>10.1f} KiB {stat.count:>8}次  {frame.filename}:{frame.lineno}")
+            lines.append("")
+        return "\n".join(lines)
+
+    def group_allocations(self, index):
+        """
+        :param index: 0按账号，1按阶段
+        :return: {账号或阶段: 内存增量}
+        """
+        grouped = Counter()
+        for key, size in self.allocations.items():
+            grouped[key[index]] += size
+        return grouped
+
+
+class CookieStore:
+    """
+    账号会话存储
+    使用SQLite（WAL模式）按账号保存cookie，单条记录原子更新，支持过期时间和单账号失效
+    """
+    def __init__(self, path, site_name):
+        """
+        :param path: 数据库文件路径
+        :param site_name: 站点名称
+        """
+        self.path = path
+        self.site_name = site_name
+        self.lock = threading.Lock() # 同一连接在多个线程间共用
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                site TEXT NOT NULL,
+                account TEXT NOT NULL,
+                cookies TEXT NOT NULL,
+                host TEXT,
+                valid INTEGER NOT NULL DEFAULT 1,
+                expires_at REAL,
+                updated_at REAL NOT NULL,
+                update_time TEXT,
+                proxy TEXT,
+                issued_at REAL,
+                formhash TEXT,
+                uid TEXT,
+                money TEXT,
+                money_at REAL,
+                PRIMARY KEY (site, account)
+            )
+        """)
+        # 旧版数据库没有proxy、issued_at、formhash、uid、money、money_at列
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(sessions)")]
+        for column, column_type in (('proxy', 'TEXT'), ('issued_at', 'REAL'), ('formhash', 'TEXT'), ('uid', 'TEXT'), ('money', 'TEXT'),
+                                    ('money_at', 'REAL')):
+            if column not in columns:
+                self.conn.execute(f"ALTER TABLE sessions ADD COLUMN {column} {column_type}")
+        # host列只保存账号指定的域名；旧版（user_version为0）保存的是当时自动获取的镜像，清空以免固定到该镜像
+        if self.conn.execute("PRAGMA user_version").fetchone()[0] < 1:
+            self.conn.execute("UPDATE sessions SET host = NULL")
+            self.conn.execute("PRAGMA user_version = 1")
+        # 签到记录，每个账号保留最近一次的结果
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS sign_ledger (
+                site TEXT NOT NULL,
+                account TEXT NOT NULL,
+                sign_date TEXT NOT NULL,
+                status TEXT NOT NULL,
+                reward TEXT,
+                money TEXT,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (site, account)
+            )
+        """)
+        # 验证码识别结果，按图片哈希保存，与站点无关
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS ocr_cache (
+                hash TEXT PRIMARY KEY,
+                candidates TEXT NOT NULL,
+                used_at REAL NOT NULL
+            )
+        """)
+
+    def for_site(self, site_name):
+        """
+        同一数据库中另一个站点的存储，共用连接，多个站点同时运行时使用
+        :param site_name: 站点名称
+        :return: CookieStore
+        """
+        store = copy.copy(self)
+        store.site_name = site_name
+        return store
+
+    def migrate_json(self, json_file):
+        """
+        从旧版cookie json文件迁移，迁移后文件重命名为.migrated
+        已存在的账号不会被覆盖；文件中的host是自动获取的镜像，不保存
+        :param json_file: json文件路径
+        """
+        if not os.path.exists(json_file):
+            return
+        with open(json_file, 'r', encoding='utf-8') as f:
+            cookie_data = json.load(f)
+        accounts = cookie_data.get('accounts') or {}
+        now = time.time()
+        with self.lock:
+            self.conn.execute("BEGIN")
+            try:
+                for account, data in accounts.items():
+                    self.conn.execute(
+                        "INSERT OR IGNORE INTO sessions (site, account, cookies, updated_at, update_time) VALUES (?, ?, ?, ?, ?)",
+                        (self.site_name, account, data['cookies'], now, data.get('update_time'))
+                    )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        os.replace(json_file, json_file + ".migrated")
+        logging.info(f"[Cookie存储]已从{json_file}迁移{len(accounts)}个账号")
+
+    def count(self):
+        """
+        :return: 有效账号数
+        """
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT COUNT(*) FROM sessions WHERE site = ? AND valid = 1 AND (expires_at IS NULL OR expires_at > ?)",
+                (self.site_name, time.time())
+            ).fetchone()
+        return row[0]
+
+    def accounts(self):
+        """
+        按账号逐条读取有效会话
+        :return: 生成器，(账号, {'cookies', 'host', 'proxy', 'issued_at', 'expires_at', 'update_time', 'formhash', 'uid', 'money', 'money_at'})
+        """
+        # 先取出账号列表，逐条读取，避免长时间占用连接
+        with self.lock:
+            keys = [row[0] for row in self.conn.execute(
+                "SELECT account FROM sessions WHERE site = ? AND valid = 1 AND (expires_at IS NULL OR expires_at > ?) ORDER BY rowid",
+                (self.site_name, time.time())
+            )]
+        for account in keys:
+            data = self.get(account)
+            if data:
+                yield account, data
+
+    def get(self, account):
+        """
+        读取单个账号的有效会话
+        :param account: 账号标识
+        :return: dict，不存在、已失效或已过期返回None
+        """
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT * FROM sessions WHERE site = ? AND account = ? AND valid = 1 AND (expires_at IS NULL OR expires_at > ?)",
+                (self.site_name, account, time.time())
+            ).fetchone()
+        return dict(row) if row else None
+
+    def upsert(self, account, cookies, host=None, expires_at=None, proxy=None):
+        """
+        写入或更新单个账号的会话
+        :param account: 账号标识
+        :param cookies: cookie字符串
+        :param host: 账号指定的域名，自动获取的镜像不保存
+        :param expires_at: 过期时间戳，None表示未知
+        :param proxy: 该账号使用的代理
+        """
+        now = time.time()
+        with self.lock:
+            # cookie未变化时（如每次运行都写入的cookie账号）保留原来的签发时间和formhash，新会话需要重新获取formhash
+            self.conn.execute("""
+                INSERT INTO sessions (site, account, cookies, host, valid, expires_at, updated_at, update_time, proxy, issued_at)
+                VALUES (?, ?, ?, ?, 1, ?, ?, ?, ?, ?)
+                ON CONFLICT (site, account) DO UPDATE SET
+                    cookies = excluded.cookies, host = excluded.host, valid = 1, expires_at = excluded.expires_at,
+                    updated_at = excluded.updated_at, update_time = excluded.update_time, proxy = excluded.proxy,
+                    issued_at = CASE WHEN sessions.cookies = excluded.cookies THEN sessions.issued_at ELSE excluded.issued_at END,
+                    formhash = CASE WHEN sessions.cookies = excluded.cookies THEN sessions.formhash ELSE NULL END
+            """, (self.site_name, account, cookies, host, expires_at, now, datetime.now().strftime('%Y-%m-%d %H:%M:%S'), proxy, now))
+
+    def merge_from(self, path):
+        """
+        合并另一个数据库（如分片运行产生的）中的会话，同一账号保留更新时间较新的记录
+        多个站点同时运行时共用一个数据库，所有站点一起合并
+        :param path: 数据库文件路径
+        :return: 写入或更新的记录数
+        """
+        with self.lock:
+            self.conn.execute("ATTACH DATABASE ? AS shard", (path,))
+            try:
+                # 旧版数据库没有money_at列
+                shard_columns = {row[1] for row in self.conn.execute("PRAGMA shard.table_info(sessions)")}
+                money_at = "money_at" if "money_at" in shard_columns else "NULL"
+                # 旧版数据库的host是自动获取的镜像
+                host = "host" if self.conn.execute("PRAGMA shard.user_version").fetchone()[0] >= 1 else "NULL"
+                cursor = self.conn.execute(f"""
+                    INSERT INTO sessions (site, account, cookies, host, valid, expires_at, updated_at, update_time, proxy, issued_at,
+                                          formhash, uid, money, money_at)
+                    SELECT site, account, cookies, {host}, valid, expires_at, updated_at, update_time, proxy, issued_at, formhash, uid, money,
+                           {money_at}
+                    FROM shard.sessions WHERE true
+                    ON CONFLICT (site, account) DO UPDATE SET
+                        cookies = excluded.cookies, host = excluded.host, valid = excluded.valid, expires_at = excluded.expires_at,
+                        updated_at = excluded.updated_at, update_time = excluded.update_time, proxy = excluded.proxy,
+                        issued_at = excluded.issued_at, formhash = excluded.formhash, uid = excluded.uid, money = excluded.money,
+                        money_at = excluded.money_at
+                    WHERE excluded.updated_at > sessions.updated_at
+                """)
+                count = cursor.rowcount
+                # 旧版数据库没有签到记录表
+                tables = {row[0] for row in self.conn.execute("SELECT name FROM shard.sqlite_master WHERE type = 'table'")}
+                if 'sign_ledger' in tables:
+                    self.conn.execute("""
+                        INSERT INTO sign_ledger (site, account, sign_date, status, reward, money, updated_at)
+                        SELECT site, account, sign_date, status, reward, money, updated_at
+                        FROM shard.sign_ledger WHERE true
+                        ON CONFLICT (site, account) DO UPDATE SET
+                            sign_date = excluded.sign_date, status = excluded.status, reward = excluded.reward,
+                            money = excluded.money, updated_at = excluded.updated_at
+                        WHERE excluded.updated_at > sign_ledger.updated_at
+                    """)
+                return count
+            finally:
+                self.conn.execute("DETACH DATABASE shard")
+
+    def save_sign_state(self, account, formhash, uid=None, money=None):
+        """
+        保存会话的签到formhash和签到后的uid、金钱，下次运行直接签到，不再获取签到页
+        :param account: 账号标识
+        :param formhash: 签到formhash
+        :param uid: uid，None时保留原值
+        :param money: 从页面读取的签到后金钱，None时保留原值和读取时间
+        """
+        with self.lock:
+            self.conn.execute("""
+                UPDATE sessions SET formhash = ?, uid = COALESCE(?, uid), money = COALESCE(?, money),
+                    money_at = CASE WHEN ? IS NULL THEN money_at ELSE ? END
+                WHERE site = ? AND account = ?
+            """, (formhash, uid, money, money, time.time(), self.site_name, account))
+
+    def due_for_refresh(self, before):
+        """
+        读取需要提前重新登录的账号：已失效，或剩余有效期少于before
+        有效期未知的会话（直接使用的cookie）不包括在内
+        :param before: 剩余有效期阈值（秒）
+        :return: {账号: 过期时间戳}
+        """
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT account, expires_at FROM sessions WHERE site = ? AND (valid = 0 OR (expires_at IS NOT NULL AND expires_at < ?))",
+                (self.site_name, time.time() + before)
+            ).fetchall()
+        return {row['account']: row['expires_at'] for row in rows}
+
+    def record_sign(self, account, date, status, reward=None, money=None):
+        """
+        写入账号的签到记录
+        :param account: 账号标识
+        :param date: 签到日期
+        :param status: signed/already_signed/failed
+        :param reward: 签到结果文字
+        :param money: 签到后金钱
+        """
+        with self.lock:
+            self.conn.execute("""
+                INSERT INTO sign_ledger (site, account, sign_date, status, reward, money, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (site, account) DO UPDATE SET
+                    sign_date = excluded.sign_date, status = excluded.status, reward = excluded.reward,
+                    money = COALESCE(excluded.money, sign_ledger.money), updated_at = excluded.updated_at
+            """, (self.site_name, account, date, status, reward, money, time.time()))
+
+    def signed_on(self, date):
+        """
+        读取指定日期已签到的账号
+        :param date: 签到日期
+        :return: {账号: {'status', 'reward', 'money'}}
+        """
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT account, status, reward, money FROM sign_ledger WHERE site = ? AND sign_date = ? AND status != 'failed'",
+                (self.site_name, date)
+            ).fetchall()
+        return {row['account']: {'status': row['status'], 'reward': row['reward'], 'money': row['money']} for row in rows}
+
+    def load_ocr_cache(self, limit):
+        """
+        读取最近使用的验证码识别结果
+        :param limit: 最多读取条数
+        :return: [(图片哈希, 读法列表)]，按使用时间从旧到新
+        """
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT hash, candidates FROM ocr_cache ORDER BY used_at DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [(row['hash'], json.loads(row['candidates'])) for row in reversed(rows)]
+
+    def save_ocr_cache(self, entries, removed, limit):
+        """
+        写入验证码识别结果，只保留最近使用的limit条
+        :param entries: [(图片哈希, 读法列表, 使用时间)]
+        :param removed: 需要删除的图片哈希
+        :param limit: 最多保留条数
+        """
+        with self.lock:
+            self.conn.execute("BEGIN")
+            try:
+                self.conn.executemany("DELETE FROM ocr_cache WHERE hash = ?", [(key,) for key in removed])
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO ocr_cache (hash, candidates, used_at) VALUES (?, ?, ?)",
+                    [(key, json.dumps(candidates, ensure_ascii=False), used_at) for key, candidates, used_at in entries]
+                )
+                self.conn.execute(
+                    "DELETE FROM ocr_cache WHERE hash NOT IN (SELECT hash FROM ocr_cache ORDER BY used_at DESC LIMIT ?)", (limit,)
+                )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def invalidate(self, account):
+        """
+        标记单个账号的会话失效
+        :param account: 账号标识
+        """
+        with self.lock:
+            self.conn.execute(
+                "UPDATE sessions SET valid = 0, updated_at = ? WHERE site = ? AND account = ?",
+                (time.time(), self.site_name, account)
+            )
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+class OcrBackend:
+    """
+    验证码识别后端
+    local为True的后端直接接收图片字节，不需要base64编码和网络请求
+    """
+    name = "base"
+    local = False
+
+    def recognize(self, image):
+        """
+        识别单张验证码
+        :param image: 图片字节
+        :return: 验证码文字，失败返回None
+        """
+        return self.recognize_batch([image])[0]
+
+    def recognize_batch(self, images):
+        """
+        批量识别验证码
+        :param images: 图片字节列表
+        :return: 验证码文字列表，与images顺序一致
+        """
+        raise NotImplementedError
+
+    def recognize_candidates(self, image):
+        """
+        识别单张验证码，返回按可能性排序的多个读法
+        :param image: 图片字节
+        :return: 验证码文字列表，失败返回空列表
+        """
+        return self.recognize_candidates_batch([image])[0]
+
+    def recognize_candidates_batch(self, images):
+        """
+        批量识别验证码，后端不支持多个读法时只返回最佳读法
+        :param images: 图片字节列表
+        :return: 每张图片的读法列表，与images顺序一致
+        """
+        return [[text] if text else [] for text in self.recognize_batch(images)]
+
+
+def split_urls(value):
+    """
+    :param value: 逗号、空白或换行分隔的地址
+    :return: 地址列表
+    """
+    return [url for url in re.split(r'[\s,]+', value or "") if url]
+
+
+class OcrEndpoints:
+    """
+    OCR服务地址列表，记录每个地址最近的延迟和正在进行的请求数，多个站点共用
+    按(进行中请求数+1)×平均延迟选择地址，多个账号同时登录时分摊到各个地址，熔断中的地址不参与；
+    请求慢于该地址最近延迟的p90时，对冲请求发给另一个地址
+    """
+    def __init__(self, urls, breaker):
+        """
+        :param urls: 地址列表
+        :param breaker: CircuitBreaker，地址所在主机熔断中时视为不可用
+        """
+        self.urls = urls
+        self.breaker = breaker
+        self.lock = threading.Lock()
+        self.latencies = {url: deque(maxlen=OCR_LATENCY_WINDOW) for url in urls}
+        self.inflight = {url: 0 for url in urls}
+
+    def owns(self, url):
+        """
+        :param url: 请求地址
+        :return: 是否为OCR服务的请求
+        """
+        return any(url.startswith(endpoint) for endpoint in self.urls)
+
+    def healthy(self):
+        """
+        :return: 所在主机未熔断的地址
+        """
+        return [url for url in self.urls if not self.breaker.is_open(urllib.parse.urlsplit(url).netloc)]
+
+    def choose(self, exclude=()):
+        """
+        选择负载最低的地址，没有样本的地址优先（先测出延迟）
+        :param exclude: 不选择的地址（对冲时排除第一个地址）
+        :return: 地址，没有可选地址时返回None；全部熔断时仍返回一个，由熔断器决定是否放行试探请求
+        """
+        candidates = [url for url in self.healthy() if url not in exclude]
+        if not candidates and not exclude:
+            candidates = list(self.urls)
+        if not candidates:
+            return None
+        with self.lock:
+            def load(url):
+                samples = self.latencies[url]
+                mean = sum(samples) / len(samples) if samples else 0.0
+                return (self.inflight[url] + 1) * mean, random.random()
+            return min(candidates, key=load)
+
+    def hedge_delay(self, url):
+        """
+        :param url: 地址
+        :return: 等待多久后发出对冲请求（秒），即该地址最近延迟的p90；样本不足时使用所有地址的样本
+        """
+        with self.lock:
+            samples = sorted(self.latencies[url])
+            if len(samples) < OCR_HEDGE_SAMPLES:
+                samples = sorted(itertools.chain.from_iterable(self.latencies.values()))
+        if len(samples) < OCR_HEDGE_SAMPLES:
+            return OCR_HEDGE_DELAY
+        return samples[math.ceil(len(samples) * 0.9) - 1]
+
+    @contextlib.contextmanager
+    def track(self, url):
+        """
+        统计一次请求：进行中请求数和成功请求的延迟
+        :param url: 地址
+        """
+        with self.lock:
+            self.inflight[url] += 1
+        start = time.monotonic()
+        record = False
+        try:
+            yield
+            record = True
+        except asyncio.CancelledError:
+            # 对冲中落后而被取消的请求，已经等待的时间也作为样本，慢地址的长尾不会被低估
+            record = True
+            raise
+        finally:
+            elapsed = time.monotonic() - start
+            with self.lock:
+                self.inflight[url] -= 1
+                if record:
+                    self.latencies[url].append(elapsed)
+
+
+class HttpOcrBackend(OcrBackend):
+    """
+    远程OCR服务（dddd_ocr接口），表单字段image为图片base64
+    配置了多个地址时按负载选择地址，慢于p90的请求再发给另一个地址（对冲），先返回的结果胜出
+    """
+    name = "http"
+
+    def __init__(self, endpoints, send, workers=8):
+        """
+        :param endpoints: OcrEndpoints
+        :param send: 发送请求的函数，签名同AutoTask.request去掉session参数
+        :param workers: 对冲请求线程数，与同时识别的验证码数相当
+        """
+        self.endpoints = endpoints
+        self.send = send
+        self.workers = workers
+        self.executor = None
+        self.executor_lock = threading.Lock()
+
+    @staticmethod
+    def build_payload(image):
+        return {'image': base64.b64encode(image).decode('utf-8')}
+
+    @staticmethod
+    def parse_result(result):
+        candidates = HttpOcrBackend.parse_candidates(result)
+        return candidates[0] if candidates else None
+
+    @staticmethod
+    def parse_candidates(result):
+        """
+        解析识别结果，data为文字或按可能性排序的文字列表，服务返回candidates字段时追加在后面
+        :param result: 接口返回的json
+        :return: 验证码文字列表
+        """
+        if result['code'] != 200:
+            logging.error(f"[获取验证码]发生错误: {result['message']}")
+            return []
+        data = result.get('data')
+        # 新建列表，不修改result中的data
+        candidates = (list(data) if isinstance(data, list) else [data]) + list(result.get('candidates') or [])
+        return [text for text in candidates if isinstance(text, str) and text]
+
+    def recognize(self, image):
+        candidates = self.recognize_candidates(image)
+        return candidates[0] if candidates else None
+
+    def recognize_batch(self, images):
+        return [candidates[0] if candidates else None for candidates in self.recognize_candidates_batch(images)]
+
+    def post(self, url, payload):
+        """
+        向一个地址发送识别请求
+        :param url: 地址
+        :param payload: 表单
+        :return: 验证码文字列表
+        """
+        with self.endpoints.track(url):
+            response = self.send("POST", url, data=payload)
+            return self.parse_candidates(response.json())
+
+    def pool(self):
+        with self.executor_lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=self.workers * 2, thread_name_prefix="ocr-hedge")
+            return self.executor
+
+    def recognize_candidates(self, image):
+        payload = self.build_payload(image)
+        first = self.endpoints.choose()
+        if first is None:
+            raise RuntimeError("未配置OCR服务地址（DDDD_OCR_URL）")
+        if not OCR_HEDGE or self.endpoints.choose(exclude=(first,)) is None:
+            return self.post(first, payload)
+        # 第一个请求在线程中发送，超过p90仍未返回或失败时再请求另一个地址；落后的请求无法取消，结果丢弃
+        futures = {submit_in_context(self.pool(), self.post, first, payload): first}
+        hedged = False
+        error = None
+        while futures:
+            done, _ = wait(futures, timeout=None if hedged else clamp_timeout(self.endpoints.hedge_delay(first)), return_when=FIRST_COMPLETED)
+            for future in done:
+                futures.pop(future)
+                try:
+                    candidates = future.result()
+                except Exception as e:
+                    error = e
+                    continue
+                if candidates:
+                    return candidates
+            if hedged:
+                continue
+            hedged = True
+            second = self.endpoints.choose(exclude=(first,))
+            if second is None:
+                continue
+            account = current_account.get()
+            if account is not None:
+                account.count_retry("ocr_hedge")
+            futures[submit_in_context(self.pool(), self.post, second, payload)] = second
+        if error is not None:
+            raise error
+        return []
+
+    def recognize_candidates_batch(self, images):
+        if len(images) == 1:
+            return [self.recognize_candidates(images[0])]
+        # 服务端一次只识别一张，批量时并发请求，复用共享连接池
+        with ThreadPoolExecutor(max_workers=len(images), thread_name_prefix="ocr") as executor:
+            return list(executor.map(self.recognize_candidates, images))
+
+
+class LocalOcrBackend(OcrBackend):
+    """
+    进程内识别（ddddocr），模型在第一次使用时加载，之后所有账号共用
+    """
+    name = "local"
+    local = True
+    _model = None
+    _model_lock = threading.Lock()
+
+    @classmethod
+    def model(cls):
+        """
+        :return: 已加载的ddddocr模型
+        """
+        with cls._model_lock:
+            if cls._model is None:
+                if ddddocr is None:
+                    raise RuntimeError("本地识别需要安装ddddocr: pip install ddddocr")
+                start = time.monotonic()
+                cls._model = ddddocr.DdddOcr(show_ad=False)
+                logging.info(f"[OCR]本地模型加载完成，耗时{time.monotonic() - start:.2f}s")
+            return cls._model
+
+    def recognize_batch(self, images):
+        model = self.model()
+        # 同一个模型串行推理，一次加锁处理整批
+        with self._model_lock:
+            return [model.classification(image) or None for image in images]
+
+    def recognize_candidates_batch(self, images):
+        model = self.model()
+        with self._model_lock:
+            return [self.classify_candidates(model, image) for image in images]
+
+    @staticmethod
+    def classify_candidates(model, image, count=OCR_TOP_K):
+        """
+        按每个时间步的概率生成多个读法：最佳路径之外，依次把把握最小的时间步换成第二可能的字符
+        :param model: ddddocr模型
+        :param image: 图片字节
+        :param count: 最多返回的读法数
+        :return: 验证码文字列表
+        """
+        try:
+            result = model.classification(image, probability=True)
+            charsets, steps = result['charsets'], result['probability']
+        except (TypeError, KeyError):
+            # 旧版ddddocr不支持probability参数
+            text = model.classification(image)
+            return [text] if text else []
+
+        def decode(path):
+            # CTC解码：合并相邻重复字符，去掉空白
+            chars = [charsets[index] for position, index in enumerate(path) if position == 0 or index != path[position - 1]]
+            return "".join(chars)
+
+        best, alternatives = [], []
+        for position, probabilities in enumerate(steps):
+            ranked = sorted(range(len(probabilities)), key=probabilities.__getitem__, reverse=True)[:2]
+            best.append(ranked[0])
+            if len(ranked) > 1:
+                alternatives.append((probabilities[ranked[0]] - probabilities[ranked[1]], position, ranked[1]))
+        candidates = [decode(best)]
+        for _, position, index in sorted(alternatives):
+            if len(candidates) >= count:
+                break
+            path = list(best)
+            path[position] = index
+            text = decode(path)
+            if text and text not in candidates:
+                candidates.append(text)
+        return [text for text in candidates if text]
+
+
+class OcrBatcher(OcrBackend):
+    """
+    合并多个账号同时发起的识别请求，凑批后一次调用后端
+    """
+    name = "batch"
+
+    def __init__(self, backend, batch_size, wait=OCR_BATCH_WAIT):
+        """
+        :param backend: 实际识别后端
+        :param batch_size: 每批最多图片数
+        :param wait: 凑批最长等待时间（秒）
+        """
+        self.backend = backend
+        self.local = backend.local
+        self.batch_size = batch_size
+        self.wait = wait
+        self.queue = queue.Queue()
+        threading.Thread(target=self.loop, name="ocr-batcher", daemon=True).start()
+
+    def recognize(self, image):
+        candidates = self.recognize_candidates(image)
+        return candidates[0] if candidates else None
+
+    def recognize_batch(self, images):
+        return self.backend.recognize_batch(images)
+
+    def recognize_candidates(self, image):
+        future = Future()
+        self.queue.put((image, future))
+        return future.result(timeout=clamp_timeout(OCR_TIMEOUT * 2))
+
+    def recognize_candidates_batch(self, images):
+        return self.backend.recognize_candidates_batch(images)
+
+    def loop(self):
+        """
+        后台线程：取出第一张后在wait时间内继续凑批
+        """
+        while True:
+            items = [self.queue.get()]
+            deadline = time.monotonic() + self.wait
+            while len(items) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    items.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                results = self.backend.recognize_candidates_batch([image for image, _ in items])
+            except Exception as e:
+                for _, future in items:
+                    future.set_exception(e)
+                continue
+            for (_, future), result in zip(items, results):
+                future.set_result(result)
+
+
+def otsu_threshold(pixels):
+    """
+    大津法求二值化阈值：使前景和背景两类灰度的类间方差最大
+    :param pixels: 灰度图数组
+    :return: 阈值，灰度不大于阈值的为一类
+    """
+    histogram = numpy.bincount(pixels.ravel(), minlength=256) / pixels.size
+    levels = numpy.arange(256)
+    weight = numpy.cumsum(histogram)
+    mean = numpy.cumsum(histogram * levels)
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        variance = (mean[-1] * weight - mean) ** 2 / (weight * (1 - weight))
+    return int(numpy.argmax(numpy.nan_to_num(variance, nan=0.0, posinf=0.0)))
+
+
+def neighbour_count(ink):
+    """
+    :param ink: 二值图数组（True为字符）
+    :return: 每个像素8邻域中的字符像素数
+    """
+    height, width = ink.shape
+    padded = numpy.pad(ink, 1).astype(numpy.uint8)
+    return sum(padded[1 + dy:1 + dy + height, 1 + dx:1 + dx + width]
+               for dy in (-1, 0, 1) for dx in (-1, 0, 1) if dy or dx)
+
+
+def remove_noise(ink):
+    """
+    去除干扰线和噪点
+    干扰线宽1像素：上下都是背景或左右都是背景的像素属于细线，字符笔画较粗，边缘像素另一侧仍是字符，不受影响
+    :param ink: 二值图数组（True为字符）
+    :return: 去噪后的二值图数组
+    """
+    padded = numpy.pad(ink, 1)
+    vertical = padded[:-2, 1:-1] | padded[2:, 1:-1]
+    horizontal = padded[1:-1, :-2] | padded[1:-1, 2:]
+    ink = ink & vertical & horizontal
+    # 去掉细线留下的孤立噪点
+    return ink & (neighbour_count(ink) >= 2)
+
+
+def preprocess_captcha(image):
+    """
+    验证码预处理：灰度化、二值化、去除干扰线和噪点、裁剪到字符区域
+    在预处理进程中执行，只使用numpy数组运算，不逐像素循环
+    :param image: 图片字节
+    :return: 黑字白底的PNG图片字节，无法解码或没有字符时返回原图
+    """
+    try:
+        with Image.open(io.BytesIO(image)) as picture:
+            pixels = numpy.asarray(picture.convert("L"), dtype=numpy.uint8)
+    except Exception:
+        return image
+    if pixels.size == 0:
+        return image
+    ink = pixels <= otsu_threshold(pixels)
+    # 字符像素总是少数，浅色字深色底时反转
+    if ink.mean() > 0.5:
+        ink = ~ink
+    ink = remove_noise(ink)
+    rows = numpy.flatnonzero(ink.any(axis=1))
+    columns = numpy.flatnonzero(ink.any(axis=0))
+    if not rows.size:
+        return image
+    ink = ink[max(rows[0] - PREPROCESS_MARGIN, 0):rows[-1] + PREPROCESS_MARGIN + 1,
+              max(columns[0] - PREPROCESS_MARGIN, 0):columns[-1] + PREPROCESS_MARGIN + 1]
+    buffer = io.BytesIO()
+    Image.fromarray(numpy.where(ink, 0, 255).astype(numpy.uint8)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class CaptchaPreprocessor:
+    """
+    验证码预处理进程池，整批图片分块交给多个进程，同步模式的单张图片直接在当前线程处理（进程间传输比处理本身更慢）
+    进程池在第一次使用时创建，之后所有账号和站点共用
+    """
+    def __init__(self, workers):
+        """
+        :param workers: 进程数，0为不使用进程池
+        """
+        self.workers = workers
+        self.pool = None
+        self.lock = threading.Lock()
+
+    def executor(self):
+        """
+        :return: 进程池，不使用进程池时返回None
+        """
+        with self.lock:
+            if self.pool is None and self.workers > 0:
+                # 运行时已有多个线程，fork会复制其他线程持有的锁，子进程使用spawn启动
+                self.pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+            return self.pool
+
+    def process_batch(self, images):
+        """
+        :param images: 图片字节列表
+        :return: 处理后的图片字节列表，与images顺序一致
+        """
+        pool = self.executor() if len(images) > 1 else None
+        if pool is None:
+            return [preprocess_captcha(image) for image in images]
+        chunksize = math.ceil(len(images) / self.workers)
+        return list(pool.map(preprocess_captcha, images, chunksize=chunksize, timeout=clamp_timeout(OCR_TIMEOUT)))
+
+    def close(self):
+        with self.lock:
+            pool, self.pool = self.pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+class PreprocessingBackend(OcrBackend):
+    """
+    识别前先预处理验证码，放在OcrBatcher内层，凑成一批的图片一起预处理
+    预处理失败时使用原图识别
+    """
+    name = "preprocess"
+
+    def __init__(self, backend, preprocessor):
+        """
+        :param backend: 实际识别后端
+        :param preprocessor: CaptchaPreprocessor
+        """
+        self.backend = backend
+        self.local = backend.local
+        self.preprocessor = preprocessor
+
+    def prepare(self, images):
+        try:
+            return self.preprocessor.process_batch(images)
+        except Exception as e:
+            logging.error(f"[验证码预处理]发生错误，使用原图识别: {str(e)}", exc_info=True)
+            return images
+
+    def recognize_batch(self, images):
+        return self.backend.recognize_batch(self.prepare(images))
+
+    def recognize_candidates_batch(self, images):
+        return self.backend.recognize_candidates_batch(self.prepare(images))
+
+
+def expand_candidates(candidates, limit):
+    """
+    去重并补全候选读法：OCR只给出一个读法时，依次把容易混淆的字符换成另一个
+    :param candidates: OCR返回的读法列表，按可能性排序
+    :param limit: 最多返回的读法数
+    :return: 读法列表
+    """
+    result = []
+    for text in candidates:
+        if text and text not in result:
+            result.append(text)
+    if result:
+        best = result[0]
+        for position, char in enumerate(best):
+            if len(result) >= limit:
+                break
+            other = OCR_CONFUSIONS.get(char.lower())
+            if other:
+                text = best[:position] + other + best[position + 1:]
+                if text not in result:
+                    result.append(text)
+    return result[:limit]
+
+
+class OcrCache:
+    """
+    验证码识别结果缓存，按图片内容哈希索引，保存按可能性排序的读法
+    同一张图片再次出现时不再调用OCR，读法被网站确认后排到最前面，全部读法都错时删除
+    """
+    def __init__(self, capacity):
+        """
+        :param capacity: 最多缓存条数，超出时淘汰最久未使用的
+        """
+        self.capacity = capacity
+        self.lock = threading.Lock()
+        self.entries = OrderedDict() # {图片哈希: [读法列表, 使用时间]}
+        self.changed = set()
+        self.removed = set()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key_of(image):
+        return hashlib.sha1(image).hexdigest()
+
+    def load(self, store):
+        """
+        从数据库读取上次运行保存的结果
+        :param store: CookieStore
+        """
+        with self.lock:
+            for key, candidates in store.load_ocr_cache(self.capacity):
+                self.entries[key] = [candidates, time.time()]
+
+    def save(self, store):
+        """
+        把本次运行新增或变化的结果写入数据库
+        :param store: CookieStore
+        """
+        with self.lock:
+            entries = [(key, *self.entries[key]) for key in self.changed if key in self.entries]
+            removed = list(self.removed)
+            self.changed.clear()
+            self.removed.clear()
+        if entries or removed:
+            store.save_ocr_cache(entries, removed, self.capacity)
+
+    def get(self, key):
+        """
+        :param key: 图片哈希
+        :return: 读法列表，未缓存返回None
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            entry[1] = time.time()
+            self.entries.move_to_end(key)
+            self.changed.add(key)
+            return list(entry[0])
+
+    def put(self, key, candidates):
+        """
+        :param key: 图片哈希
+        :param candidates: 读法列表
+        """
+        if not candidates:
+            return
+        with self.lock:
+            self.entries[key] = [list(candidates), time.time()]
+            self.entries.move_to_end(key)
+            self.changed.add(key)
+            self.removed.discard(key)
+            while len(self.entries) > self.capacity:
+                old_key, _ = self.entries.popitem(last=False)
+                self.changed.discard(old_key)
+
+    def confirm(self, key, text):
+        """
+        网站确认某个读法正确，以后只使用这个读法
+        :param key: 图片哈希
+        :param text: 正确的读法
+        """
+        self.put(key, [text])
+
+    def discard(self, key):
+        """
+        所有读法都被网站拒绝，删除缓存
+        :param key: 图片哈希
+        """
+        with self.lock:
+            if self.entries.pop(key, None) is not None:
+                self.changed.discard(key)
+                self.removed.add(key)
 
-DDDD_OCR_URL = os.getenv("DDDD_OCR_URL") or "" # dddd_ocr地址
 
 class AutoTask:
-    def __init__(self, site_name):
+    def __init__(self, site_name, max_workers=None, shard=None, profile=None, shared=None):
+        """
+        初始化自动任务类
+        :param site_name: 站点名称，用于日志显示
+        :param max_workers: 并发账号数，默认读取环境变量SXSY_WORKERS
+        :param shard: 分片"序号/总数"，默认读取环境变量SXSY_SHARD
+        :param profile: SiteProfile，默认为尚香书苑
+        :param shared: 同时运行的另一个站点的任务，共用其连接池、OCR后端、限速、熔断和Cookie存储
+        """
+        self.site_name = site_name
+        self.profile = profile or SiteProfile(site_name)
+        self.shared = shared
+        self.shard_index, self.shard_count = parse_shard(SHARD if shard is None else shard)
+        self.cookie_file = f"{site_name}_cookie.json" # 旧版cookie文件，仅用于迁移
+        self.store = shared.store.for_site(site_name) if shared else CookieStore(f"{site_name}_cookie.db", site_name)
+        self.max_workers = max(1, max_workers or MAX_WORKERS)
+        self.host_file = f"{site_name}_host.json"
+        self.host_lock = threading.Lock()
+        self.hosts = [self.profile.default_host] # 可用镜像，按延迟排序
+        self.dead_hosts = set() # 本次运行中连接失败的镜像
+        self.page_cache = weakref.WeakKeyDictionary() # 会话 -> {地址: (已扫描的token名称, token)}
+        self.page_lock = threading.Lock()
+        self.captcha_executor = None # (线程数, 线程池)，所有账号的验证码候选共用
+        self.captcha_lock = threading.Lock()
+        self.session_proxies = weakref.WeakKeyDictionary() # 会话 -> 代理，复制的会话使用同一个代理
+        self.account_sources = []
+        self.signed_today = {} # 签到记录中今日已签到的账号
+        self.ledger_results = []
+        self.ledger_seen = set()
+        self.breaker = shared.breaker if shared else CircuitBreaker(BREAKER_THRESHOLD, BREAKER_COOLDOWN)
+        self.ocr_endpoints = shared.ocr_endpoints if shared else OcrEndpoints(split_urls(DDDD_OCR_URL), self.breaker)
+        self.run_deadline = None
+        self.metrics = RunMetrics()
+        self.metrics_site = False # 多个站点同时运行时指标文件按站点区分
+        self.parallel_sites = False # 与其他站点同时运行，单个账号依次执行时日志也会交错
+        self.scheduler = shared.scheduler if shared else RequestScheduler(parse_limits(RATE_LIMIT), parse_limits(INFLIGHT_LIMIT))
+        self.profiler = shared.profiler if shared else (Profiler(PROFILE_DIR, PROFILE_INTERVAL, PROFILE_MEMORY) if PROFILE_DIR else None)
+        self.setup_logging()
+        self.setup_transport()
+        self.setup_ocr()
+        try:
+            self.store.migrate_json(self.cookie_file)
+        except Exception as e:
+            logging.error(f"[Cookie存储]迁移{self.cookie_file}失败: {str(e)}", exc_info=True)
+
+    def setup_transport(self):
+        """
+        配置共享连接池
+        所有账号会话挂载同一组适配器，按目标主机区分连接池大小，TCP/TLS连接在账号之间复用
+        多个站点同时运行时共用第一个站点的适配器
+        """
+        if self.shared is not None:
+            self.adapters = self.shared.adapters
+        else:
+            # 登录时每个账号最多同时进行 检查+预取 两组验证码候选
+            pool_size = self.max_workers * CAPTCHA_RACE * 2
+            self.adapters = {
+                # 论坛镜像可能有多个，多个站点的镜像也在这里，每个镜像一个连接池
+                'forum': HTTPAdapter(pool_connections=16, pool_maxsize=pool_size),
+                # 发布页每次运行只访问一两次
+                'publish': HTTPAdapter(pool_connections=2, pool_maxsize=2),
+                # OCR服务只有邮箱密码登录的账号使用
+                'ocr': HTTPAdapter(pool_connections=max(1, len(self.ocr_endpoints.urls)), pool_maxsize=pool_size),
+            }
+        # 匿名会话：获取host、OCR识别、推广奖励共用，不保存也不发送cookie
+        self.anon_session = self.new_session()
+        self.anon_session.cookies.set_policy(http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+
+    def setup_ocr(self):
+        """
+        配置验证码识别后端，整个运行期间只创建一次，多个站点共用
+        """
+        if self.shared is not None:
+            self.ocr, self.ocr_cache, self.preprocessor = self.shared.ocr, self.shared.ocr_cache, self.shared.preprocessor
+            return
+        backend = OCR_BACKEND or ("http" if self.ocr_endpoints.urls or ddddocr is None else "local")
+        if backend == "local":
+            self.ocr = LocalOcrBackend()
+        else:
+            self.ocr = HttpOcrBackend(self.ocr_endpoints, lambda method, url, **kwargs: self.request(self.anon_session, method, url, **kwargs),
+                                      self.max_workers)
+        self.preprocessor = None
+        if CAPTCHA_PREPROCESS:
+            if numpy is None or Image is None:
+                logging.warning("[验证码预处理]需要安装numpy和Pillow: pip install numpy pillow，使用原图识别")
+            else:
+                self.preprocessor = CaptchaPreprocessor(PREPROCESS_WORKERS)
+                self.ocr = PreprocessingBackend(self.ocr, self.preprocessor)
+        if OCR_BATCH_SIZE > 1:
+            self.ocr = OcrBatcher(self.ocr, OCR_BATCH_SIZE)
+        self.ocr_cache = OcrCache(OCR_CACHE_SIZE) if OCR_CACHE_SIZE > 0 else None
+        if self.ocr_cache is not None:
+            try:
+                self.ocr_cache.load(self.store)
+            except Exception as e:
+                logging.error(f"[验证码缓存]读取失败: {str(e)}", exc_info=True)
+
+    def save_ocr_cache(self):
+        """
+        保存本次运行的验证码识别结果，下次运行遇到相同图片时直接使用
+        """
+        if self.ocr_cache is None:
+            return
+        try:
+            self.ocr_cache.save(self.store)
+            if self.ocr_cache.hits:
+                logging.info(f"[验证码缓存]命中{self.ocr_cache.hits}次，未命中{self.ocr_cache.misses}次")
+        except Exception as e:
+            logging.error(f"[验证码缓存]保存失败: {str(e)}", exc_info=True)
+
+    def new_session(self, proxy=None):
+        """
+        创建账号会话，cookie jar独立，连接池共享
+        注意不要对会话调用close()，否则会关闭共享的连接池
+        :param proxy: 该账号使用的代理
+        :return: requests.Session
+        """
+        session = requests.Session()
+        session.mount("https://", self.adapters['forum'])
+        session.mount("http://", self.adapters['forum'])
+        if self.profile.publish_url:
+            session.mount(self.profile.publish_url, self.adapters['publish'])
+        for url in self.ocr_endpoints.urls:
+            session.mount(url, self.adapters['ocr'])
+        if proxy:
+            session.proxies = {'http': proxy, 'https': proxy}
+            self.session_proxies[session] = proxy
+        return session
+
+    def observe(self, phase, seconds):
+        """
+        记录阶段耗时，同时计入当前账号
+        :param phase: 阶段名称
+        :param seconds: 耗时（秒）
+        """
+        self.metrics.observe(phase, seconds)
+        account = current_account.get()
+        if account is not None:
+            account.add_phase(phase, seconds)
+
+    @contextlib.contextmanager
+    def timed(self, phase):
+        """
+        统计代码块耗时，同步与异步流程通用
+        :param phase: 阶段名称
+        """
+        start = time.monotonic()
+        token = current_phase.set((phase, start))
+        try:
+            if self.profiler is None:
+                yield
+            else:
+                account = current_account.get()
+                with self.profiler.scope(account.account if account is not None else "-", phase):
+                    yield
+        finally:
+            current_phase.reset(token)
+            self.observe(phase, time.monotonic() - start)
+
+    def start_profile(self):
+        """
+        设置了SXSY_PROFILE时开始性能分析
+        """
+        if self.profiler is not None:
+            self.profiler.start(self.site_name)
+
+    def stop_profile(self):
+        """
+        结束性能分析，多个站点同时运行时由最后结束的站点写出结果
+        """
+        if self.profiler is None:
+            return
+        try:
+            self.profiler.stop()
+        except Exception as e:
+            logging.error(f"[性能分析]写入失败: {str(e)}", exc_info=True)
+
+    def in_shard(self, key):
+        """
+        :param key: 账号标识
+        :return: 账号是否由当前分片处理
+        """
+        return self.shard_count == 1 or shard_of(key, self.shard_count) == self.shard_index
+
+    @property
+    def shard_label(self):
+        return f"，分片{self.shard_index}/{self.shard_count}" if self.shard_count > 1 else ""
+
+    def export_metrics(self, results):
+        """
+        将本次运行的指标写入SXSY_METRICS_FILE，先写临时文件再替换，避免采集到写了一半的文件
+        :param results: AccountResult列表
+        """
+        if not METRICS_FILE:
+            return
+        try:
+            summary = self.summary(results)
+            # 多个分片在同一目录运行时，文件名中的{shard}替换为分片序号
+            path = METRICS_FILE.replace("{shard}", str(self.shard_index))
+            # 多个站点同时运行时，文件名中的{site}替换为站点名称，没有{site}时加在扩展名前
+            if self.metrics_site and "{site}" not in path:
+                root, extension = os.path.splitext(path)
+                path = f"{root}_{{site}}{extension}"
+            write_metrics(path.replace("{site}", self.site_name), summary)
+        except Exception as e:
+            logging.error(f"[指标]写入失败: {str(e)}", exc_info=True)
+
+    def summary(self, results):
+        """
+        汇总本次运行的指标
+        :param results: AccountResult列表
+        :return: RunMetrics.summary()的返回值
+        """
+        summary = self.metrics.summary(self.site_name, results)
+        if self.shard_count > 1:
+            summary['shard'] = f"{self.shard_index}/{self.shard_count}"
+        return summary
+
+    def target_of(self, url):
+        """
+        获取请求的目标类别，超时、连接池和限速都按目标区分
+        :param url: 地址
+        :return: forum/publish/ocr
+        """
+        if self.ocr_endpoints.owns(url):
+            return 'ocr'
+        if self.profile.publish_url and url.startswith(self.profile.publish_url):
+            return 'publish'
+        return 'forum'
+
+    def timeout_for(self, url):
+        """
+        获取请求的(连接, 读取)超时
+        :param url: 地址
+        :return: 超时元组
+        """
+        return TIMEOUTS[self.target_of(url)]
+
+    def ocr_available(self):
+        """
+        所有OCR服务地址都熔断中时不必获取和识别验证码
+        :return: 是否可用
+        """
+        return not (self.ocr_endpoints.urls and not self.ocr.local and not self.ocr_endpoints.healthy())
+
+    def account_deadline(self):
+        """
+        计算新开始的账号的截止时间，不晚于整次运行的截止时间
+        :return: time.monotonic()时间，不限时返回None
+        """
+        deadline = time.monotonic() + ACCOUNT_TIMEOUT if ACCOUNT_TIMEOUT > 0 else None
+        if self.run_deadline is not None:
+            deadline = self.run_deadline if deadline is None else min(deadline, self.run_deadline)
+        return deadline
+
+    def request(self, session, method, url, **kwargs):
+        """
+        发送请求，所有站点请求的统一入口
+        超时不超过当前账号剩余时间；主机熔断中直接失败；
+        镜像连接失败时自动切换到下一个可用镜像并重发请求
+        :param session: 会话对象
+        :param method: 请求方法
+        :param url: 地址
+        :return: requests.Response
+        """
+        host = urllib.parse.urlsplit(url).netloc
+        current = self.resolve_host(host)
+        if current != host:
+            url, kwargs = self.replace_host(url, kwargs, host, current)
+            host = current
+        timeout = kwargs.pop('timeout', None) or self.timeout_for(url)
+        account = current_account.get()
+        while True:
+            if deadline_exceeded():
+                raise DeadlineExceeded(f"已超过时限，未发送请求 {url}")
+            if not self.breaker.allow(host):
+                error = CircuitOpenError(f"{host} 熔断中，未发送请求")
+            else:
+                if account is not None:
+                    account.count_request()
+                try:
+                    # 流式响应在收到响应头后即释放并发名额
+                    with self.scheduler.slot(self.target_of(url), self.site_name):
+                        start = time.monotonic()
+                        response = session.request(method, url, timeout=clamp_timeout(timeout), **kwargs)
+                    self.observe("http", time.monotonic() - start)
+                    self.breaker.record(host, response.status_code < 500)
+                    # 流式读取的响应在extract_tokens中统计
+                    if not kwargs.get('stream'):
+                        record_transfer(len(response.content))
+                    return response
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    self.breaker.record(host, False)
+                    error = e
+            new_host = self.failover_host(host)
+            if not new_host:
+                raise error
+            logging.warning(f"[故障转移]{host} 连接失败，切换到 {new_host}")
+            if account is not None:
+                account.count_retry("failover")
+            url, kwargs = self.replace_host(url, kwargs, host, new_host)
+            host = new_host
+
+    def replace_host(self, url, kwargs, old_host, new_host):
+        """
+        将请求中的域名替换为新镜像
+        :param url: 地址
+        :param kwargs: 请求参数
+        :param old_host: 原域名
+        :param new_host: 新域名
+        :return: 新地址, 新请求参数
+        """
+        url = url.replace(f"://{old_host}", f"://{new_host}", 1)
+        if kwargs.get('headers'):
+            kwargs = dict(kwargs)
+            kwargs['headers'] = {key: value.replace(old_host, new_host) if isinstance(value, str) else value
+                                 for key, value in kwargs['headers'].items()}
+        return url, kwargs
+
+    def setup_logging(self):
+        """
+        配置日志系统，日志由后台线程输出
+        """
+        self.log_handler = configure_logging()
+
+    def account_log_buffer(self):
+        """
+        :return: 多个账号同时执行时为新的日志缓存，否则为None（立即输出）
+        """
+        if LOG_BUFFER and self.log_handler is not None and (self.max_workers > 1 or self.parallel_sites):
+            return []
+        return None
+
+    def flush_account_log(self, buffer):
+        """
+        账号结束后整块输出缓存的日志
+        :param buffer: account_log_buffer返回的缓存
+        """
+        if buffer:
+            self.log_handler.flush_block(buffer)
+
+    def load_account_sources(self):
+        """
+        读取账号来源：环境变量sxsy和账号文件SXSY_ACCOUNTS_FILE（其他站点见站点配置），两者都设置时依次执行
+        :return: AccountSource列表，此时还未读取账号
+        """
+        self.account_sources = []
+        name = self.profile.accounts_env
+        path = self.profile.accounts_file
+        env = os.getenv(name)
+        if env:
+            self.account_sources.append(AccountSource(f"环境变量{name}", text=env))
+        if path:
+            if os.path.exists(path):
+                self.account_sources.append(AccountSource(f"账号文件{path}", path=path))
+            else:
+                logging.error(f"[检查环境变量]账号文件{path}不存在")
+        if not self.account_sources:
+            logging.error(f"[检查环境变量]没有找到环境变量{name}")
+        return self.account_sources
+
+    def check_env(self):
+        """
+        检查环境变量
+        :return: 生成器，逐个返回Account，账号在执行时才读取和校验
+        """
+        for source in self.account_sources or self.load_account_sources():
+            try:
+                yield from source
+            except OSError as e:
+                logging.error(f"[检查环境变量]读取{source.name}发生错误: {str(e)}", exc_info=True)
+
+    def env_accounts(self, finished):
+        """
+        流式读取环境变量和账号文件中待执行的账号
+        :param finished: 已完成的账号标识，跳过
+        :return: 生成器，(序号, Account)
+        """
+        accounts = (account for account in self.check_env()
+                    if account.key not in finished and self.in_shard(account.key) and not self.skip_signed(account.key))
+        return enumerate(accounts, 1)
+
+    def env_jobs(self, accounts, host):
+        """
+        生成环境变量和账号文件中账号的任务参数
+        :param accounts: env_accounts返回的生成器
+        :param host: 自动获取的镜像，账号指定了host时使用指定的
+        :return: 生成器，(序号, 域名, Account)
+        """
+        for index, account in accounts:
+            yield index, account.host or host, account
+
+    def load_signed(self):
+        """
+        读取签到记录中今日已签到的账号，本次运行跳过
+        """
+        self.signed_today = {}
+        self.ledger_results = []
+        self.ledger_seen = set()
+        if not SKIP_SIGNED:
+            return
+        try:
+            self.signed_today = self.store.signed_on(sign_date())
+            if self.signed_today:
+                logging.info(f"[签到记录]今日已有{len(self.signed_today)}个账号签到，本次跳过")
+        except Exception as e:
+            logging.error(f"[签到记录]读取发生错误: {str(e)}", exc_info=True)
+
+    def skip_signed(self, key):
+        """
+        判断账号今日是否已签到，已签到时生成不发送请求的执行结果
+        :param key: 账号标识
+        :return: 是否跳过
+        """
+        record = self.signed_today.get(key)
+        if record is None:
+            return False
+        # 同一账号可能同时出现在Cookie存储和环境变量中，只生成一次结果
+        if key not in self.ledger_seen:
+            self.ledger_seen.add(key)
+            result = AccountResult(key, "ledger")
+            result.status = "success"
+            result.already_signed = True
+            result.message = record['reward'] or ""
+            result.money = record['money']
+            self.ledger_results.append(result)
+        return True
+
+    def take_skipped(self):
+        """
+        :return: 按签到记录跳过的账号结果，取出后清空
+        """
+        results, self.ledger_results = self.ledger_results, []
+        return results
+
+    def record_sign(self, result):
+        """
+        写入签到记录，签到成功的账号当天再次运行时跳过，失败的账号下次运行重试
+        :param result: AccountResult
+        """
+        if result.source not in ("cookie_store", "env") or result.status == "pending":
+            return
+        try:
+            if result.status == "success":
+                status = "already_signed" if result.already_signed else "signed"
+                self.store.record_sign(result.account, sign_date(), status, result.message or None, result.money)
+            else:
+                self.store.record_sign(result.account, sign_date(), "failed")
+        except Exception as e:
+            logging.error(f"[签到记录]写入发生错误: {str(e)}", exc_info=True)
+
+    def pending_accounts(self, finished):
+        """
+        预估待执行的账号数，用于分散开始时间，只在设置了SXSY_START_WINDOW时统计
+        :param finished: 已完成的账号标识
+        :return: 账号数，未设置时间窗口或使用账号文件时返回None
+        """
+        if START_WINDOW <= 0:
+            return None
+        counts = [source.count() for source in self.account_sources]
+        if None in counts:
+            logging.info("[账号来源]账号文件流式读取，无法预估账号数，不分散开始时间")
+            return None
+        count = sum(counts)
+        # 分片按哈希分配，各分片的账号数大致相同
+        return max(-(-count // self.shard_count) - len(finished), 1)
+
+    def read_host_cache(self):
+        """
+        读取host缓存
+        :return: 按延迟排序的host列表，缓存不存在或已过期返回None
+        """
+        try:
+            if not os.path.exists(self.host_file):
+                return None
+            with open(self.host_file, 'r', encoding='utf-8') as f:
+                cache = json.load(f)
+            if time.time() - cache.get('timestamp', 0) > HOST_CACHE_TTL or not cache.get('hosts'):
+                return None
+            return [item['host'] for item in cache['hosts']]
+        except Exception as e:
+            logging.warning(f"[读取host缓存]发生错误: {str(e)}")
+            return None
+
+    def write_host_cache(self, probes):
+        """
+        写入host缓存
+        :param probes: [(host, 延迟秒数)]，已按延迟排序
+        """
+        try:
+            cache = {
+                'site_name': self.site_name,
+                'hosts': [{'host': host, 'latency': round(latency, 3)} for host, latency in probes],
+                'timestamp': time.time(),
+                'update_time': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            }
+            # 多个分片进程可能同时写入，先写临时文件再替换
+            temp_file = f"{self.host_file}.{os.getpid()}.tmp"
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                json.dump(cache, f, ensure_ascii=False, indent=2)
+            os.replace(temp_file, self.host_file)
+        except Exception as e:
+            logging.warning(f"[写入host缓存]发生错误: {str(e)}")
+
+    def parse_hosts(self, text):
+        """
+        从发布页中提取所有候选镜像，默认域名作为兜底候选
+        :param text: 发布页内容
+        :return: 去重后的host列表
+        """
+        hosts = []
+        for host in self.profile.patterns['host'].findall(text) + [self.profile.default_host]:
+            if host not in hosts:
+                hosts.append(host)
+        return hosts
+
+    def probe_host(self, host):
+        """
+        探测镜像是否可用
+        :param host: 域名
+        :return: 响应延迟（秒），不可用返回None
+        """
+        try:
+            headers = {
+                'User-Agent': USER_AGENT,
+                'Host': host
+            }
+            start = time.monotonic()
+            # 不经过self.request：探测的是这个镜像本身，不能切换到其他镜像，结果也不计入熔断
+            response = self.anon_session.get(f"https://{host}/", headers=headers, timeout=HOST_PROBE_TIMEOUT,
+                                             stream=True, allow_redirects=False)
+            latency = time.monotonic() - start
+            response.close()
+            if response.status_code >= 400:
+                return None
+            return latency
+        except requests.RequestException:
+            return None
+
+    def set_hosts(self, hosts):
+        """
+        设置可用镜像列表，第一个为当前使用的镜像
+        :param hosts: 按优先级排序的host列表
+        """
+        with self.host_lock:
+            self.hosts = list(hosts) or [self.profile.default_host]
+            self.dead_hosts = set()
+
+    def resolve_host(self, host):
+        """
+        获取host当前应使用的镜像，已失效的镜像替换为第一个可用镜像
+        :param host: 域名
+        :return: 域名
+        """
+        with self.host_lock:
+            if host not in self.dead_hosts:
+                return host
+            for candidate in self.hosts:
+                if candidate not in self.dead_hosts:
+                    return candidate
+            return host
+
+    def failover_host(self, host):
+        """
+        标记镜像失效并切换到下一个可用镜像
+        :param host: 连接失败的域名
+        :return: 新的域名，不是镜像或没有可用镜像时返回None
+        """
+        with self.host_lock:
+            if host not in self.hosts:
+                return None
+            self.dead_hosts.add(host)
+            for candidate in self.hosts:
+                if candidate not in self.dead_hosts:
+                    return candidate
+            return None
+
+    def get_host(self):
+        """
+        获取host
+        优先使用未过期的缓存；缓存失效时并发探测发布页上的所有镜像，按延迟排序后缓存
+        :return: host
+        """
+        try:
+            hosts = self.read_host_cache()
+            if hosts:
+                self.set_hosts(hosts)
+                logging.info(f"[获取host]{hosts[0]}（缓存）")
+                return hosts[0]
+
+            # 访问发布页，站点没有发布页时只探测默认域名
+            url = self.profile.publish_url
+            candidates = [self.profile.default_host]
+            if url:
+                payload = {}
+                headers = {
+                    'User-Agent': USER_AGENT,
+                    'Host': urllib.parse.urlsplit(url).netloc
+                }
+                try:
+                    response = self.request(self.anon_session, "GET", url, headers=headers, data=payload)
+                    response.raise_for_status()  # 检查响应状态
+                    candidates = self.parse_hosts(response.text)
+                except requests.RequestException as e:
+                    logging.warning(f"[获取host]访问发布页发生网络错误，仅探测默认域名")
+
+            # 并发探测所有候选镜像
+            with ThreadPoolExecutor(max_workers=len(candidates)) as executor:
+                latencies = list(executor.map(self.probe_host, candidates))
+            probes = sorted(
+                [(host, latency) for host, latency in zip(candidates, latencies) if latency is not None],
+                key=lambda item: item[1]
+            )
+            if not probes:
+                logging.warning("[获取host]没有可用的镜像，使用默认域名")
+                self.set_hosts([self.profile.default_host])
+                return self.profile.default_host
+
+            self.write_host_cache(probes)
+            self.set_hosts([host for host, _ in probes])
+            logging.info("[获取host]" + "，".join(f"{host}({latency * 1000:.0f}ms)" for host, latency in probes))
+            return probes[0][0]
+        except Exception as e:
+            logging.error(f"[获取host]发生未知错误: {str(e)}", exc_info=True)
+            return self.profile.default_host
+
+    def get_param(self, host, session):
+        """
+        获取参数
+        :param host: 域名
+        :param session: 会话对象
+        :return: formhash, seccodehash, loginhash
+        """
+        try:
+            # 访问首页
+            url = self.profile.url(host, 'login_form')
+            headers = {
+                'User-Agent': USER_AGENT,
+                'Host': host
+            }
+            response = self.request(session, "GET", url, headers=headers, stream=True)
+            response.raise_for_status()
+
+            # 一次扫描提取三个参数，全部找到后停止读取
+            tokens = extract_tokens(response, self.profile.param_patterns)
+            for name in self.profile.param_patterns:
+                if name not in tokens:
+                    logging.error(f"[获取{name}]无法获取{name}")
+                    return None, None, None
+            return tokens['formhash'], tokens['seccodehash'], tokens['loginhash']
+        except requests.RequestException as e:
+            logging.warning(f"[获取参数]发生网络错误: {str(e)}", exc_info=True)
+            return None, None, None
+        except Exception as e:
+            logging.error(f"[获取参数]发生未知错误: {str(e)}", exc_info=True)
+            return None, None, None
+
+    def get_captcha_img(self, host, seccodehash, session):
+        """
+        获取验证码图片
+        :param host: 域名
+        :param seccodehash: seccodehash
+        :param session: 会话对象
+        :return: 验证码图片字节
+        """
+        try:
+            url = self.profile.url(host, 'seccode', update=random.randint(10000, 99999), seccodehash=seccodehash)
+            headers = {
+                'referer': self.profile.url(host, 'login_page'),
+                'User-Agent': USER_AGENT,
+                'Host': host
+            }
+            response = self.request(session, "GET", url, headers=headers)
+            response.raise_for_status()
+            # 直接返回图片字节，需要base64时由OCR后端编码
+            return response.content
+        except Exception as e:
+            logging.error(f"[获取验证码图片]发生未知错误: {str(e)}", exc_info=True)
+            return None
+
+    def get_captcha_candidates(self, image, key):
+        """
+        获取验证码的候选读法，相同图片直接使用缓存的结果
+        :param image: 验证码图片字节
+        :param key: 图片哈希
+        :return: 按可能性排序的读法列表，失败返回空列表
+        """
+        cached = self.ocr_cache.get(key) if self.ocr_cache is not None else None
+        if cached:
+            return cached
+        try:
+            candidates = expand_candidates(self.ocr.recognize_candidates(image), OCR_TOP_K)
+        except Exception as e:
+            logging.error(f"[获取验证码]发生错误: {str(e)}", exc_info=True)
+            return []
+        if self.ocr_cache is not None:
+            self.ocr_cache.put(key, candidates)
+        return candidates
+
+    def check_candidates(self, candidates, key, check):
+        """
+        按顺序检查同一张验证码的候选读法，第一个通过的胜出
+        读法正确时写入缓存，全部错误时删除缓存
+        :param candidates: 读法列表
+        :param key: 图片哈希
+        :param check: 检查单个读法的函数，返回是否正确
+        :return: (验证码文字, 是否正确)
+        """
+        for position, text in enumerate(candidates):
+            if position:
+                if deadline_exceeded():
+                    break
+                account = current_account.get()
+                if account is not None:
+                    account.count_retry("captcha_candidate")
+            if check(text):
+                if self.ocr_cache is not None and candidates != [text]:
+                    self.ocr_cache.confirm(key, text)
+                return text, True
+        if candidates and self.ocr_cache is not None:
+            self.ocr_cache.discard(key)
+        return (candidates[0] if candidates else None), False
+
+    def check_captcha(self, host, captcha, session, seccodehash):
+        """
+        检查验证码
+        :param host: 域名
+        :param captcha: 验证码文字
+        :param session: 会话对象
+        :param seccodehash: seccodehash
+        :return: 是否正确
+        """
+        try:
+            url = self.profile.url(host, 'seccode_check', seccodehash=seccodehash, captcha=captcha)
+            headers = {
+                'referer': self.profile.url(host, 'login_page'),
+                'User-Agent': USER_AGENT,
+                'Host': host
+            }
+            response = self.request(session, "GET", url, headers=headers)
+            response.raise_for_status()
+
+            match = CDATA_PATTERN.search(response.text)
+            if match:
+                text = match.group(1)
+                if self.profile.markers['captcha_ok'] in text:
+                    return True
+                else:
+                    return False
+            else:
+                logging.warning("[检查验证码]响应格式异常")
+                return False
+        except requests.RequestException as e:
+            logging.error(f"[检查验证码]发生网络错误: {str(e)}", exc_info=True)
+            return False
+        except Exception as e:
+            logging.error(f"[检查验证码]发生未知错误: {str(e)}", exc_info=True)
+            return False
+
+    def login_in(self, host, username, password, formhash, captcha, session, loginhash, seccodehash):
+        """
+        登录
+        :param host: 域名
+        :param username: 邮箱
+        :param password: 密码
+        :param formhash: formhash
+        :param captcha: 验证码文字
+        :param session: 会话对象
+        :param loginhash: loginhash
+        :param seccodehash: seccodehash
+        :return: 是否成功
+        """
+        try:
+            url = self.profile.url(host, 'login_submit', loginhash=loginhash)
+            referer = self.profile.url(host, 'credit')
+            payload = self.profile.login_form(username, password, formhash, captcha, seccodehash, referer)
+            headers = {
+                'Referer': referer,
+                'content-type': 'application/x-www-form-urlencoded',
+                'User-Agent': USER_AGENT,
+                'Host': host
+            }
+            response = self.request(session, "POST", url, headers=headers, data=payload)
+            response.raise_for_status()
+            match = CDATA_PATTERN.search(response.text)
+            if match:
+                text = match.group(1)
+                if self.profile.markers['login_ok'] in text:
+                    # 匹配
+                    username_match = self.profile.patterns['username'].search(text)
+                    if username_match:
+                        matched_username = username_match.group(1)
+                        logging.info(f"[登录]成功，当前账号: {matched_username}")
+                        return True
+                else:
+                    logging.warning("[登录]登录失败")
+                    return False
+            else:
+                logging.warning("[登录]响应格式异常")
+                return False
+        except requests.RequestException as e:
+            logging.error(f"[登录]发生网络错误: {str(e)}", exc_info=True)
+            return False
+        except Exception as e:
+            logging.error(f"[登录]发生未知错误: {str(e)}", exc_info=True)
+            return False
+
+    def get_page_tokens(self, session, url, headers, patterns, stop_on=()):
+        """
+        获取页面中的token，同一会话内已扫描过的页面直接使用结果
+        :param session: 会话对象
+        :param url: 地址
+        :param headers: 请求头
+        :param patterns: {名称: 编译后的正则}
+        :param stop_on: 找到其中任意一个名称即结束
+        :return: {名称: 匹配内容}
+        """
+        with self.page_lock:
+            cached = self.page_cache.get(session, {}).get(url)
+        if cached is not None and set(patterns) <= cached[0]:
+            return {name: value for name, value in cached[1].items() if name in patterns}
+        response = self.request(session, "GET", url, headers=headers, stream=True)
+        response.raise_for_status()
+        tokens = extract_tokens(response, patterns, stop_on=stop_on)
+        with self.page_lock:
+            self.page_cache.setdefault(session, {})[url] = (set(patterns), tokens)
+        return tokens
+
+    def clear_page_cache(self, session):
+        """
+        清除会话的页面缓存，签到等改变账号状态的操作之后调用
+        :param session: 会话对象
+        """
+        with self.page_lock:
+            self.page_cache.pop(session, None)
+
+    def get_sign_page(self, host, session):
+        """
+        获取签到页信息
+        :param host: 域名
+        :param session: 会话对象
+        :return: {'formhash', 'uid', 'money', 'login_required'}中找到的部分，失败返回None
+        """
+        try:
+            url = self.profile.url(host, 'sign_page')
+            headers = {
+                'User-Agent': USER_AGENT,
+                'Host': host
+            }
+            # 出现登录提示即可结束，否则找全formhash、uid、金钱后结束
+            page = self.get_page_tokens(session, url, headers, self.profile.sign_page_patterns, stop_on=('login_required',))
+            if 'formhash' not in page and 'login_required' not in page:
+                logging.warning("[获取签到hash]无法获取签到hash")
+            return page
+        except requests.RequestException as e:
+            logging.error(f"[获取签到hash]发生网络错误: {str(e)}", exc_info=True)
+            return None
+
+    def signin(self, host, session, sign_hash):
+        """
+        签到
+        :param host: 域名
+        :param session: 会话对象
+        :param sign_hash: 签到hash
+        :return: 签到结果文字
+        """
+        try:
+            if not sign_hash:
+                logging.error("sign_hash为空，无法进行签到")
+                return None
+
+            url = self.profile.url(host, 'sign', formhash=sign_hash)
+            payload = {}
+            headers = {
+                'User-Agent': USER_AGENT,
+                'Host': host
+            }
+            response = self.request(session, "GET", url, headers=headers)
+            response.raise_for_status()
+            # 匹配CDATA中的内容
+            match = CDATA_PATTERN.search(response.text)
+            if match:
+                text = match.group(1)
+                logging.info(f"[签到]{text}")
+                return text
+            else:
+                logging.warning("[签到]响应格式异常")
+                return None
+        except requests.RequestException as e:
+            logging.error(f"[签到]发生网络错误: {str(e)}", exc_info=True)
+            return None
+        except Exception as e:
+            logging.error(f"[签到]发生未知错误: {str(e)}", exc_info=True)
+            return None
+
+    def get_user_info(self, host, session, print_info=False):
+        """
+        获取用户信息
+        :param host: 域名
+        :param session: 会话对象
+        :param print_info: 是否打印信息
+        :return: uid, 金钱
+        """
+        try:
+            url = self.profile.url(host, 'credit')
+            headers = {
+                'User-Agent': USER_AGENT,
+                'Host': host
+            }
+            # 匹配金钱数量和uid
+            tokens = self.get_page_tokens(session, url, headers, self.profile.user_info_patterns)
+            if 'money' in tokens:
+                money = tokens['money']
+                uid = tokens['uid']
+                if print_info:
+                    logging.info(f"您现有金钱 {money}")
+                return uid, money
+            logging.warning("[获取用户信息]无法获取用户金钱信息")
+            return None, None
+        except requests.RequestException as e:
+            logging.error(f"[获取用户信息]发生网络错误: {str(e)}", exc_info=True)
+            return None, None
+        except Exception as e:
+            logging.error(f"[获取用户信息]发生未知错误: {str(e)}", exc_info=True)
+            return None, None
+
+    def get_promotion_reward(self, host, uid):
+        """
+        获取推广奖励
+        :param host: 域名
+        :param uid: uid
+        """
+        try:
+            url = self.profile.url(host, 'promotion', uid=uid)
+            if not url:
+                return
+            headers = {
+                'User-Agent': USER_AGENT,
+                'Host': host,
+                'Referer': f'https://{host}/fromuid={uid}'
+            }
+            # 不带cookie直接访问，匿名会话不保存也不发送cookie
+            response = self.request(self.anon_session, "GET", url, headers=headers)
+            response.raise_for_status()
+        except requests.RequestException as e:
+            logging.error(f"[获取推广奖励]发生网络错误: {str(e)}", exc_info=True)
+        except Exception as e:
+            logging.error(f"[获取推广奖励]发生未知错误: {str(e)}", exc_info=True)
+
+    def money_after_sign(self, money, sign_text):
         """
-        初始化自动任务类
-        :param site_name: 站点名称，用于日志显示
+        根据签到前金钱和签到结果推算签到后金钱
+        :param money: 签到前金钱
+        :param sign_text: 签到结果文字
+        :return: 签到后金钱，无法推算返回None
         """
-        self.site_name = site_name
-        self.cookie_file = f"{site_name}_cookie.json"
-        self.setup_logging()
+        if money is None or sign_text is None:
+            return None
+        if self.profile.patterns['already_signed'].search(sign_text):
+            return money
+        match = self.profile.patterns['sign_reward'].search(sign_text)
+        if match:
+            return str(int(money) + int(match.group(1)))
+        return None
 
-    def setup_logging(self):
+    def cached_sign_state(self, cached):
         """
-        配置日志系统
+        直接签到时没有签到前金钱，不用保存的金钱推算，避免误差逐日累积
+        :param cached: 已保存的账号会话数据
+        :return: 可以直接签到时为签到页信息{'formhash', 'uid', 'money', 'money_due'}，否则返回None
+            money为None，money_due表示保存的金钱已超过SXSY_MONEY_REFRESH_DAYS天未读取，需要请求积分页
         """
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(levelname)s\t- %(message)s',
-            datefmt='%Y-%m-%d %H:%M:%S',
-            handlers=[
-                # logging.FileHandler(f'{self.site_name}_{datetime.now().strftime("%Y%m%d")}.log', encoding='utf-8'), # 保存日志
-                logging.StreamHandler()
-            ]
-        )
+        if not FORMHASH_CACHE or not cached or not cached.get('formhash'):
+            return None
+        money_at = cached.get('money_at')
+        money_due = money_at is None or time.time() - money_at >= MONEY_REFRESH_DAYS * 86400
+        return {'formhash': cached['formhash'], 'uid': cached.get('uid'), 'money': None, 'money_due': money_due}
 
-    def check_env(self):
+    def check_cached_sign(self, sign_text):
         """
-        检查环境变量
-        :return: 邮箱和密码，或者cookie
+        检查使用已保存formhash直接签到的结果
+        :param sign_text: 签到结果文字
+        :return: cookie_expired（需要登录）、stale（formhash失效或没有结果，需要获取签到页）或None（签到完成）
+        """
+        if sign_text is None:
+            logging.warning("[签到]直接签到没有结果，重新获取签到页")
+        elif self.profile.patterns['login_required'].search(sign_text):
+            return "cookie_expired"
+        elif self.profile.patterns['formhash_invalid'].search(sign_text):
+            logging.warning("[签到]保存的formhash已失效，重新获取签到页")
+        else:
+            return None
+        account = current_account.get()
+        if account is not None:
+            account.count_retry("formhash")
+        return "stale"
+
+    def save_sign_state(self, result, formhash, uid, money):
         """
+        保存签到formhash、uid和签到后金钱，下次运行直接签到
+        :param result: AccountResult
+        :param formhash: 签到formhash
+        :param uid: uid
+        :param money: 签到后金钱
+        """
+        if result is None or not formhash:
+            return
         try:
-            env = os.getenv("sxsy")
-            if not env:
-                logging.error("[检查环境变量]没有找到环境变量sxsy")
-                return
-            # 多个账号用换行分割
-            envs = env.split('\n')
-            for env in envs:
-                if '&' in env:
-                    # 解析cookie字符串，提取邮箱和密码
-                    email, password = env.split('&')
-                    yield email, password, None
-                else:
-                    # 直接使用cookie
-                    yield None, None, env
+            self.store.save_sign_state(result.account, formhash, uid, money)
         except Exception as e:
-            logging.error(f"[检查环境变量]发生错误: {str(e)}\n{traceback.format_exc()}")
-            raise
+            logging.error(f"[Cookie存储]保存formhash发生错误: {str(e)}", exc_info=True)
 
-    def get_host(self):
+    def do_task(self, host, session, result=None, cached=None):
         """
-        获取host
-        :return: host
+        执行任务
+        已保存formhash时直接签到，签到结果显示formhash失效时才获取签到页；
+        签到页一次请求即可判断登录状态，并取得formhash、uid和签到前金钱；
+        获取了签到页时签到后金钱由签到奖励推算，推算不出或缺少uid时才请求积分页；
+        直接签到时不推算金钱，只在保存的金钱超过SXSY_MONEY_REFRESH_DAYS天未读取时请求积分页
+        :param host: 域名
+        :param session: 会话对象
+        :param result: AccountResult，记录签到结果和金钱
+        :param cached: 已保存的账号会话数据，包含上次的formhash、uid和金钱
+        :return: 状态 success/cookie_expired/error
         """
         try:
-            # 访问发布页
-            url = "https://sxsy.org/"
-            payload = {}
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/137.0.0.0 Safari/537.36 Edg/137.0.0.0',
-                'Host': 'sxsy.org'
-            }
-            response = requests.request("GET", url, headers=headers, data=payload)
-            response.raise_for_status()  # 检查响应状态
+            page = self.cached_sign_state(cached)
+            if page is not None:
+                with self.timed("signin"):
+                    sign_text = self.signin(host, session, page['formhash'])
+                state = self.check_cached_sign(sign_text)
+                if state == "cookie_expired":
+                    return state
+                if state == "stale":
+                    page = None
+            if page is None:
+                with self.timed("sign_page"):
+                    page = self.get_sign_page(host, session)
+                if page is None:
+                    return "error"
+                if 'login_required' in page:
+                    return "cookie_expired"
+                with self.timed("signin"):
+                    sign_text = self.signin(host, session, page.get('formhash'))
+            self.clear_page_cache(session)
 
-            # 使用正则表达式匹配host
-            pattern = r'href="https://([^/"]+)'
-            match = re.search(pattern, response.text)
-            if match:
-                host = match.group(1)
-                logging.info(f"[获取host]{host}")
-                return host
-            logging.warning("[获取host]无法获取host，使用默认域名")
-            return DEFAULT_HOST  # 如果无法获取，返回默认域名
-        except requests.RequestException as e:
-            logging.warning(f"[获取host]发生网络错误，使用默认域名")
-            return DEFAULT_HOST
+            uid = page.get('uid')
+            money = self.money_after_sign(page.get('money'), sign_text)
+            if uid is None or (money is None and page.get('money_due', True)):
+                with self.timed("user_info"):
+                    uid, money = self.get_user_info(host, session)
+            with self.timed("promotion"):
+                self.get_promotion_reward(host, uid)
+            if money is not None:
+                logging.info(f"您现有金钱 {money}")
+            if result is not None:
+                result.message = sign_text or ""
+                result.money = money
+                result.already_signed = bool(sign_text and self.profile.patterns['already_signed'].search(sign_text))
+            if sign_text is not None:
+                self.save_sign_state(result, page.get('formhash'), uid, money)
+            return "success" if sign_text is not None else "error"
         except Exception as e:
-            logging.error(f"[获取host]发生未知错误: {str(e)}\n{traceback.format_exc()}")
-            return DEFAULT_HOST
+            logging.error(f"[执行任务]发生未知错误: {str(e)}", exc_info=True)
+            return "error"
 
-    def get_param(self, host, session):
+    def read_cookies(self):
         """
-        获取参数
+        读取已保存的账号会话
+        :return: 生成器，(账号, 会话数据)，没有有效会话返回None
+        """
+        try:
+            count = self.store.count()
+            if count:
+                logging.info(f"[读取Cookie]从{self.store.path}读取到{count}个账号")
+                return self.store.accounts()
+            return None
+        except Exception as e:
+            logging.error(f"[读取Cookie]发生错误: {str(e)}", exc_info=True)
+            return None
+
+    def save_cookies(self, cookies, email=None, host=None, expires_in=None, proxy=None):
+        """
+        保存账号会话
+        :param cookies: cookie字符串
+        :param email: 账号标识
+        :param host: 账号指定的域名，下次使用已保存的cookie时沿用；自动获取的镜像不保存，下次重新获取
+        :param expires_in: 有效期（秒），None表示未知
+        :param proxy: 该账号使用的代理，下次使用已保存的cookie时沿用
+        """
+        try:
+            expires_at = time.time() + expires_in if expires_in else None
+            self.store.upsert(email or 'default', cookies, host, expires_at, proxy)
+            logging.info(f"[写入Cookie]账号 {email or 'default'} 已保存")
+        except Exception as e:
+            logging.error(f"[写入Cookie]发生错误: {str(e)}", exc_info=True)
+
+    def invalidate_cookies(self, emails):
+        """
+        标记失效账号的会话，其他账号不受影响
+        :param emails: 账号标识列表
+        """
+        try:
+            for email in emails:
+                self.store.invalidate(email)
+            logging.info(f"[Cookie]已标记{len(emails)}个失效账号")
+        except Exception as e:
+            logging.error(f"[Cookie]标记失效账号失败: {str(e)}", exc_info=True)
+
+    def get_session_cookies(self, session):
+        """
+        获取session的cookies字符串
+        :param session: 会话对象
+        :return: cookie字符串
+        """
+        try:
+            cookies = []
+            for cookie in session.cookies:
+                cookies.append(f"{cookie.name}={cookie.value}")
+            return '; '.join(cookies)
+        except Exception as e:
+            logging.error(f"[获取Session Cookies]发生错误: {str(e)}", exc_info=True)
+            return None
+
+    def session_lifetime(self, session):
+        """
+        登录后会话的剩余有效期，取auth cookie的过期时间，没有时按登录时请求的cookietime计算
+        :param session: 会话对象
+        :return: 有效期（秒）
+        """
+        expires = [cookie.expires for cookie in session.cookies if cookie.name.endswith('auth') and cookie.expires]
+        if expires:
+            return max(1, max(expires) - time.time())
+        return COOKIE_TIME
+
+    def set_session_cookies(self, session, cookies):
+        """
+        将cookie字符串写入会话
+        :param session: 会话对象
+        :param cookies: cookie字符串
+        """
+        for cookie_item in cookies.split(';'):
+            if '=' not in cookie_item:
+                continue
+            key, value = cookie_item.split('=', 1)
+            session.cookies.set(key.strip(), value.strip())
+
+    def fork_session(self, session):
+        """
+        复制会话，新会话拥有独立的cookie jar
+        :param session: 会话对象
+        :return: 新会话
+        """
+        fork = self.new_session(self.session_proxies.get(session))
+        fork.cookies.update(session.cookies)
+        return fork
+
+    def prepare_captcha(self, host, seccodehash, session):
+        """
+        在复制的会话中获取验证码图片并识别
+        验证码保存在cookie中，每个候选使用独立会话，互不覆盖
         :param host: 域名
+        :param seccodehash: seccodehash
         :param session: 会话对象
-        :return: formhash, seccodehash, loginhash
+        :return: (候选会话, 读法列表, 图片哈希)
+        """
+        fork = self.fork_session(session)
+        with self.timed("captcha_image"):
+            img = self.get_captcha_img(host, seccodehash, fork)
+        if not img:
+            return fork, [], None
+        key = OcrCache.key_of(img)
+        with self.timed("ocr"):
+            candidates = self.get_captcha_candidates(img, key)
+        return fork, candidates, key
+
+    def verify_captcha(self, host, seccodehash, prepared):
+        """
+        等待候选识别完成并检查验证码，同一张图片的多个读法依次检查，不需要重新获取图片
+        :param host: 域名
+        :param seccodehash: seccodehash
+        :param prepared: prepare_captcha的Future
+        :return: (候选会话, 验证码文字, 是否正确)
+        """
+        fork, candidates, key = prepared.result()
+        text, ok = self.check_candidates(candidates, key, lambda text: self.check_captcha(host, text, fork, seccodehash))
+        return fork, text, ok
+
+    def captcha_pool(self):
+        """
+        验证码候选共用的线程池，整个任务只创建一次，并发数调大时重新创建
+        检查任务会等待同一登录的预取任务，线程数大于同时登录的账号数×CAPTCHA_RACE时预取总能拿到线程
+        :return: 线程池
+        """
+        size = self.max_workers * CAPTCHA_RACE * 2
+        with self.captcha_lock:
+            if self.captcha_executor is None or self.captcha_executor[0] < size:
+                if self.captcha_executor is not None:
+                    self.captcha_executor[1].shutdown(wait=False)
+                self.captcha_executor = (size, ThreadPoolExecutor(max_workers=size, thread_name_prefix="captcha"))
+            return self.captcha_executor[1]
+
+    def solve_captcha(self, host, seccodehash, session):
+        """
+        流水线识别验证码
+        每轮并发检查CAPTCHA_RACE个候选，本轮有候选验证失败后才预取下一轮候选的图片并识别，
+        第一次就通过时不多取验证码、不多占用OCR；
+        第一个验证通过的候选胜出，其cookie写回原会话；重试间隔按指数退避并扣除本轮已耗时间
+        :param host: 域名
+        :param seccodehash: seccodehash
+        :param session: 会话对象
+        :return: 验证码文字，失败返回None
+        """
+        if not self.ocr_available():
+            logging.error("[验证码]OCR服务熔断中，跳过验证码识别")
+            return None
+        race = CAPTCHA_RACE
+        budget = CAPTCHA_MAX_ROUNDS * race
+        executor = self.captcha_pool()
+        submitted = []
+
+        def submit(fn, *args):
+            future = submit_in_context(executor, fn, *args)
+            submitted.append(future)
+            return future
+
+        try:
+            prepared = [submit(self.prepare_captcha, host, seccodehash, session) for _ in range(race)]
+            budget -= race
+            for round_index in range(1, CAPTCHA_MAX_ROUNDS + 1):
+                round_start = time.monotonic()
+                checks = [submit(self.verify_captcha, host, seccodehash, future) for future in prepared]
+                prepared = []
+                for future in as_completed(checks):
+                    fork, text, ok = future.result()
+                    if ok:
+                        session.cookies.update(fork.cookies)
+                        return text
+                    # 本轮第一个候选失败时预取下一轮，与本轮其余候选的检查和退避等待重叠
+                    if not prepared and budget > 0:
+                        prefetch = min(race, budget)
+                        prepared = [submit(self.prepare_captcha, host, seccodehash, session) for _ in range(prefetch)]
+                        budget -= prefetch
+                if not prepared:
+                    break
+                if deadline_exceeded():
+                    logging.warning("[验证码]已超过时限，停止重试")
+                    break
+                if not self.ocr_available():
+                    logging.error("[验证码]OCR服务熔断中，停止重试")
+                    break
+                logging.warning(f"[验证码]验证失败，第{round_index}次重试")
+                account = current_account.get()
+                if account is not None:
+                    account.count_retry("captcha")
+                time.sleep(clamp_timeout(max(0.0, backoff_delay(round_index, CAPTCHA_RETRY_DELAY, CAPTCHA_RETRY_DELAY_MAX) - (time.monotonic() - round_start))))
+            logging.error("[验证码]验证失败，已达到最大重试次数")
+            return None
+        finally:
+            # 胜出后不再等待仍在进行的预取，尚未开始的取消
+            for future in submitted:
+                future.cancel()
+
+    def login(self, host, email, password, session):
+        """
+        邮箱密码登录（含验证码识别）
+        :param host: 域名
+        :param email: 邮箱
+        :param password: 密码
+        :param session: 会话对象
+        :return: 失败状态，成功返回None
+        """
+        # 获取参数
+        with self.timed("get_param"):
+            formhash, seccodehash, loginhash = self.get_param(host, session)
+        if not all([formhash, seccodehash, loginhash]):
+            logging.error("获取参数失败，跳过当前账号")
+            return "param_failed"
+
+        with self.timed("captcha"):
+            login_in_captcha_text = self.solve_captcha(host, seccodehash, session)
+        if not login_in_captcha_text:
+            return "captcha_failed"
+
+        with self.timed("login_in"):
+            logged_in = self.login_in(host, email, password, formhash, login_in_captcha_text, session, loginhash, seccodehash)
+        if not logged_in:
+            logging.error("登录失败，跳过当前账号")
+            return "login_failed"
+        return None
+
+    def run_cookie_account(self, email, account_data, host):
+        """
+        使用已保存cookie的账号执行任务
+        :param email: 账号标识
+        :param account_data: 已保存的账号会话数据
+        :param host: 域名
+        :return: AccountResult
+        """
+        result = AccountResult(email, "cookie_store")
+        current_account.set(result)
+        session = self.new_session(account_data.get('proxy'))
+        self.set_session_cookies(session, account_data['cookies'])
+
+        # 签到页（或直接签到的结果）同时用于检查cookie是否有效
+        result.status = self.do_task(host, session, result, account_data)
+        if result.status == "cookie_expired":
+            logging.warning(f"[Cookie存储]账号 {email} 的Cookie已失效")
+        return result
+
+    def run_env_account(self, index, host, account):
+        """
+        使用环境变量或账号文件中的账号执行任务
+        :param index: 账号序号
+        :param host: 域名
+        :param account: Account
+        :return: AccountResult
+        """
+        email, password, cookie = account.email, account.password, account.cookie
+        key = account.key
+        result = AccountResult(key, "env")
+        current_account.set(result)
+        logging.info(f"------【账号{index}】开始执行任务------")
+
+        # 每个账号使用独立的会话
+        session = self.new_session(account.proxy)
+
+        if cookie:
+            # 直接使用cookie
+            logging.info(f"[检查环境变量]检测到cookie，将直接使用并保存")
+            self.set_session_cookies(session, cookie)
+            self.save_cookies(cookie, key, account.host, proxy=account.proxy)
+        else:
+            logging.info(f"[检查环境变量]检测到邮箱密码，将进行登录")
+            status = self.login(host, email, password, session)
+            if status:
+                result.status = status
+                return result
+
+            # 登录成功后保存cookie
+            cookies = self.get_session_cookies(session)
+            if cookies:
+                self.save_cookies(cookies, email, account.host, self.session_lifetime(session), account.proxy)
+
+        # 执行签到任务，签到页同时用于检查cookie是否有效
+        result.status = self.do_task(host, session, result)
+        if result.status == "cookie_expired":
+            logging.warning(f"[Cookie]账号 {key} 的Cookie已失效")
+        logging.info(f"------【账号{index}】执行任务完成------")
+        return result
+
+    @staticmethod
+    def job_result(args, source):
+        """
+        账号任务没有正常返回（超时或出错）时，按任务参数生成执行结果
+        :param args: 任务参数，run_cookie_account为(账号标识, 会话数据, 域名)，其他为(序号, 域名, Account)
+        :param source: 账号来源
+        :return: AccountResult
+        """
+        account = args[0] if source == "cookie_store" else args[2].key
+        return AccountResult(account, source)
+
+    def run_accounts(self, func, jobs, source, count=None):
+        """
+        使用线程池并发执行账号任务，任务逐个提交，同时排队的任务不超过并发数的两倍
+        :param func: 单个账号的执行函数，返回AccountResult
+        :param jobs: 参数元组的列表或生成器
+        :param source: 账号来源（cookie_store/env/refresh），任务出错时用于生成执行结果
+        :param count: 任务数，jobs为生成器时用于分散开始时间
+        :return: AccountResult列表，与jobs顺序一致
+        """
+        start_at = time.monotonic()
+        offsets = spread_offsets(len(jobs) if count is None and isinstance(jobs, list) else count, START_WINDOW)
+
+        def run_one(args, offset):
+            self.wait_start(start_at + offset)
+            start = time.monotonic()
+            # 日志缓存设置在线程自己的上下文中，下面的错误日志也属于该账号，结束后恢复，不影响线程执行的下一个账号
+            buffer = self.account_log_buffer()
+            token = current_log_buffer.set(buffer)
+            # 每个账号在独立的上下文中执行，current_account和截止时间互不影响
+            context = contextvars.copy_context()
+            context.run(current_deadline.set, self.account_deadline())
+            try:
+                if context.run(deadline_exceeded):
+                    raise DeadlineExceeded("已超过运行时限，未执行")
+                result = context.run(func, *args)
+                if result.status not in ("success", "cookie_expired") and context.run(deadline_exceeded):
+                    result.status = "timeout"
+            except DeadlineExceeded as e:
+                logging.warning(f"[账号任务]{str(e)}")
+                result = self.job_result(args, source)
+                result.status = "timeout"
+                result.message = str(e)
+            except Exception as e:
+                logging.error(f"[账号任务]发生未知错误: {str(e)}", exc_info=True)
+                result = self.job_result(args, source)
+                result.status = "error"
+                result.message = str(e)
+            finally:
+                current_log_buffer.reset(token)
+                self.flush_account_log(buffer)
+            result.elapsed = time.monotonic() - start
+            self.metrics.observe("account", result.elapsed)
+            self.record_sign(result)
+            return result
+
+        if self.max_workers == 1:
+            return [run_one(args, offset) for args, offset in zip(jobs, offsets)]
+
+        results = {}
+        futures = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="sxsy") as executor:
+            # 按开始时间先后提交，等待开始的线程不会挡住更早开始的账号
+            for i, (args, offset) in enumerate(zip(jobs, offsets)):
+                if len(futures) >= self.max_workers * 2:
+                    done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        results[futures.pop(future)] = future.result()
+                futures[executor.submit(run_one, args, offset)] = i
+            for future, i in futures.items():
+                results[i] = future.result()
+        return [results[i] for i in range(len(results))]
+
+    def start_delay(self, start_at):
+        """
+        计算账号开始前需要等待的时间，不超过整次运行的截止时间
+        :param start_at: 计划开始时间（time.monotonic()）
+        :return: 等待时间（秒）
+        """
+        now = time.monotonic()
+        delay = start_at - now
+        if self.run_deadline is not None:
+            delay = min(delay, self.run_deadline - now)
+        return max(0.0, delay)
+
+    def wait_start(self, start_at):
+        """
+        等待到账号的计划开始时间
+        :param start_at: 计划开始时间（time.monotonic()）
+        """
+        delay = self.start_delay(start_at)
+        if delay > 0:
+            time.sleep(delay)
+
+    def refresh_account(self, index, host, account):
+        """
+        重新登录并保存新的会话，不签到
+        :param index: 账号序号
+        :param host: 域名
+        :param account: Account
+        :return: AccountResult
+        """
+        result = AccountResult(account.key, "refresh")
+        current_account.set(result)
+        logging.info(f"------【账号{index}】开始刷新会话------")
+        session = self.new_session(account.proxy)
+        status = self.login(host, account.email, account.password, session)
+        if status:
+            result.status = status
+            return result
+        cookies = self.get_session_cookies(session)
+        if not cookies:
+            result.status = "error"
+            return result
+        self.save_cookies(cookies, account.email, account.host, self.session_lifetime(session), account.proxy)
+        result.status = "success"
+        logging.info(f"------【账号{index}】刷新会话完成------")
+        return result
+
+    def refresh_accounts(self, due):
+        """
+        流式读取需要刷新且有邮箱密码的账号
+        :param due: {账号: 过期时间戳}
+        :return: 生成器，(序号, Account)
+        """
+        accounts = (account for account in self.check_env()
+                    if account.email and account.password and account.key in due and self.in_shard(account.key))
+        return enumerate(accounts, 1)
+
+    def load_due(self):
+        """
+        读取需要刷新的账号
+        :return: {账号: 过期时间戳}
+        """
+        due = {account: expires_at for account, expires_at in self.store.due_for_refresh(REFRESH_BEFORE).items()
+               if self.in_shard(account)}
+        logging.info(f"[刷新]{len(due)}个账号的会话已失效或将在{REFRESH_BEFORE / 3600:.0f}小时内过期")
+        return due
+
+    def log_unrefreshed(self, due, results):
+        """
+        :param due: 需要刷新的账号
+        :param results: 刷新结果
+        """
+        missing = len(set(due) - {result.account for result in results})
+        if missing:
+            logging.warning(f"[刷新]{missing}个账号在环境变量和账号文件中没有邮箱密码，无法刷新")
+
+    def open_resident(self):
+        """
+        常驻模式开始前调用；同步模式的连接池、Cookie存储和OCR后端本来就保存在实例中，在多次运行之间复用
+        """
+
+    def close_resident(self):
+        """
+        常驻模式退出时调用，关闭连接池、验证码线程池、预处理进程池和Cookie存储
+        """
+        for adapter in self.adapters.values():
+            adapter.close()
+        if self.captcha_executor is not None:
+            self.captcha_executor[1].shutdown(wait=False)
+        if self.preprocessor is not None:
+            self.preprocessor.close()
+        self.store.close()
+
+    def refresh(self):
+        """
+        提前重新登录会话已失效或即将过期的账号，签到时就不需要验证码登录
+        默认逐个执行（SXSY_REFRESH_WORKERS），可以安排在签到之外的时间低频运行
+        :return: AccountResult列表
+        """
+        results = []
+        self.metrics = RunMetrics()
+        self.account_sources = []
+        self.run_deadline = time.monotonic() + RUN_TIMEOUT if RUN_TIMEOUT > 0 else None
+        current_deadline.set(self.run_deadline)
+        try:
+            logging.info(f"【{self.site_name}】开始刷新即将过期的会话，并发数{self.max_workers}{self.shard_label}")
+            due = self.load_due()
+            if due:
+                self.load_account_sources()
+                accounts = self.refresh_accounts(due)
+                first = next(accounts, None)
+                if first is not None:
+                    with self.timed("get_host"):
+                        host = self.get_host()
+                    jobs = self.env_jobs(itertools.chain([first], accounts), host)
+                    results.extend(self.run_accounts(self.refresh_account, jobs, "refresh"))
+                self.log_unrefreshed(due, results)
+            self.log_summary(results)
+        except Exception as e:
+            logging.error(f"【{self.site_name}】刷新过程中发生错误: {str(e)}", exc_info=True)
+        finally:
+            self.save_ocr_cache()
+        return results
+
+    def log_summary(self, results):
+        """
+        输出账号执行汇总
+        :param results: AccountResult列表
+        """
+        counts = {}
+        for result in results:
+            counts[result.status] = counts.get(result.status, 0) + 1
+        logging.info(f"[汇总]共{len(results)}个账号，" + "，".join(f"{k}: {v}" for k, v in sorted(counts.items())))
+        if results:
+            logging.info(f"[汇总]平均每个账号请求{sum(r.requests for r in results) / len(results):.1f}次")
+        for source in self.account_sources:
+            if source.skipped:
+                lines = "、".join(str(number) for number, _ in source.skipped[:20])
+                more = "等" if len(source.skipped) > 20 else ""
+                logging.warning(f"[汇总]{source.name}中{len(source.skipped)}行格式错误已跳过，行号: {lines}{more}")
+        for result in results:
+            logging.info(f"[汇总]{result.account}\t{result.status}\t{result.elapsed:.2f}s\t{result.requests}次请求")
+
+    def run(self):
+        """
+        执行签到任务的主函数
+        :return: AccountResult列表
+        """
+        results = []
+        self.metrics = RunMetrics()
+        self.account_sources = []
+        self.run_deadline = time.monotonic() + RUN_TIMEOUT if RUN_TIMEOUT > 0 else None
+        current_deadline.set(self.run_deadline)
+        self.start_profile()
+        try:
+            logging.info(f"【{self.site_name}】开始执行签到任务，并发数{self.max_workers}{self.shard_label}")
+            self.load_signed()
+
+            # 已保存的账号与环境变量中的账号使用同一个镜像，所有账号都已签到时不需要获取
+            host = None
+            # 已保存cookie阶段完成的账号，环境变量阶段跳过
+            finished = set()
+            # 首先尝试使用已保存的cookie
+            accounts = self.read_cookies()
+            if accounts:
+                logging.info("[Cookie存储]检测到已保存的cookie，将尝试使用")
+                # 分片运行时只处理分配到当前分片的账号，今日已签到的账号跳过
+                pending = [(email, data) for email, data in accounts if self.in_shard(email) and not self.skip_signed(email)]
+                results.extend(self.take_skipped())
+                file_results = []
+                if pending:
+                    # 账号指定了host时使用指定的，都指定了时不需要获取镜像
+                    if not all(data.get('host') for _, data in pending):
+                        with self.timed("get_host"):
+                            host = self.get_host()
+                    file_results = self.run_accounts(self.run_cookie_account,
+                                                        [(email, data, data.get('host') or host) for email, data in pending],
+                                                        "cookie_store")
+                results.extend(file_results)
+                finished = {r.account for r in file_results if r.status != "cookie_expired"}
+                expired = [r.account for r in file_results if r.status == "cookie_expired"]
+                if expired:
+                    logging.info(f"[Cookie存储]{len(expired)}个账号的Cookie已失效，尝试使用环境变量中的账号")
+                    # 只删除失效账号的cookie，保留有效账号
+                    self.invalidate_cookies(expired)
+
+            # 环境变量中其余的账号（Cookie失效、上次登录失败或新增的账号）逐个读取并提交，不一次性读入所有账号
+            self.load_account_sources()
+            accounts = self.env_accounts(finished)
+            first = next(accounts, None)
+            if first is not None:
+                if host is None:
+                    with self.timed("get_host"):
+                        host = self.get_host()
+                jobs = self.env_jobs(itertools.chain([first], accounts), host)
+                results.extend(self.run_accounts(self.run_env_account, jobs, "env", self.pending_accounts(finished)))
+            results.extend(self.take_skipped())
+            self.log_summary(results)
+        except Exception as e:
+            logging.error(f"【{self.site_name}】执行过程中发生错误: {str(e)}", exc_info=True)
+        finally:
+            self.save_ocr_cache()
+            self.export_metrics(results)
+            self.stop_profile()
+        return results
+
+class AsyncAutoTask(AutoTask):
+    """
+    异步版本的自动任务类
+    所有账号在同一个事件循环中执行，共用一个aiohttp连接器，每个账号使用独立的cookie jar
+    提取正则与cookie处理与同步版本一致
+    """
+    def __init__(self, site_name, max_workers=None, shard=None, profile=None, shared=None):
+        """
+        初始化异步自动任务类
+        :param site_name: 站点名称，用于日志显示
+        :param max_workers: 同时执行的账号数，默认读取环境变量SXSY_WORKERS
+        :param shard: 分片"序号/总数"，默认读取环境变量SXSY_SHARD
+        :param profile: SiteProfile，默认为尚香书苑
+        :param shared: 同时运行的另一个站点的任务，连接器在运行时通过share_transport共用
+        """
+        if aiohttp is None:
+            raise RuntimeError("异步模式需要安装aiohttp: pip install aiohttp")
+        super().__init__(site_name, max_workers, shard, profile, shared)
+
+    def setup_transport(self):
+        """
+        连接器必须在事件循环中创建，见run_async
+        """
+        self.connector = None
+        self.anon_session = None
+        self.loop = None # 常驻模式一直使用的事件循环
+        self.transport_kept = False # 常驻模式下连接器在多次运行之间保留
+
+    def new_session(self, proxy=None):
+        """
+        创建账号会话，连接器共用，cookie jar独立
+        :param proxy: 该账号使用的代理，仅支持http代理
+        :return: aiohttp.ClientSession
+        """
+        # unsafe=True 允许IP地址形式的域名保存cookie
+        session = aiohttp.ClientSession(
+            connector=self.connector,
+            connector_owner=False,
+            cookie_jar=aiohttp.CookieJar(unsafe=True),
+            proxy=proxy
+        )
+        if proxy:
+            self.session_proxies[session] = proxy
+        return session
+
+    def set_session_cookies(self, session, cookies):
+        """
+        将cookie字符串写入会话
+        :param session: 会话对象
+        :param cookies: cookie字符串
+        """
+        for cookie_item in cookies.split(';'):
+            if '=' not in cookie_item:
+                continue
+            key, value = cookie_item.split('=', 1)
+            session.cookie_jar.update_cookies({key.strip(): value.strip()})
+
+    def get_session_cookies(self, session):
+        """
+        获取session的cookies字符串
+        :param session: 会话对象
+        :return: cookie字符串
+        """
+        try:
+            return '; '.join(f"{cookie.key}={cookie.value}" for cookie in session.cookie_jar)
+        except Exception as e:
+            logging.error(f"[获取Session Cookies]发生错误: {str(e)}", exc_info=True)
+            return None
+
+    def session_lifetime(self, session):
+        """
+        登录后会话的剩余有效期，取auth cookie的过期时间，没有时按登录时请求的cookietime计算
+        :param session: 会话对象
+        :return: 有效期（秒）
+        """
+        expires = []
+        for cookie in session.cookie_jar:
+            if not cookie.key.endswith('auth'):
+                continue
+            try:
+                if cookie['max-age']:
+                    expires.append(time.time() + int(cookie['max-age']))
+                elif cookie['expires']:
+                    expires.append(parsedate_to_datetime(cookie['expires']).timestamp())
+            except (TypeError, ValueError):
+                continue
+        if expires:
+            return max(1, max(expires) - time.time())
+        return COOKIE_TIME
+
+    async def fetch(self, session, method, url, read="text", patterns=None, stop_any=False, stop_on=(), **kwargs):
+        """
+        发送请求并读取响应，镜像连接失败时自动切换到下一个可用镜像
+        :param session: 会话对象
+        :param method: 请求方法
+        :param url: 地址
+        :param read: 读取方式，text/bytes/json/tokens
+        :param patterns: read为tokens时要提取的{名称: 正则}
+        :param stop_any: read为tokens时找到任意一个即结束
+        :param stop_on: read为tokens时找到其中任意一个名称即结束
+        :return: 响应内容，read为tokens时返回{名称: 匹配内容}
+        """
+        host = urllib.parse.urlsplit(url).netloc
+        current = self.resolve_host(host)
+        if current != host:
+            url, kwargs = self.replace_host(url, kwargs, host, current)
+            host = current
+        timeout = kwargs.pop('timeout', None)
+        account = current_account.get()
+        while True:
+            if deadline_exceeded():
+                raise DeadlineExceeded(f"已超过时限，未发送请求 {url}")
+            if not self.breaker.allow(host):
+                error = aiohttp.ClientConnectionError(f"{host} 熔断中，未发送请求")
+            else:
+                if account is not None:
+                    account.count_request()
+                try:
+                    async with self.scheduler.async_slot(self.target_of(url), self.site_name):
+                        start = time.monotonic()
+                        async with session.request(method, url, timeout=timeout or self.client_timeout(url), **kwargs) as response:
+                            self.breaker.record(host, response.status < 500)
+                            response.raise_for_status()
+                            if read == "bytes":
+                                data = await response.read()
+                            elif read == "json":
+                                data = await response.json(content_type=None)
+                            elif read == "tokens":
+                                data = await self.read_tokens(response, patterns, stop_any, stop_on)
+                            else:
+                                data = await response.text(errors="replace")
+                            record_transfer(response.content.total_bytes)
+                    self.observe("http", time.monotonic() - start)
+                    return data
+                except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                    self.breaker.record(host, False)
+                    error = e
+            new_host = self.failover_host(host)
+            if not new_host:
+                raise error
+            logging.warning(f"[故障转移]{host} 连接失败，切换到 {new_host}")
+            if account is not None:
+                account.count_retry("failover")
+            url, kwargs = self.replace_host(url, kwargs, host, new_host)
+            host = new_host
+
+    def client_timeout(self, url):
+        """
+        获取请求的超时设置，总时间不超过当前账号剩余时间
+        :param url: 地址
+        :return: aiohttp.ClientTimeout
+        """
+        connect, read = self.timeout_for(url)
+        remaining = deadline_remaining()
+        return aiohttp.ClientTimeout(total=None if remaining is None else max(remaining, 0.001),
+                                     sock_connect=clamp_timeout(connect), sock_read=clamp_timeout(read))
+
+    async def read_tokens(self, response, patterns, stop_any=False, stop_on=()):
+        """
+        流式读取响应并提取token，逻辑与extract_tokens一致
+        :param response: aiohttp响应
+        :param patterns: {名称: 编译后的正则}
+        :param stop_any: 找到任意一个即结束
+        :param stop_on: 找到其中任意一个名称即结束
+        :return: {名称: 匹配内容}
+        """
+        scanner = TokenScanner(patterns, stop_any, stop_on)
+        decoder = codecs.getincrementaldecoder(response_encoding(response.headers.get('Content-Type'), response.charset))(errors='replace')
+        async for chunk in response.content.iter_chunked(STREAM_CHUNK_SIZE):
+            if scanner.feed(decoder.decode(chunk)):
+                await self.drain_response(response)
+                return scanner.found
+        scanner.feed(decoder.decode(b'', final=True), final=True)
+        return scanner.found
+
+    @staticmethod
+    async def drain_response(response):
+        """
+        剩余内容不超过STREAM_DRAIN_LIMIT时读完以保留长连接，逻辑与release_response一致；读不完时退出响应后连接会被关闭
+        :param response: aiohttp响应
+        """
+        # total_bytes为解压后的字节数，只有未压缩时才能与Content-Length比较
+        compressed = bool(response.headers.get('Content-Encoding'))
+        if not compressed and response.content_length is not None and response.content_length - response.content.total_bytes > STREAM_DRAIN_LIMIT:
+            return
+        limit = drain_limit(response.headers)
+        drained = 0
+        while drained <= limit:
+            chunk = await response.content.read(STREAM_CHUNK_SIZE)
+            if not chunk:
+                return
+            drained += len(chunk)
+
+    async def fetch_text(self, session, method, url, **kwargs):
+        """
+        发送请求并返回响应文本
+        :param session: 会话对象
+        :param method: 请求方法
+        :param url: 地址
+        :return: 响应文本
+        """
+        return await self.fetch(session, method, url, **kwargs)
+
+    async def probe_host(self, host):
+        """
+        探测镜像是否可用
+        :param host: 域名
+        :return: 响应延迟（秒），不可用返回None
         """
         try:
-            # 访问首页
-            url = f"https://{host}/member.php?mod=logging&action=login&infloat=yes&frommessage&inajax=1&ajaxtarget=messagelogin"
             headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/137.0.0.0 Safari/537.36 Edg/137.0.0.0',
+                'User-Agent': USER_AGENT,
                 'Host': host
             }
-            response = session.get(url, headers=headers)
-            response.raise_for_status()
+            start = time.monotonic()
+            async with self.anon_session.get(f"https://{host}/", headers=headers, allow_redirects=False,
+                                             timeout=aiohttp.ClientTimeout(total=HOST_PROBE_TIMEOUT)) as response:
+                latency = time.monotonic() - start
+                if response.status >= 400:
+                    return None
+            return latency
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return None
 
-            # 使用正则表达式匹配
-            # formhash 格式: name="formhash" value="5448b1bc"
-            pattern = r'name="formhash" value="([a-zA-Z0-9]{8})"'
-            match = re.search(pattern, response.text)
-            if match:
-                formhash = match.group(1)
-            else:
-                logging.error("[获取formhash]无法获取formhash")
-                return None, None, None
-            # seccodehash 格式: seccode_cSAbDg cSAbDg
-            pattern = r'seccode_([a-zA-Z0-9]{6})'
-            match = re.search(pattern, response.text)
-            if match:
-                seccodehash = match.group(1)
-            else:
-                logging.error("[获取seccodehash]无法获取seccodehash")
-                return None, None, None
-            # loginhash 格式: main_messaqge_LCpo4 LCpo4
-            pattern = r'main_messaqge_([a-zA-Z0-9]{5})'
-            match = re.search(pattern, response.text)
-            if match:
-                loginhash = match.group(1)
-            else:
-                logging.error("[获取loginhash]无法获取loginhash")
-                return None, None, None
-            return formhash, seccodehash, loginhash
-        except requests.RequestException as e:
-            logging.warning(f"[获取参数]发生网络错误: {str(e)}\n{traceback.format_exc()}")
+    async def get_host(self):
+        """
+        获取host
+        优先使用未过期的缓存；缓存失效时并发探测发布页上的所有镜像，按延迟排序后缓存
+        :return: host
+        """
+        try:
+            hosts = self.read_host_cache()
+            if hosts:
+                self.set_hosts(hosts)
+                logging.info(f"[获取host]{hosts[0]}（缓存）")
+                return hosts[0]
+
+            url = self.profile.publish_url
+            candidates = [self.profile.default_host]
+            if url:
+                headers = {
+                    'User-Agent': USER_AGENT,
+                    'Host': urllib.parse.urlsplit(url).netloc
+                }
+                try:
+                    text = await self.fetch_text(self.anon_session, "GET", url, headers=headers)
+                    candidates = self.parse_hosts(text)
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    logging.warning(f"[获取host]访问发布页发生网络错误，仅探测默认域名")
+
+            latencies = await asyncio.gather(*(self.probe_host(host) for host in candidates))
+            probes = sorted(
+                [(host, latency) for host, latency in zip(candidates, latencies) if latency is not None],
+                key=lambda item: item[1]
+            )
+            if not probes:
+                logging.warning("[获取host]没有可用的镜像，使用默认域名")
+                self.set_hosts([self.profile.default_host])
+                return self.profile.default_host
+
+            self.write_host_cache(probes)
+            self.set_hosts([host for host, _ in probes])
+            logging.info("[获取host]" + "，".join(f"{host}({latency * 1000:.0f}ms)" for host, latency in probes))
+            return probes[0][0]
+        except Exception as e:
+            logging.error(f"[获取host]发生未知错误: {str(e)}", exc_info=True)
+            return self.profile.default_host
+
+    async def get_param(self, host, session):
+        """
+        获取参数
+        :param host: 域名
+        :param session: 会话对象
+        :return: formhash, seccodehash, loginhash
+        """
+        try:
+            url = self.profile.url(host, 'login_form')
+            headers = {
+                'User-Agent': USER_AGENT,
+                'Host': host
+            }
+            tokens = await self.fetch(session, "GET", url, read="tokens", patterns=self.profile.param_patterns, headers=headers)
+            for name in self.profile.param_patterns:
+                if name not in tokens:
+                    logging.error(f"[获取{name}]无法获取{name}")
+                    return None, None, None
+            return tokens['formhash'], tokens['seccodehash'], tokens['loginhash']
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logging.warning(f"[获取参数]发生网络错误: {str(e)}", exc_info=True)
             return None, None, None
         except Exception as e:
-            logging.error(f"[获取参数]发生未知错误: {str(e)}\n{traceback.format_exc()}")
+            logging.error(f"[获取参数]发生未知错误: {str(e)}", exc_info=True)
             return None, None, None
 
-    def get_captcha_img(self, host, seccodehash, session):
+    async def get_captcha_img(self, host, seccodehash, session):
         """
         获取验证码图片
         :param host: 域名
         :param seccodehash: seccodehash
         :param session: 会话对象
-        :return: 验证码图片
+        :return: 验证码图片字节
         """
         try:
-            url = f"https://{host}/misc.php?mod=seccode&update={random.randint(10000, 99999)}&idhash={seccodehash}"
+            url = self.profile.url(host, 'seccode', update=random.randint(10000, 99999), seccodehash=seccodehash)
             headers = {
-                'referer': f'https://{host}/member.php?mod=logging&action=login',
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/137.0.0.0 Safari/537.36 Edg/137.0.0.0',
+                'referer': self.profile.url(host, 'login_page'),
+                'User-Agent': USER_AGENT,
                 'Host': host
             }
-            response = session.get(url, headers=headers)
-            # 图片转为base64
-            img_base64 = base64.b64encode(response.content).decode('utf-8')
-            return img_base64
+            return await self.fetch(session, "GET", url, read="bytes", headers=headers)
         except Exception as e:
-            logging.error(f"[获取验证码图片]发生未知错误: {str(e)}\n{traceback.format_exc()}")
+            logging.error(f"[获取验证码图片]发生未知错误: {str(e)}", exc_info=True)
             return None
 
-    def get_captcha_text(self, img_base64):
+    async def get_captcha_candidates(self, image, key):
         """
-        获取验证码文字
-        :param img_base64: 验证码base64
-        :return: 验证码文字
+        获取验证码的候选读法，相同图片直接使用缓存的结果
+        本地后端在线程池中识别，远程后端预处理后通过aiohttp请求
+        :param image: 验证码图片字节
+        :param key: 图片哈希
+        :return: 按可能性排序的读法列表，失败返回空列表
         """
+        cached = self.ocr_cache.get(key) if self.ocr_cache is not None else None
+        if cached:
+            return cached
         try:
-            url = DDDD_OCR_URL
-            payload = {
-                'image': img_base64
-            }
-            response = requests.post(url, data=payload).json()
-            if response['code'] == 200:
-                return response['data']
+            if self.ocr.local:
+                candidates = await asyncio.get_running_loop().run_in_executor(None, self.ocr.recognize_candidates, image)
             else:
-                logging.error(f"[获取验证码]发生错误: {response['message']}")
-                return None
+                if self.preprocessor is not None:
+                    image = await self.preprocess(image)
+                candidates = await self.recognize_remote(HttpOcrBackend.build_payload(image))
         except Exception as e:
-            logging.error(f"[获取验证码]发生错误: {str(e)}\n{traceback.format_exc()}")
-            return None
+            logging.error(f"[获取验证码]发生错误: {str(e)}", exc_info=True)
+            return []
+        candidates = expand_candidates(candidates, OCR_TOP_K)
+        if self.ocr_cache is not None:
+            self.ocr_cache.put(key, candidates)
+        return candidates
 
-    def check_captcha(self, host, captcha, session, seccodehash):
+    async def post_ocr(self, url, payload):
+        """
+        向一个OCR服务地址发送识别请求
+        :param url: 地址
+        :param payload: 表单
+        :return: 验证码文字列表
+        """
+        with self.ocr_endpoints.track(url):
+            result = await self.fetch(self.anon_session, "POST", url, read="json", data=payload)
+        return HttpOcrBackend.parse_candidates(result)
+
+    async def recognize_remote(self, payload):
+        """
+        远程识别，逻辑与HttpOcrBackend一致：超过第一个地址的p90仍未返回或请求失败时再请求另一个地址，先返回的胜出，落后的请求取消
+        :param payload: 表单
+        :return: 验证码文字列表
+        """
+        endpoints = self.ocr_endpoints
+        first = endpoints.choose()
+        if first is None:
+            raise RuntimeError("未配置OCR服务地址（DDDD_OCR_URL）")
+        if not OCR_HEDGE or endpoints.choose(exclude=(first,)) is None:
+            return await self.post_ocr(first, payload)
+        pending = {asyncio.ensure_future(self.post_ocr(first, payload))}
+        hedged = False
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, timeout=None if hedged else clamp_timeout(endpoints.hedge_delay(first)),
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    try:
+                        candidates = task.result()
+                    except Exception as e:
+                        error = e
+                        continue
+                    if candidates:
+                        return candidates
+                if hedged:
+                    continue
+                hedged = True
+                second = endpoints.choose(exclude=(first,))
+                if second is None:
+                    continue
+                account = current_account.get()
+                if account is not None:
+                    account.count_retry("ocr_hedge")
+                pending.add(asyncio.ensure_future(self.post_ocr(second, payload)))
+        finally:
+            for task in pending:
+                task.cancel()
+        if error is not None:
+            raise error
+        return []
+
+    async def preprocess(self, image):
+        """
+        在预处理进程池中处理验证码，同时登录的账号的图片一起交给各进程，不占用事件循环所在进程；失败时返回原图
+        :param image: 验证码图片字节
+        :return: 处理后的图片字节
+        """
+        try:
+            # 不使用进程池时在默认线程池中处理
+            return await asyncio.get_running_loop().run_in_executor(self.preprocessor.executor(), preprocess_captcha, image)
+        except Exception as e:
+            logging.error(f"[验证码预处理]发生错误，使用原图识别: {str(e)}", exc_info=True)
+            return image
+
+    async def check_candidates(self, candidates, key, check):
+        """
+        按顺序检查同一张验证码的候选读法，逻辑与同步版本一致
+        :param candidates: 读法列表
+        :param key: 图片哈希
+        :param check: 检查单个读法的协程函数
+        :return: (验证码文字, 是否正确)
+        """
+        for position, text in enumerate(candidates):
+            if position:
+                if deadline_exceeded():
+                    break
+                account = current_account.get()
+                if account is not None:
+                    account.count_retry("captcha_candidate")
+            if await check(text):
+                if self.ocr_cache is not None and candidates != [text]:
+                    self.ocr_cache.confirm(key, text)
+                return text, True
+        if candidates and self.ocr_cache is not None:
+            self.ocr_cache.discard(key)
+        return (candidates[0] if candidates else None), False
+
+    async def check_captcha(self, host, captcha, session, seccodehash):
         """
         检查验证码
         :param host: 域名
@@ -218,34 +4650,26 @@ class AutoTask:
         :return: 是否正确
         """
         try:
-            url = f"https://{host}/misc.php?mod=seccode&action=check&inajax=1&modid=member::logging&idhash={seccodehash}&secverify={captcha}"
+            url = self.profile.url(host, 'seccode_check', seccodehash=seccodehash, captcha=captcha)
             headers = {
-                'referer': f'https://{host}/member.php?mod=logging&action=login',
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/137.0.0.0 Safari/537.36 Edg/137.0.0.0',
+                'referer': self.profile.url(host, 'login_page'),
+                'User-Agent': USER_AGENT,
                 'Host': host
             }
-            response = session.get(url, headers=headers)
-            response.raise_for_status()
-
-            pattern = r'<!\[CDATA\[(.*?)\]\]>'
-            match = re.search(pattern, response.text)
+            text = await self.fetch_text(session, "GET", url, headers=headers)
+            match = CDATA_PATTERN.search(text)
             if match:
-                text = match.group(1)
-                if "succeed" in text:
-                    return True
-                else:
-                    return False
-            else:
-                logging.warning("[检查验证码]响应格式异常")
-                return False
-        except requests.RequestException as e:
-            logging.error(f"[检查验证码]发生网络错误: {str(e)}\n{traceback.format_exc()}")
+                return self.profile.markers['captcha_ok'] in match.group(1)
+            logging.warning("[检查验证码]响应格式异常")
+            return False
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logging.error(f"[检查验证码]发生网络错误: {str(e)}", exc_info=True)
             return False
         except Exception as e:
-            logging.error(f"[检查验证码]发生未知错误: {str(e)}\n{traceback.format_exc()}")
+            logging.error(f"[检查验证码]发生未知错误: {str(e)}", exc_info=True)
             return False
 
-    def login_in(self, host, username, password, formhash, captcha, session, loginhash, seccodehash):
+    async def login_in(self, host, username, password, formhash, captcha, session, loginhash, seccodehash):
         """
         登录
         :param host: 域名
@@ -259,382 +4683,1019 @@ class AutoTask:
         :return: 是否成功
         """
         try:
-            url = f"https://{host}/member.php?mod=logging&action=login&loginsubmit=yes&loginhash={loginhash}&inajax=1"
-            payload = f"formhash={formhash}&referer=https://{host}/home.php?mod=spacecp&ac=credit&showcredit=1&loginfield=email&username={username}&password={password}&questionid=0&answer=&seccodehash={seccodehash}&seccodemodid=member::logging&seccodeverify={captcha}&cookietime=2592000"
+            url = self.profile.url(host, 'login_submit', loginhash=loginhash)
+            referer = self.profile.url(host, 'credit')
+            payload = self.profile.login_form(username, password, formhash, captcha, seccodehash, referer)
             headers = {
-                'Referer': f'https://{host}/home.php?mod=spacecp&ac=credit&showcredit=1',
+                'Referer': referer,
                 'content-type': 'application/x-www-form-urlencoded',
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/137.0.0.0 Safari/537.36 Edg/137.0.0.0',
+                'User-Agent': USER_AGENT,
                 'Host': host
             }
-            # payload转为url编码，/替换为%2F
-            payload = urllib.parse.quote(payload, safe='=&')
-            response = session.post(url, headers=headers, data=payload)
-            response.raise_for_status()
-            pattern = r'<!\[CDATA\[(.*?)\]\]>'
-            match = re.search(pattern, response.text)
-            if match:
-                text = match.group(1)
-                if "欢迎您回来" in text:
-                    # 匹配
-                    username_pattern = r'欢迎您回来，(.*?)，现在将转入登录前页面'
-                    username_match = re.search(username_pattern, text)
-                    if username_match:
-                        matched_username = username_match.group(1)
-                        logging.info(f"[登录]成功，当前账号: {matched_username}")
-                        return True
-                else:
-                    logging.warning("[登录]登录失败")
-                    return False
-            else:
+            text = await self.fetch_text(session, "POST", url, headers=headers, data=payload)
+            match = CDATA_PATTERN.search(text)
+            if not match:
                 logging.warning("[登录]响应格式异常")
                 return False
-        except requests.RequestException as e:
-            logging.error(f"[登录]发生网络错误: {str(e)}\n{traceback.format_exc()}")
+            username_match = self.profile.patterns['username'].search(match.group(1))
+            if self.profile.markers['login_ok'] in match.group(1) and username_match:
+                logging.info(f"[登录]成功，当前账号: {username_match.group(1)}")
+                return True
+            logging.warning("[登录]登录失败")
+            return False
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logging.error(f"[登录]发生网络错误: {str(e)}", exc_info=True)
             return False
         except Exception as e:
-            logging.error(f"[登录]发生未知错误: {str(e)}\n{traceback.format_exc()}")
+            logging.error(f"[登录]发生未知错误: {str(e)}", exc_info=True)
             return False
 
-    def get_sign_hash(self, host, session):
+    async def get_page_tokens(self, session, url, headers, patterns, stop_on=()):
+        """
+        获取页面中的token，同一会话内已扫描过的页面直接使用结果
+        :param session: 会话对象
+        :param url: 地址
+        :param headers: 请求头
+        :param patterns: {名称: 编译后的正则}
+        :param stop_on: 找到其中任意一个名称即结束
+        :return: {名称: 匹配内容}
+        """
+        cached = self.page_cache.get(session, {}).get(url)
+        if cached is not None and set(patterns) <= cached[0]:
+            return {name: value for name, value in cached[1].items() if name in patterns}
+        tokens = await self.fetch(session, "GET", url, read="tokens", patterns=patterns, stop_on=stop_on, headers=headers)
+        self.page_cache.setdefault(session, {})[url] = (set(patterns), tokens)
+        return tokens
+
+    async def get_sign_page(self, host, session):
         """
-        获取签到hash
+        获取签到页信息
         :param host: 域名
         :param session: 会话对象
-        :return: 签到hash
+        :return: {'formhash', 'uid', 'money', 'login_required'}中找到的部分，失败返回None
         """
         try:
-            url = f"https://{host}/plugin.php?id=k_misign:sign"
+            url = self.profile.url(host, 'sign_page')
             headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/137.0.0.0 Safari/537.36 Edg/137.0.0.0',
+                'User-Agent': USER_AGENT,
                 'Host': host
             }
-            response = session.get(url, headers=headers)
-            response.raise_for_status()
-            pattern = r'formhash=([a-zA-Z0-9]{8})'
-            match = re.search(pattern, response.text)
-            if match:
-                formhash = match.group(1)
-                return formhash
-            else:
+            page = await self.get_page_tokens(session, url, headers, self.profile.sign_page_patterns, stop_on=('login_required',))
+            if 'formhash' not in page and 'login_required' not in page:
                 logging.warning("[获取签到hash]无法获取签到hash")
-                return None
-        except requests.RequestException as e:
-            logging.error(f"[获取签到hash]发生网络错误: {str(e)}\n{traceback.format_exc()}")
+            return page
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logging.error(f"[获取签到hash]发生网络错误: {str(e)}", exc_info=True)
             return None
 
-    def signin(self, host, session, sign_hash):
+    async def signin(self, host, session, sign_hash):
         """
         签到
         :param host: 域名
         :param session: 会话对象
         :param sign_hash: 签到hash
+        :return: 签到结果文字
         """
         try:
             if not sign_hash:
                 logging.error("sign_hash为空，无法进行签到")
-                return
-
-            url = f"https://{host}/plugin.php?id=k_misign:sign&operation=qiandao&format=global_usernav_extra&formhash={sign_hash}&inajax=1&ajaxtarget=k_misign_topb"
-            payload = {}
+                return None
+            url = self.profile.url(host, 'sign', formhash=sign_hash)
             headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/137.0.0.0 Safari/537.36 Edg/137.0.0.0',
+                'User-Agent': USER_AGENT,
                 'Host': host
             }
-            response = session.get(url, headers=headers)
-            response.raise_for_status()
-            # 使用正则表达式匹配CDATA中的内容
-            pattern = r'<!\[CDATA\[(.*?)\]\]>'
-            match = re.search(pattern, response.text)
+            text = await self.fetch_text(session, "GET", url, headers=headers)
+            match = CDATA_PATTERN.search(text)
             if match:
-                text = match.group(1)
-                logging.info(f"[签到]{text}")
-            else:
-                logging.warning("[签到]响应格式异常")
-        except requests.RequestException as e:
-            logging.error(f"[签到]发生网络错误: {str(e)}\n{traceback.format_exc()}")
+                logging.info(f"[签到]{match.group(1)}")
+                return match.group(1)
+            logging.warning("[签到]响应格式异常")
+            return None
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logging.error(f"[签到]发生网络错误: {str(e)}", exc_info=True)
+            return None
         except Exception as e:
-            logging.error(f"[签到]发生未知错误: {str(e)}\n{traceback.format_exc()}")
+            logging.error(f"[签到]发生未知错误: {str(e)}", exc_info=True)
+            return None
 
-    def get_user_info(self, host, session, print_info=False):
+    async def get_user_info(self, host, session, print_info=False):
         """
         获取用户信息
         :param host: 域名
         :param session: 会话对象
         :param print_info: 是否打印信息
-        :return: uid
+        :return: uid, 金钱
         """
         try:
-            url = f"https://{host}/home.php?mod=spacecp&ac=credit&showcredit=1"
+            url = self.profile.url(host, 'credit')
             headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/137.0.0.0 Safari/537.36 Edg/137.0.0.0',
+                'User-Agent': USER_AGENT,
                 'Host': host
             }
-            response = session.get(url, headers=headers)
-            response.raise_for_status()
-
-            # 使用正则表达式匹配金钱数量
-            money_pattern = r'金钱: </em>(\d+)'
-            match = re.search(money_pattern, response.text)
-            uid_pattern = r'uid=(\d+)'
-            uid_match = re.search(uid_pattern, response.text)
-            if match:
-                money = match.group(1)
-                uid = uid_match.group(1)
+            tokens = await self.get_page_tokens(session, url, headers, self.profile.user_info_patterns)
+            if 'money' in tokens:
                 if print_info:
-                    logging.info(f"您现有金钱 {money}")
-                return uid
+                    logging.info(f"您现有金钱 {tokens['money']}")
+                return tokens['uid'], tokens['money']
             logging.warning("[获取用户信息]无法获取用户金钱信息")
-            return None
-        except requests.RequestException as e:
-            logging.error(f"[获取用户信息]发生网络错误: {str(e)}\n{traceback.format_exc()}")
-            return None
+            return None, None
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logging.error(f"[获取用户信息]发生网络错误: {str(e)}", exc_info=True)
+            return None, None
         except Exception as e:
-            logging.error(f"[获取用户信息]发生未知错误: {str(e)}\n{traceback.format_exc()}")
-            return None
+            logging.error(f"[获取用户信息]发生未知错误: {str(e)}", exc_info=True)
+            return None, None
 
-    def get_promotion_reward(self, host, uid):
+    async def get_promotion_reward(self, host, uid):
         """
         获取推广奖励
         :param host: 域名
         :param uid: uid
         """
         try:
-            url = f"https://{host}/?fromuid={uid}"
+            url = self.profile.url(host, 'promotion', uid=uid)
+            if not url:
+                return
             headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/137.0.0.0 Safari/537.36 Edg/137.0.0.0',
+                'User-Agent': USER_AGENT,
                 'Host': host,
                 'Referer': f'https://{host}/fromuid={uid}'
             }
-            # 不带cookie直接访问
-            response = requests.get(url, headers=headers)
-            response.raise_for_status()
-        except requests.RequestException as e:
-            logging.error(f"[获取推广奖励]发生网络错误: {str(e)}\n{traceback.format_exc()}")
+            # 不带cookie直接访问，匿名会话不保存也不发送cookie
+            await self.fetch_text(self.anon_session, "GET", url, headers=headers)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logging.error(f"[获取推广奖励]发生网络错误: {str(e)}", exc_info=True)
         except Exception as e:
-            logging.error(f"[获取推广奖励]发生未知错误: {str(e)}\n{traceback.format_exc()}")
+            logging.error(f"[获取推广奖励]发生未知错误: {str(e)}", exc_info=True)
 
-    def do_task(self, host, session):
+    async def do_task(self, host, session, result=None, cached=None):
         """
-        执行任务
+        执行任务，请求规划与同步版本一致
         :param host: 域名
         :param session: 会话对象
+        :param result: AccountResult，记录签到结果和金钱
+        :param cached: 已保存的账号会话数据，包含上次的formhash、uid和金钱
+        :return: 状态 success/cookie_expired/error
         """
         try:
-            sign_hash = self.get_sign_hash(host, session)
-            if sign_hash:
-                self.signin(host, session, sign_hash)
-            uid = self.get_user_info(host, session)
-            self.get_promotion_reward(host, uid)
-            self.get_user_info(host, session, print_info=True)
+            page = self.cached_sign_state(cached)
+            if page is not None:
+                with self.timed("signin"):
+                    sign_text = await self.signin(host, session, page['formhash'])
+                state = self.check_cached_sign(sign_text)
+                if state == "cookie_expired":
+                    return state
+                if state == "stale":
+                    page = None
+            if page is None:
+                with self.timed("sign_page"):
+                    page = await self.get_sign_page(host, session)
+                if page is None:
+                    return "error"
+                if 'login_required' in page:
+                    return "cookie_expired"
+                with self.timed("signin"):
+                    sign_text = await self.signin(host, session, page.get('formhash'))
+            self.clear_page_cache(session)
+
+            uid = page.get('uid')
+            money = self.money_after_sign(page.get('money'), sign_text)
+            if uid is None or (money is None and page.get('money_due', True)):
+                with self.timed("user_info"):
+                    uid, money = await self.get_user_info(host, session)
+            with self.timed("promotion"):
+                await self.get_promotion_reward(host, uid)
+            if money is not None:
+                logging.info(f"您现有金钱 {money}")
+            if result is not None:
+                result.message = sign_text or ""
+                result.money = money
+                result.already_signed = bool(sign_text and self.profile.patterns['already_signed'].search(sign_text))
+            if sign_text is not None:
+                self.save_sign_state(result, page.get('formhash'), uid, money)
+            return "success" if sign_text is not None else "error"
         except Exception as e:
-            logging.error(f"[执行任务]发生未知错误: {str(e)}\n{traceback.format_exc()}")
+            logging.error(f"[执行任务]发生未知错误: {str(e)}", exc_info=True)
+            return "error"
+
+    def fork_session(self, session):
+        """
+        复制会话，新会话拥有独立的cookie jar
+        :param session: 会话对象
+        :return: 新会话
+        """
+        fork = self.new_session(self.session_proxies.get(session))
+        for cookie in session.cookie_jar:
+            fork.cookie_jar.update_cookies({cookie.key: cookie})
+        return fork
 
-    def read_cookie_file(self):
+    async def prepare_captcha(self, host, seccodehash, session):
         """
-        读取cookie文件
-        :return: cookie字符串或None
+        在复制的会话中获取验证码图片并识别
+        :param host: 域名
+        :param seccodehash: seccodehash
+        :param session: 会话对象
+        :return: (候选会话, 读法列表, 图片哈希)
         """
+        fork = self.fork_session(session)
         try:
-            if os.path.exists(self.cookie_file):
-                with open(self.cookie_file, 'r', encoding='utf-8') as f:
-                    cookie_data = json.load(f)
-                    if cookie_data.get('accounts'):
-                        logging.info(f"[读取Cookie文件]成功读取{self.cookie_file}")
-                        return cookie_data['accounts']
+            with self.timed("captcha_image"):
+                img = await self.get_captcha_img(host, seccodehash, fork)
+            if not img:
+                return fork, [], None
+            key = OcrCache.key_of(img)
+            with self.timed("ocr"):
+                candidates = await self.get_captcha_candidates(img, key)
+        except BaseException:
+            # 预取被取消时候选会话还没有返回给solve_captcha，在这里关闭
+            await fork.close()
+            raise
+        return fork, candidates, key
+
+    async def verify_captcha(self, host, seccodehash, prepared):
+        """
+        等待候选识别完成并检查验证码
+        :param host: 域名
+        :param seccodehash: seccodehash
+        :param prepared: prepare_captcha的任务
+        :return: (候选会话, 验证码文字, 是否正确)
+        """
+        fork, candidates, key = await prepared
+        text, ok = await self.check_candidates(candidates, key, lambda text: self.check_captcha(host, text, fork, seccodehash))
+        return fork, text, ok
+
+    async def solve_captcha(self, host, seccodehash, session):
+        """
+        流水线识别验证码，逻辑与同步版本一致
+        :param host: 域名
+        :param seccodehash: seccodehash
+        :param session: 会话对象
+        :return: 验证码文字，失败返回None
+        """
+        if not self.ocr_available():
+            logging.error("[验证码]OCR服务熔断中，跳过验证码识别")
             return None
-        except Exception as e:
-            logging.error(f"[读取Cookie文件]发生错误: {str(e)}\n{traceback.format_exc()}")
+        race = CAPTCHA_RACE
+        budget = CAPTCHA_MAX_ROUNDS * race
+        prepare_tasks = []
+        check_tasks = []
+
+        def spawn():
+            task = asyncio.ensure_future(self.prepare_captcha(host, seccodehash, session))
+            prepare_tasks.append(task)
+            return task
+
+        try:
+            prepared = [spawn() for _ in range(race)]
+            budget -= race
+            for round_index in range(1, CAPTCHA_MAX_ROUNDS + 1):
+                round_start = time.monotonic()
+                checks = [asyncio.ensure_future(self.verify_captcha(host, seccodehash, task)) for task in prepared]
+                check_tasks.extend(checks)
+                prepared = []
+                for future in asyncio.as_completed(checks):
+                    fork, text, ok = await future
+                    if ok:
+                        for cookie in fork.cookie_jar:
+                            session.cookie_jar.update_cookies({cookie.key: cookie})
+                        return text
+                    # 本轮第一个候选失败时预取下一轮
+                    if not prepared and budget > 0:
+                        prefetch = min(race, budget)
+                        prepared = [spawn() for _ in range(prefetch)]
+                        budget -= prefetch
+                if not prepared:
+                    break
+                if deadline_exceeded():
+                    logging.warning("[验证码]已超过时限，停止重试")
+                    break
+                if not self.ocr_available():
+                    logging.error("[验证码]OCR服务熔断中，停止重试")
+                    break
+                logging.warning(f"[验证码]验证失败，第{round_index}次重试")
+                account = current_account.get()
+                if account is not None:
+                    account.count_retry("captcha")
+                await asyncio.sleep(clamp_timeout(max(0.0, backoff_delay(round_index, CAPTCHA_RETRY_DELAY, CAPTCHA_RETRY_DELAY_MAX) - (time.monotonic() - round_start))))
+            logging.error("[验证码]验证失败，已达到最大重试次数")
             return None
+        finally:
+            # 取消仍在进行的预取，关闭所有候选会话
+            for task in prepare_tasks + check_tasks:
+                task.cancel()
+            for item in await asyncio.gather(*prepare_tasks, return_exceptions=True):
+                if isinstance(item, tuple):
+                    await item[0].close()
 
-    def write_cookie_file(self, cookies, email=None):
+    async def login(self, host, email, password, session):
         """
-        写入cookie文件
-        :param cookies: cookie字符串
-        :param email: 账号邮箱，用于标识不同账号
+        邮箱密码登录（含验证码识别）
+        :param host: 域名
+        :param email: 邮箱
+        :param password: 密码
+        :param session: 会话对象
+        :return: 失败状态，成功返回None
         """
-        try:
-            # 读取现有cookie文件
-            existing_data = {}
-            if os.path.exists(self.cookie_file):
-                with open(self.cookie_file, 'r', encoding='utf-8') as f:
-                    existing_data = json.load(f)
+        with self.timed("get_param"):
+            formhash, seccodehash, loginhash = await self.get_param(host, session)
+        if not all([formhash, seccodehash, loginhash]):
+            logging.error("获取参数失败，跳过当前账号")
+            return "param_failed"
 
-            # 准备新的cookie数据
-            cookie_data = {
-                'site_name': self.site_name,
-                'host': DEFAULT_HOST,
-                'accounts': existing_data.get('accounts', {}),
-                'update_time': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            }
+        with self.timed("captcha"):
+            login_in_captcha_text = await self.solve_captcha(host, seccodehash, session)
+        if not login_in_captcha_text:
+            return "captcha_failed"
 
-            # 更新或添加账号cookie
-            if email:
-                cookie_data['accounts'][email] = {
-                    'cookies': cookies,
-                    'update_time': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                }
+        with self.timed("login_in"):
+            logged_in = await self.login_in(host, email, password, formhash, login_in_captcha_text, session, loginhash, seccodehash)
+        if not logged_in:
+            logging.error("登录失败，跳过当前账号")
+            return "login_failed"
+        return None
+
+    async def run_cookie_account(self, email, account_data, host):
+        """
+        使用已保存cookie的账号执行任务
+        :param email: 账号标识
+        :param account_data: 已保存的账号会话数据
+        :param host: 域名
+        :return: AccountResult
+        """
+        result = AccountResult(email, "cookie_store")
+        current_account.set(result)
+        async with self.new_session(account_data.get('proxy')) as session:
+            self.set_session_cookies(session, account_data['cookies'])
+            # 签到页（或直接签到的结果）同时用于检查cookie是否有效
+            result.status = await self.do_task(host, session, result, account_data)
+            if result.status == "cookie_expired":
+                logging.warning(f"[Cookie存储]账号 {email} 的Cookie已失效")
+        return result
+
+    async def run_env_account(self, index, host, account):
+        """
+        使用环境变量或账号文件中的账号执行任务
+        :param index: 账号序号
+        :param host: 域名
+        :param account: Account
+        :return: AccountResult
+        """
+        email, password, cookie = account.email, account.password, account.cookie
+        key = account.key
+        result = AccountResult(key, "env")
+        current_account.set(result)
+        logging.info(f"------【账号{index}】开始执行任务------")
+        async with self.new_session(account.proxy) as session:
+            if cookie:
+                logging.info(f"[检查环境变量]检测到cookie，将直接使用并保存")
+                self.set_session_cookies(session, cookie)
+                self.save_cookies(cookie, key, account.host, proxy=account.proxy)
             else:
-                # 如果没有提供email，使用默认键
-                cookie_data['accounts']['default'] = {
-                    'cookies': cookies,
-                    'update_time': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                }
+                logging.info(f"[检查环境变量]检测到邮箱密码，将进行登录")
+                status = await self.login(host, email, password, session)
+                if status:
+                    result.status = status
+                    return result
+                cookies = self.get_session_cookies(session)
+                if cookies:
+                    self.save_cookies(cookies, email, account.host, self.session_lifetime(session), account.proxy)
 
-            with open(self.cookie_file, 'w', encoding='utf-8') as f:
-                json.dump(cookie_data, f, ensure_ascii=False, indent=2)
-            logging.info(f"[写入Cookie文件]成功写入{self.cookie_file}")
-        except Exception as e:
-            logging.error(f"[写入Cookie文件]发生错误: {str(e)}\n{traceback.format_exc()}")
+            # 签到页同时用于检查cookie是否有效
+            result.status = await self.do_task(host, session, result)
+            if result.status == "cookie_expired":
+                logging.warning(f"[Cookie]账号 {key} 的Cookie已失效")
+        logging.info(f"------【账号{index}】执行任务完成------")
+        return result
 
-    def get_session_cookies(self, session):
+    async def run_accounts(self, func, jobs, source, count=None):
         """
-        获取session的cookies字符串
-        :param session: 会话对象
-        :return: cookie字符串
+        在事件循环中并发执行账号任务，固定数量的协程依次从jobs中取任务，限制同时执行的账号数
+        :param func: 单个账号的协程函数，返回AccountResult
+        :param jobs: 参数元组的列表或生成器
+        :param source: 账号来源（cookie_store/env/refresh），任务出错时用于生成执行结果
+        :param count: 任务数，jobs为生成器时用于分散开始时间
+        :return: AccountResult列表，与jobs顺序一致
+        """
+        start_at = time.monotonic()
+        offsets = spread_offsets(len(jobs) if count is None and isinstance(jobs, list) else count, START_WINDOW)
+        pending = enumerate(zip(jobs, offsets))
+        results = {}
+
+        async def worker():
+            # 各协程共用一个迭代器，事件循环中取任务不需要加锁
+            for i, (args, offset) in pending:
+                # 每个账号在独立的任务中执行，上下文（当前账号、截止时间）互不影响
+                results[i] = await asyncio.ensure_future(run_one(args, offset))
+
+        async def run_one(args, offset):
+            delay = self.start_delay(start_at + offset)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            start = time.monotonic()
+            # 每个任务有独立的上下文，截止时间和日志缓存只影响当前账号
+            deadline = self.account_deadline()
+            current_deadline.set(deadline)
+            buffer = self.account_log_buffer()
+            current_log_buffer.set(buffer)
+            try:
+                if deadline_exceeded():
+                    raise DeadlineExceeded("已超过运行时限，未执行")
+                # 请求超时已按截止时间缩短，账号协程通常会自行结束；超过截止时间1秒仍未结束则取消
+                result = await asyncio.wait_for(func(*args), None if deadline is None else deadline - time.monotonic() + 1)
+                if result.status not in ("success", "cookie_expired") and deadline_exceeded():
+                    result.status = "timeout"
+            except asyncio.TimeoutError as e:
+                logging.warning(f"[账号任务]{str(e) or '已超过账号时限'}")
+                result = self.job_result(args, source)
+                result.status = "timeout"
+                result.message = str(e) or "已超过账号时限"
+            except Exception as e:
+                logging.error(f"[账号任务]发生未知错误: {str(e)}", exc_info=True)
+                result = self.job_result(args, source)
+                result.status = "error"
+                result.message = str(e)
+            finally:
+                self.flush_account_log(buffer)
+            result.elapsed = time.monotonic() - start
+            self.metrics.observe("account", result.elapsed)
+            self.record_sign(result)
+            return result
+
+        await asyncio.gather(*(worker() for _ in range(self.max_workers)))
+        return [results[i] for i in range(len(results))]
+
+    async def run_async(self):
         """
+        执行签到任务的主协程
+        :return: AccountResult列表
+        """
+        results = []
+        self.metrics = RunMetrics()
+        self.account_sources = []
+        self.run_deadline = time.monotonic() + RUN_TIMEOUT if RUN_TIMEOUT > 0 else None
+        current_deadline.set(self.run_deadline)
+        if not self.transport_kept:
+            self.open_transport()
+        self.start_profile()
         try:
-            cookies = []
-            for cookie in session.cookies:
-                cookies.append(f"{cookie.name}={cookie.value}")
-            return '; '.join(cookies)
+            logging.info(f"【{self.site_name}】开始执行签到任务（异步模式），并发数{self.max_workers}{self.shard_label}")
+            self.load_signed()
+            # 已保存的账号与环境变量中的账号使用同一个镜像，所有账号都已签到时不需要获取
+            host = None
+            finished = set()
+            accounts = self.read_cookies()
+            if accounts:
+                logging.info("[Cookie存储]检测到已保存的cookie，将尝试使用")
+                pending = [(email, data) for email, data in accounts if self.in_shard(email) and not self.skip_signed(email)]
+                results.extend(self.take_skipped())
+                file_results = []
+                if pending:
+                    # 账号指定了host时使用指定的，都指定了时不需要获取镜像
+                    if not all(data.get('host') for _, data in pending):
+                        with self.timed("get_host"):
+                            host = await self.get_host()
+                    file_results = await self.run_accounts(self.run_cookie_account,
+                                                        [(email, data, data.get('host') or host) for email, data in pending],
+                                                        "cookie_store")
+                results.extend(file_results)
+                finished = {r.account for r in file_results if r.status != "cookie_expired"}
+                expired = [r.account for r in file_results if r.status == "cookie_expired"]
+                if expired:
+                    logging.info(f"[Cookie存储]{len(expired)}个账号的Cookie已失效，尝试使用环境变量中的账号")
+                    self.invalidate_cookies(expired)
+
+            self.load_account_sources()
+            accounts = self.env_accounts(finished)
+            first = next(accounts, None)
+            if first is not None:
+                if host is None:
+                    with self.timed("get_host"):
+                        host = await self.get_host()
+                jobs = self.env_jobs(itertools.chain([first], accounts), host)
+                results.extend(await self.run_accounts(self.run_env_account, jobs, "env", self.pending_accounts(finished)))
+            results.extend(self.take_skipped())
+            self.log_summary(results)
         except Exception as e:
-            logging.error(f"[获取Session Cookies]发生错误: {str(e)}\n{traceback.format_exc()}")
-            return None
+            logging.error(f"【{self.site_name}】执行过程中发生错误: {str(e)}", exc_info=True)
+        finally:
+            if not self.transport_kept:
+                await self.close_transport()
+            self.save_ocr_cache()
+            self.export_metrics(results)
+            self.stop_profile()
+        return results
+
+    def open_transport(self):
+        """
+        创建本次运行共用的请求调度器、连接器和匿名会话，必须在事件循环中调用
+        """
+        # 并发名额使用asyncio信号量，需要在事件循环中创建
+        self.scheduler = RequestScheduler(parse_limits(RATE_LIMIT), parse_limits(INFLIGHT_LIMIT), asynchronous=True)
+        # 所有会话共用一个连接器，按主机限制连接数
+        pool_size = self.max_workers * CAPTCHA_RACE * 2
+        self.connector = aiohttp.TCPConnector(limit=max(pool_size * 2, 10), limit_per_host=max(pool_size, 2))
+        self.anon_session = aiohttp.ClientSession(
+            connector=self.connector,
+            connector_owner=False,
+            cookie_jar=aiohttp.DummyCookieJar()
+        )
+
+    async def close_transport(self):
+        await self.anon_session.close()
+        await self.connector.close()
+
+    async def keep_transport(self):
+        self.open_transport()
+        self.transport_kept = True
+
+    def share_transport(self, task):
+        """
+        多个站点同时运行时使用另一个站点的请求调度器、连接器和匿名会话，由该站点负责关闭
+        :param task: 已打开连接器的AsyncAutoTask
+        """
+        self.scheduler = task.scheduler
+        self.connector = task.connector
+        self.anon_session = task.anon_session
+        self.loop = task.loop
+        self.transport_kept = True
+
+    def release_transport(self):
+        """
+        不再使用share_transport共用的连接器
+        """
+        self.connector = None
+        self.anon_session = None
+        self.loop = None
+        self.transport_kept = False
+
+    def open_resident(self):
+        """
+        常驻模式开始前调用：创建一直使用的事件循环和连接器，之后每次运行都在这个事件循环中执行
+        """
+        self.loop = asyncio.new_event_loop()
+        self.loop.run_until_complete(self.keep_transport())
+
+    def close_resident(self):
+        """
+        常驻模式退出时调用，关闭连接器、事件循环、预处理进程池和Cookie存储
+        """
+        self.transport_kept = False
+        self.loop.run_until_complete(self.close_transport())
+        self.loop.close()
+        self.loop = None
+        if self.preprocessor is not None:
+            self.preprocessor.close()
+        self.store.close()
+
+    def run_coroutine(self, coroutine):
+        """
+        常驻模式在保留的事件循环中执行，否则新建事件循环
+        :param coroutine: 协程
+        :return: 协程的返回值
+        """
+        if self.loop is not None:
+            return self.loop.run_until_complete(coroutine)
+        return asyncio.run(coroutine)
+
+    def run(self):
+        """
+        执行签到任务的主函数
+        :return: AccountResult列表
+        """
+        return self.run_coroutine(self.run_async())
 
-    def check_cookie_valid(self, host, session):
+    async def refresh_account(self, index, host, account):
         """
-        检查cookie是否有效
+        重新登录并保存新的会话，不签到
+        :param index: 账号序号
         :param host: 域名
-        :param session: 会话对象
-        :return: 是否有效
+        :param account: Account
+        :return: AccountResult
         """
-        try:
-            url = f"https://{host}/home.php?mod=space"
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/137.0.0.0 Safari/537.36 Edg/137.0.0.0',
-                'Host': host
-            }
-            response = session.get(url, headers=headers)
-            response.raise_for_status()
+        result = AccountResult(account.key, "refresh")
+        current_account.set(result)
+        logging.info(f"------【账号{index}】开始刷新会话------")
+        async with self.new_session(account.proxy) as session:
+            status = await self.login(host, account.email, account.password, session)
+            if status:
+                result.status = status
+                return result
+            cookies = self.get_session_cookies(session)
+            if not cookies:
+                result.status = "error"
+                return result
+            self.save_cookies(cookies, account.email, account.host, self.session_lifetime(session), account.proxy)
+        result.status = "success"
+        logging.info(f"------【账号{index}】刷新会话完成------")
+        return result
 
-            if "请先登录" in response.text:
-                return False
-            return True
+    async def refresh_async(self):
+        """
+        提前重新登录会话已失效或即将过期的账号的主协程
+        :return: AccountResult列表
+        """
+        results = []
+        self.metrics = RunMetrics()
+        self.account_sources = []
+        self.run_deadline = time.monotonic() + RUN_TIMEOUT if RUN_TIMEOUT > 0 else None
+        current_deadline.set(self.run_deadline)
+        if not self.transport_kept:
+            self.open_transport()
+        try:
+            logging.info(f"【{self.site_name}】开始刷新即将过期的会话（异步模式），并发数{self.max_workers}{self.shard_label}")
+            due = self.load_due()
+            if due:
+                self.load_account_sources()
+                accounts = self.refresh_accounts(due)
+                first = next(accounts, None)
+                if first is not None:
+                    with self.timed("get_host"):
+                        host = await self.get_host()
+                    jobs = self.env_jobs(itertools.chain([first], accounts), host)
+                    results.extend(await self.run_accounts(self.refresh_account, jobs, "refresh"))
+                self.log_unrefreshed(due, results)
+            self.log_summary(results)
         except Exception as e:
-            logging.error(f"[Cookie检测]发生错误: {str(e)}\n{traceback.format_exc()}")
-            return False
+            logging.error(f"【{self.site_name}】刷新过程中发生错误: {str(e)}", exc_info=True)
+        finally:
+            if not self.transport_kept:
+                await self.close_transport()
+            self.save_ocr_cache()
+        return results
+
+    def refresh(self):
+        """
+        提前重新登录会话已失效或即将过期的账号
+        :return: AccountResult列表
+        """
+        return self.run_coroutine(self.refresh_async())
+
+
+class SiteGroup:
+    """
+    在一次运行中同时签到多个Discuz站点
+    第一个站点的任务创建连接池、OCR后端、请求调度器、熔断器和Cookie存储，其他站点共用；
+    与AutoTask一样提供run/refresh/summary和常驻模式的open_resident/close_resident，可以直接交给Daemon
+    """
+    def __init__(self, profiles, max_workers=None, asynchronous=False):
+        """
+        :param profiles: SiteProfile列表
+        :param max_workers: 每个站点的并发账号数
+        :param asynchronous: 是否使用异步模式，所有站点在同一个事件循环中执行
+        """
+        cls = AsyncAutoTask if asynchronous else AutoTask
+        self.asynchronous = asynchronous
+        self.tasks = []
+        for profile in profiles:
+            task = cls(profile.name, max_workers, profile=profile, shared=self.tasks[0] if self.tasks else None)
+            task.metrics_site = task.parallel_sites = len(profiles) > 1
+            self.tasks.append(task)
+        self.site_name = "、".join(task.site_name for task in self.tasks)
+        self.site_results = {} # 站点 -> 最近一次运行的AccountResult列表
+
+    @property
+    def max_workers(self):
+        return self.tasks[0].max_workers
+
+    @max_workers.setter
+    def max_workers(self, value):
+        for task in self.tasks:
+            task.max_workers = value
 
     def run(self):
         """
-        执行签到任务的主函数
+        所有站点同时签到
+        :return: 所有站点的AccountResult列表
+        """
+        return self.run_sites("run")
+
+    def refresh(self):
+        """
+        所有站点同时刷新即将过期的会话
+        :return: 所有站点的AccountResult列表
+        """
+        return self.run_sites("refresh")
+
+    def run_sites(self, mode):
+        """
+        :param mode: run/refresh
+        :return: 所有站点的AccountResult列表
+        """
+        if self.asynchronous:
+            per_site = self.tasks[0].run_coroutine(self.run_sites_async(mode))
+        else:
+            # 每个站点一个线程，站点内的账号仍按SXSY_WORKERS并发
+            with ThreadPoolExecutor(max_workers=len(self.tasks), thread_name_prefix="site") as executor:
+                per_site = list(executor.map(lambda task: getattr(task, mode)(), self.tasks))
+        self.site_results = {task.site_name: results for task, results in zip(self.tasks, per_site)}
+        return [result for results in per_site for result in results]
+
+    async def run_sites_async(self, mode):
         """
+        在同一个事件循环中执行所有站点，第一个站点的连接器所有站点共用
+        :param mode: run/refresh
+        :return: 每个站点的AccountResult列表
+        """
+        primary = self.tasks[0]
+        kept = primary.transport_kept
+        if not kept:
+            await primary.keep_transport()
+        for task in self.tasks[1:]:
+            task.share_transport(primary)
         try:
-            logging.info(f"【{self.site_name}】开始执行签到任务")
+            return await asyncio.gather(*(getattr(task, f"{mode}_async")() for task in self.tasks))
+        finally:
+            if not kept:
+                for task in self.tasks[1:]:
+                    task.release_transport()
+                primary.transport_kept = False
+                await primary.close_transport()
 
-            # 首先尝试读取cookie文件
-            accounts = self.read_cookie_file()
-            if accounts:
-                logging.info("[Cookie文件]检测到cookie文件，将尝试使用")
-                for email, account_data in accounts.items():
-                    session = requests.Session()
-                    for cookie_item in account_data['cookies'].split(';'):
-                        key, value = cookie_item.split('=', 1)
-                        session.cookies.set(key.strip(), value.strip())
-
-                    # 检查cookie是否有效
-                    if self.check_cookie_valid(DEFAULT_HOST, session):
-                        logging.info("")
-                        logging.info(f"[Cookie检测]账号 {email} 的Cookie有效")
-                        # 执行签到任务
-                        self.do_task(DEFAULT_HOST, session)
-                        logging.info("")
-                        # 如果是最后一个账号，执行return
-                        if email == list(accounts.keys())[-1]:
-                            return
-                    else:
-                        logging.warning(f"[Cookie文件]账号 {email} 的Cookie已失效")
-
-                logging.info("[Cookie文件]所有账号的Cookie都已失效，尝试使用邮箱密码登录")
-                # 检查环境变量中是否有邮箱密码
-                env = os.getenv("sxsy")
-                if not env or '&' not in env:
-                    logging.error("[Cookie文件]所有Cookie已失效且环境变量中未找到邮箱密码，无法继续")
-                    return
-                # 删除失效的cookie文件
-                try:
-                    os.remove(self.cookie_file)
-                    logging.info(f"[Cookie文件]已删除失效的cookie文件: {self.cookie_file}")
-                except Exception as e:
-                    logging.error(f"[Cookie文件]删除失效cookie文件失败: {str(e)}")
-
-            host = self.get_host()
-            for index, (email, password, cookie) in enumerate(self.check_env(), 1):
-                logging.info("")
-                logging.info(f"------【账号{index}】开始执行任务------")
-
-                # 创建会话
-                session = requests.Session()
-
-                if cookie:
-                    # 直接使用cookie
-                    logging.info(f"[检查环境变量]检测到cookie，将直接使用并保存到文件")
-                    for cookie_item in cookie.split(';'):
-                        key, value = cookie_item.split('=', 1)
-                        session.cookies.set(key.strip(), value.strip())
-                    self.write_cookie_file(cookie, email)
-
-                    # 检查cookie是否有效
-                    if self.check_cookie_valid(host, session):
-                        logging.info(f"[Cookie]账号 {email} 的Cookie有效")
-                        # 执行签到任务
-                        self.do_task(host, session)
-                        return
-                    else:
-                        logging.warning(f"[Cookie]账号 {email} 的Cookie已失效")
-                        continue
-                else:
-                    logging.info(f"[检查环境变量]检测到邮箱密码，将进行登录")
-                    # 获取参数
-                    formhash, seccodehash, loginhash = self.get_param(host, session)
-                    if not all([formhash, seccodehash, loginhash]):
-                        logging.error("获取参数失败，跳过当前账号")
-                        continue
+    def summary(self, results):
+        """
+        汇总所有站点的指标，按站点分别汇总后合并
+        :param results: run()返回的AccountResult列表
+        :return: 格式与RunMetrics.summary()一致，另有各站点的执行结果
+        """
+        ids = {id(result) for result in results}
+        summaries = [task.summary([result for result in self.site_results.get(task.site_name, []) if id(result) in ids])
+                     for task in self.tasks]
+        merged = RunMetrics.merge(summaries)
+        merged.pop('shards')
+        merged['site'] = self.site_name
+        merged['sites'] = {summary['site']: summary['outcomes'] for summary in summaries}
+        return merged
 
-                    # 验证码重试逻辑
-                    max_retries = 3
-                    retry_count = 0
-                    while retry_count < max_retries:
-                        login_in_captcha = self.get_captcha_img(host, seccodehash, session)
-                        login_in_captcha_text = self.get_captcha_text(login_in_captcha)
-                        if self.check_captcha(host, login_in_captcha_text, session, seccodehash):
-                            break
-
-                        retry_count += 1
-                        if retry_count < max_retries:
-                            logging.warning(f"[验证码]验证失败，第{retry_count}次重试")
-                            time.sleep(5)
-                        else:
-                            logging.error("[验证码]验证失败，已达到最大重试次数")
-                            continue
+    def open_resident(self):
+        self.tasks[0].open_resident()
+        if self.asynchronous:
+            for task in self.tasks[1:]:
+                task.share_transport(self.tasks[0])
 
-                    if not self.login_in(host, email, password, formhash, login_in_captcha_text, session, loginhash, seccodehash):
-                        logging.error("登录失败，跳过当前账号")
-                        continue
+    def close_resident(self):
+        """
+        连接池和Cookie存储由第一个站点创建，只需关闭一次
+        """
+        if self.asynchronous:
+            for task in self.tasks[1:]:
+                task.release_transport()
+        self.tasks[0].close_resident()
+
+
+class StatusHandler(BaseHTTPRequestHandler):
+    """
+    常驻模式的状态接口
+    /status   运行状态、下次执行时间和最近一次执行的汇总
+    /results  最近一次签到各账号的结果
+    /metrics  最近一次签到的Prometheus文本格式指标
+    """
+    def log_message(self, format, *args):
+        pass
+
+    def send(self, body, content_type="application/json; charset=utf-8", status=200):
+        body = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
 
-                    # 登录成功后保存cookie到文件
-                    cookies = self.get_session_cookies(session)
-                    if cookies:
-                        self.write_cookie_file(cookies, email)
+    def do_GET(self):
+        daemon = self.server.daemon
+        path = urllib.parse.urlsplit(self.path).path
+        if path in ("/", "/status"):
+            return self.send(json.dumps(daemon.status(), ensure_ascii=False, indent=2))
+        if path == "/results":
+            return self.send(json.dumps(daemon.last_results(), ensure_ascii=False, indent=2))
+        if path == "/metrics":
+            summary = daemon.last_summary("sign")
+            if summary is None:
+                return self.send("还没有执行过签到\n", "text/plain; charset=utf-8", 404)
+            return self.send(RunMetrics.to_prometheus(summary), "text/plain; version=0.0.4; charset=utf-8")
+        self.send(json.dumps({'error': "not found"}), status=404)
 
-                    # 登录成功后执行签到任务
-                    self.do_task(host, session)
 
-                logging.info(f"------【账号{index}】执行任务完成------")
-                logging.info("")
+class Daemon:
+    """
+    常驻模式：按cron表达式定时执行签到和刷新
+    两次执行之间保留镜像列表、Cookie存储、连接池、熔断状态和OCR后端，不需要每次重新启动
+    """
+    MODES = {'sign': "签到", 'refresh': "刷新"}
+
+    def __init__(self, task, schedules, refresh_schedules=(), status_port=0):
+        """
+        :param task: AutoTask、AsyncAutoTask或SiteGroup
+        :param schedules: 签到的cron表达式列表
+        :param refresh_schedules: 刷新的cron表达式列表
+        :param status_port: 状态接口端口，0为不开启
+        """
+        self.task = task
+        self.jobs = [(CronSchedule(expression), "sign") for expression in schedules]
+        self.jobs += [(CronSchedule(expression), "refresh") for expression in refresh_schedules]
+        if not self.jobs:
+            raise ValueError("没有配置执行时间")
+        self.status_port = status_port
+        self.stop_event = threading.Event()
+        self.lock = threading.Lock() # 状态接口在其他线程中读取
+        self.started_at = time.time()
+        self.running = None # {'mode', 'started_at'}
+        self.next_run = None # {'mode', 'at'}
+        self.last_runs = {} # 模式 -> 最近一次执行的汇总
+        self.results = [] # 最近一次签到各账号的结果
+        self.server = None
+
+    def next_job(self):
+        """
+        :return: (下次执行时间, 模式)
+        """
+        now = datetime.now()
+        return min(((schedule.next_after(now), mode) for schedule, mode in self.jobs), key=lambda item: item[0])
+
+    def run_job(self, mode):
+        """
+        执行一次签到或刷新，记录结果
+        :param mode: sign/refresh
+        """
+        started_at = time.time()
+        with self.lock:
+            self.running = {'mode': mode, 'started_at': datetime.fromtimestamp(started_at).isoformat(timespec='seconds')}
+        workers = self.task.max_workers
+        results = []
+        try:
+            if mode == "refresh":
+                self.task.max_workers = REFRESH_WORKERS
+                results = self.task.refresh()
+            else:
+                results = self.task.run()
         except Exception as e:
-            logging.error(f"【{self.site_name}】执行过程中发生错误: {str(e)}\n{traceback.format_exc()}")
+            logging.error(f"[常驻]{self.MODES[mode]}发生错误: {str(e)}", exc_info=True)
+        finally:
+            self.task.max_workers = workers
+        summary = self.task.summary(results)
+        summary['started_at'] = datetime.fromtimestamp(started_at).isoformat(timespec='seconds')
+        summary['elapsed'] = round(time.time() - started_at, 3)
+        with self.lock:
+            self.running = None
+            self.last_runs[mode] = summary
+            if mode == "sign":
+                self.results = [result.to_dict() for result in results]
+
+    def status(self):
+        """
+        :return: 状态字典
+        """
+        with self.lock:
+            return {
+                'site': self.task.site_name,
+                'pid': os.getpid(),
+                'uptime': round(time.time() - self.started_at),
+                'state': "running" if self.running else "idle",
+                'running': self.running,
+                'next_run': self.next_run,
+                'schedules': [{'mode': mode, 'cron': schedule.expression} for schedule, mode in self.jobs],
+                'last_runs': dict(self.last_runs),
+            }
+
+    def last_results(self):
+        with self.lock:
+            return list(self.results)
+
+    def last_summary(self, mode):
+        with self.lock:
+            return self.last_runs.get(mode)
+
+    def start_status_server(self):
+        """
+        在后台线程中提供状态接口，只监听本机
+        """
+        if not self.status_port:
+            return
+        self.server = ThreadingHTTPServer(("127.0.0.1", self.status_port), StatusHandler)
+        self.server.daemon_threads = True
+        self.server.daemon = self
+        threading.Thread(target=self.server.serve_forever, name="sxsy-status", daemon=True).start()
+        logging.info(f"[常驻]状态接口: http://127.0.0.1:{self.server.server_port}/status")
+
+    def serve(self):
+        """
+        按计划循环执行，直到stop()或收到SIGTERM/SIGINT
+        """
+        self.start_status_server()
+        self.task.open_resident()
+        try:
+            while not self.stop_event.is_set():
+                at, mode = self.next_job()
+                with self.lock:
+                    self.next_run = {'mode': mode, 'at': at.isoformat()}
+                logging.info(f"[常驻]下次{self.MODES[mode]}: {at:%Y-%m-%d %H:%M}")
+                # 分段等待，系统时间调整后也能按时执行
+                while not self.stop_event.is_set() and datetime.now() < at:
+                    self.stop_event.wait(min(60.0, (at - datetime.now()).total_seconds()))
+                if self.stop_event.is_set():
+                    break
+                self.run_job(mode)
+        finally:
+            if self.server is not None:
+                self.server.shutdown()
+                self.server.server_close()
+            self.task.close_resident()
+            logging.info("[常驻]已退出")
+
+    def stop(self, *args):
+        """
+        停止常驻运行，正在执行的签到会先完成；可以作为信号处理函数
+        """
+        self.stop_event.set()
+
+def merge_shards(argv, site_name="尚香书苑"):
+    """
+    合并分片运行的结果：cookie数据库合并到主数据库，指标文件合并为一份
+    用法: python 尚香书苑.py merge [--store 主数据库] [--metrics-out 指标文件] 分片文件...
+    分片文件中.db为cookie数据库，.json为指标（SXSY_METRICS_FILE输出的json）
+    :param argv: 命令行参数
+    :param site_name: 站点名称
+    """
+    parser = argparse.ArgumentParser(prog="尚香书苑.py merge", description="合并分片运行的cookie和指标")
+    parser.add_argument("--store", default=f"{site_name}_cookie.db", help="合并到的cookie数据库")
+    parser.add_argument("--metrics-out", default=METRICS_FILE.replace("{shard}", "all") or "metrics.json", help="合并后的指标文件，.prom为Prometheus文本格式")
+    parser.add_argument("files", nargs="+", help="分片的cookie数据库（.db）和指标文件（.json）")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s\t- %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+
+    stores = [path for path in args.files if path.endswith(".db")]
+    metrics_files = [path for path in args.files if path.endswith(".json")]
+    if stores:
+        store = CookieStore(args.store, site_name)
+        try:
+            for path in stores:
+                if os.path.abspath(path) == os.path.abspath(args.store):
+                    continue
+                logging.info(f"[合并]{path}: 更新{store.merge_from(path)}个账号")
+            logging.info(f"[合并]{args.store}现有{store.count()}个有效账号")
+        finally:
+            store.close()
+    if metrics_files:
+        summaries = []
+        for path in metrics_files:
+            with open(path, 'r', encoding='utf-8') as f:
+                summaries.append(json.load(f))
+        merged = RunMetrics.merge(summaries)
+        write_metrics(args.metrics_out, merged)
+        logging.info(f"[合并]{len(summaries)}个分片共{merged['accounts']}个账号，" + "，".join(f"{k}: {v}" for k, v in sorted(merged['outcomes'].items())))
+
+def create_task(site_name="尚香书苑", max_workers=None):
+    """
+    按环境变量创建任务：SXSY_ASYNC为1时使用异步模式，设置了SXSY_SITES_FILE时同时运行其中的站点
+    :param site_name: 站点名称
+    :param max_workers: 并发账号数，默认读取环境变量SXSY_WORKERS
+    :return: AutoTask、AsyncAutoTask或SiteGroup
+    """
+    asynchronous = ASYNC_MODE and aiohttp is not None
+    if SITES_FILE:
+        task = SiteGroup(load_site_profiles(SITES_FILE, site_name), max_workers, asynchronous)
+    elif asynchronous:
+        task = AsyncAutoTask(site_name, max_workers=max_workers)
+    else:
+        task = AutoTask(site_name, max_workers=max_workers)
+    if ASYNC_MODE and not asynchronous:
+        logging.warning("[异步模式]未安装aiohttp，使用同步模式")
+    return task
+
+def run_daemon(argv, site_name="尚香书苑"):
+    """
+    常驻运行，按cron表达式定时签到
+    用法: python 尚香书苑.py daemon [--schedule "10 9,10 * * *"] [--refresh-schedule "30 3 * * *"] [--status-port 8765]
+    :param argv: 命令行参数
+    :param site_name: 站点名称
+    """
+    parser = argparse.ArgumentParser(prog="尚香书苑.py daemon", description="常驻运行，按cron表达式定时签到")
+    parser.add_argument("--schedule", default=SCHEDULE, help="签到的cron表达式（本机时间），多个用;分隔")
+    parser.add_argument("--refresh-schedule", default=REFRESH_SCHEDULE, help="刷新即将过期会话的cron表达式，为空时不刷新")
+    parser.add_argument("--status-port", type=int, default=STATUS_PORT, help="状态接口端口（127.0.0.1），0为不开启")
+    args = parser.parse_args(argv)
+    split = lambda value: [expression.strip() for expression in value.split(';') if expression.strip()]
+    task = create_task(site_name)
+    try:
+        daemon = Daemon(task, split(args.schedule), split(args.refresh_schedule), args.status_port)
+    except ValueError as e:
+        parser.error(str(e))
+    signal.signal(signal.SIGTERM, daemon.stop)
+    signal.signal(signal.SIGINT, daemon.stop)
+    daemon.serve()
 
 if __name__ == "__main__":
-    auto_task = AutoTask("尚香书苑")
-    auto_task.run()
+    if len(sys.argv) > 1 and sys.argv[1] == "merge":
+        merge_shards(sys.argv[2:])
+        sys.exit(0)
+    if len(sys.argv) > 1 and sys.argv[1] == "daemon":
+        run_daemon(sys.argv[2:])
+        sys.exit(0)
+    # refresh: 只重新登录即将过期的账号，不签到
+    refresh_mode = len(sys.argv) > 1 and sys.argv[1] == "refresh"
+    workers = REFRESH_WORKERS if refresh_mode else None
+    auto_task = create_task("尚香书苑", max_workers=workers)
+    if refresh_mode:
+        auto_task.refresh()
+    else:
+        auto_task.run()